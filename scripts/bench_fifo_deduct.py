@@ -0,0 +1,122 @@
+"""Microbenchmark: FIFO deduction over many purchase rows, per-row ORM updates vs one set-based UPDATE.
+
+Needs a PostgreSQL reachable via DATABASE_URL (run inside the bot container:
+python scripts/bench_fifo_deduct.py [iterations]). Creates a throwaway user with 100, 300
+and 1000 open purchases; every deduction is rolled back, so each run sees the same rows.
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BENCH_USER_ID = int(os.environ.get("BENCH_USER_ID", "-424243"))
+BUCKET_SECONDS = 60.0
+
+
+class RoundTrips:
+    """Counts statements sent to the server (an executemany counts once)."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.n = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._bump)
+
+    def _bump(self, *args, **kwargs):
+        self.n += 1
+
+
+async def per_row(session, amount):
+    """The previous implementation: load the buckets, plan in Python, get + UPDATE each row."""
+    from sqlalchemy import select
+
+    from src.services.db_service import Transaction
+    from src.services.purchased_fifo import fifo_allocate
+
+    stmt = (
+        select(Transaction.id, Transaction.seconds_remaining)
+        .where(Transaction.user_id == BENCH_USER_ID, Transaction.status == "success", Transaction.seconds_remaining > 0)
+        .order_by(Transaction.id.asc())
+    )
+    buckets = [(r[0], float(r[1])) for r in (await session.execute(stmt)).all()]
+    for tx_id, take in fifo_allocate(buckets, amount):
+        tx = await session.get(Transaction, tx_id)
+        tx.seconds_remaining = max(0.0, tx.seconds_remaining - take)
+    await session.flush()
+
+
+async def set_based(session, amount):
+    from src.services.db_service import _apply_fifo_deduct
+
+    await _apply_fifo_deduct(session, BENCH_USER_ID, amount)
+
+
+async def seed(buckets):
+    from sqlalchemy import delete
+
+    from src.services.db_service import Transaction, async_session, get_or_create_user
+
+    await get_or_create_user(BENCH_USER_ID, "bench", "Bench")
+    async with async_session() as session:
+        await session.execute(delete(Transaction).where(Transaction.user_id == BENCH_USER_ID))
+        session.add_all(
+            Transaction(
+                user_id=BENCH_USER_ID, provider="manual", amount_rub=0, seconds_added=BUCKET_SECONDS,
+                status="success", seconds_remaining=BUCKET_SECONDS,
+            )
+            for _ in range(buckets)
+        )
+        await session.commit()
+
+
+async def cleanup():
+    from sqlalchemy import delete
+
+    from src.services.db_service import Transaction, User, async_session
+
+    async with async_session() as session:
+        await session.execute(delete(Transaction).where(Transaction.user_id == BENCH_USER_ID))
+        await session.execute(delete(User).where(User.id == BENCH_USER_ID))
+        await session.commit()
+
+
+async def measure(fn, amount, iterations, trips):
+    from src.services.db_service import async_session
+
+    latencies = []
+    before = trips.n
+    for _ in range(iterations):
+        async with async_session() as session:
+            started = time.perf_counter()
+            await fn(session, amount)
+            latencies.append((time.perf_counter() - started) * 1000)
+            await session.rollback()
+    return (trips.n - before) / iterations, statistics.median(latencies)
+
+
+async def main():
+    from src.services.db_service import engine, init_db
+
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    await init_db()
+    trips = RoundTrips(engine)
+    try:
+        for buckets in (100, 300, 1000):
+            await seed(buckets)
+            # Drain all but the last bucket: the worst case for the per-row version
+            amount = (buckets - 0.5) * BUCKET_SECONDS
+            for name, fn in (("per-row", per_row), ("set-based", set_based)):
+                await measure(fn, amount, 2, trips)  # warm up
+                statements, median = await measure(fn, amount, iterations, trips)
+                print(f"{buckets:5d} buckets  {name:10s} statements: {statements:7.1f}   median {median:8.2f} ms")
+    finally:
+        await cleanup()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
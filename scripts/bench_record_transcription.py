@@ -0,0 +1,247 @@
+"""Microbenchmark: billing a finished transcription, old call sequence vs record_transcription.
+
+Needs a PostgreSQL reachable via DATABASE_URL (run inside the bot container:
+python scripts/bench_record_transcription.py [iterations]). Works on a throwaway user with
+two purchases and removes it afterwards. Prints database round trips and latency per message.
+
+The old sequence is the pipeline's billing step as it was before record_transcription, with
+the db_service functions of that version copied below (they have changed since): mark the job
+charged, get_or_create_user, update_user_usage, add_voice_message, link the voice message.
+Each message bills a fresh queued job, created outside the measurement.
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BENCH_USER_ID = int(os.environ.get("BENCH_USER_ID", "-424242"))
+DURATION = 30.0
+
+
+class RoundTrips:
+    """Counts statements, commits and rollbacks sent to the server (an executemany counts once)."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.n = 0
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, "before_cursor_execute", self._bump)
+        event.listen(sync_engine, "commit", self._bump)
+        event.listen(sync_engine, "rollback", self._bump)
+
+    def _bump(self, *args, **kwargs):
+        self.n += 1
+
+
+# --- The billing calls before record_transcription, as they were ---
+async def _old_mark_charged(job_id: int) -> bool:
+    from sqlalchemy import update
+
+    from src.services.db_service import TranscriptionJobRecord, async_session, utc_now
+
+    stmt = (
+        update(TranscriptionJobRecord)
+        .where(TranscriptionJobRecord.id == job_id, TranscriptionJobRecord.charged_at.is_(None))
+        .values(charged_at=utc_now())
+    )
+    async with async_session() as session:
+        result = await session.execute(stmt)
+        await session.commit()
+        return bool(result.rowcount)
+
+
+async def _old_get_or_create_user(user_id: int, username: str, first_name: str):
+    from src.services.db_service import User, async_session, utc_now
+
+    async with async_session() as session:
+        user = await session.get(User, user_id)
+        if not user:
+            user = User(id=user_id, username=username, first_name=first_name)
+            session.add(user)
+        else:
+            user.username = username
+            user.first_name = first_name
+            user.last_activity_at = utc_now()
+        await session.commit()
+        return user
+
+
+async def _old_apply_fifo_deduct(session, user_id: int, amount: float) -> None:
+    from sqlalchemy import select
+
+    from src.services.db_service import Transaction
+    from src.services.purchased_fifo import fifo_allocate
+
+    if amount <= 0:
+        return
+    stmt = (
+        select(Transaction.id, Transaction.seconds_remaining)
+        .where(Transaction.user_id == user_id, Transaction.status == "success", Transaction.seconds_remaining > 0)
+        .order_by(Transaction.id.asc())
+    )
+    rows = (await session.execute(stmt)).all()
+    for tx_id, take in fifo_allocate([(r[0], float(r[1])) for r in rows], amount):
+        tx = await session.get(Transaction, tx_id)
+        if tx:
+            tx.seconds_remaining = max(0.0, tx.seconds_remaining - take)
+
+
+async def _old_update_user_usage(user_id: int, duration: float):
+    from src.services.db_service import User, async_session, utc_now
+    from src.services.purchased_fifo import FREE_SECONDS
+
+    async with async_session() as session:
+        user = await session.get(User, user_id)
+        if user:
+            remaining_free = max(0, FREE_SECONDS - user.used_free_seconds)
+            if remaining_free > 0:
+                if duration <= remaining_free:
+                    user.used_free_seconds += duration
+                else:
+                    user.used_free_seconds = FREE_SECONDS
+                    to_deduct = duration - remaining_free
+                    user.balance_seconds = max(0.0, user.balance_seconds - to_deduct)
+                    await _old_apply_fifo_deduct(session, user_id, to_deduct)
+            else:
+                to_deduct = duration
+                user.balance_seconds = max(0.0, user.balance_seconds - to_deduct)
+                await _old_apply_fifo_deduct(session, user_id, to_deduct)
+            user.last_activity_at = utc_now()
+            await session.commit()
+
+
+async def _old_add_voice_message(user_id: int, duration: float, chars: int, process_time: float, status: str, text: str) -> int:
+    from src.services.db_service import User, VoiceMessage, async_session, utc_now
+
+    async with async_session() as session:
+        msg = VoiceMessage(
+            user_id=user_id, duration_seconds=duration, transcription_length_chars=chars,
+            processing_time_seconds=process_time, status=status, transcription_text=text,
+        )
+        session.add(msg)
+        user = await session.get(User, user_id)
+        if user:
+            user.last_activity_at = utc_now()
+        await session.commit()
+        return msg.id
+
+
+async def _old_link_voice_message(job_id: int, voice_message_id: int) -> None:
+    from sqlalchemy import update
+
+    from src.services.db_service import TranscriptionJobRecord, async_session
+
+    stmt = update(TranscriptionJobRecord).where(TranscriptionJobRecord.id == job_id).values(voice_message_id=voice_message_id)
+    async with async_session() as session:
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def old_sequence(job_id: int):
+    if await _old_mark_charged(job_id):
+        await _old_get_or_create_user(BENCH_USER_ID, "bench", "Bench")
+        await _old_update_user_usage(BENCH_USER_ID, DURATION)
+        voice_message_id = await _old_add_voice_message(BENCH_USER_ID, DURATION, 100, 1.0, "Сжатие", "x" * 100)
+        await _old_link_voice_message(job_id, voice_message_id)
+
+
+async def new_sequence(job_id: int):
+    from src.services import db_service as db
+
+    await db.record_transcription(
+        BENCH_USER_ID, "bench", "Bench", DURATION, 100, 1.0, "Сжатие", "x" * 100, job_id=job_id,
+    )
+
+
+async def new_job() -> int:
+    """A queued, not yet charged job of the bench user."""
+    from src.services.db_service import TranscriptionJobRecord, async_session
+
+    async with async_session() as session:
+        job = TranscriptionJobRecord(user_id=BENCH_USER_ID, chat_id=BENCH_USER_ID, status_message_id=0, file_id="bench")
+        session.add(job)
+        await session.commit()
+        return job.id
+
+
+async def reset():
+    """Free pool used up, plenty of purchased seconds in two purchase rows (the FIFO path runs)."""
+    from sqlalchemy import delete, update
+
+    from src.services.db_service import (
+        Transaction, TranscriptionJobRecord, User, UserStats, VoiceMessage, async_session, get_or_create_user,
+    )
+    from src.services.purchased_fifo import FREE_SECONDS
+
+    await get_or_create_user(BENCH_USER_ID, "bench", "Bench")
+    async with async_session() as session:
+        for model in (TranscriptionJobRecord, VoiceMessage, UserStats, Transaction):
+            await session.execute(delete(model).where(model.user_id == BENCH_USER_ID))
+        await session.execute(
+            update(User).where(User.id == BENCH_USER_ID).values(used_free_seconds=FREE_SECONDS, balance_seconds=1e9)
+        )
+        for _ in range(2):
+            session.add(Transaction(
+                user_id=BENCH_USER_ID, provider="manual", amount_rub=0, seconds_added=5e8,
+                status="success", seconds_remaining=5e8,
+            ))
+        await session.commit()
+
+
+async def cleanup():
+    from sqlalchemy import delete
+
+    from src.services.db_service import (
+        Transaction, TranscriptionJobRecord, User, UserStats, VoiceMessage, async_session,
+    )
+
+    async with async_session() as session:
+        for model in (TranscriptionJobRecord, VoiceMessage, UserStats, Transaction):
+            await session.execute(delete(model).where(model.user_id == BENCH_USER_ID))
+        await session.execute(delete(User).where(User.id == BENCH_USER_ID))
+        await session.commit()
+
+
+async def measure(name, fn, iterations, trips):
+    await fn(await new_job())  # warm up the pool and statement caches
+    latencies = []
+    counted = 0
+    for _ in range(iterations):
+        job_id = await new_job()
+        before = trips.n
+        started = time.perf_counter()
+        await fn(job_id)
+        latencies.append((time.perf_counter() - started) * 1000)
+        counted += trips.n - before
+    per_call = counted / iterations
+    print(
+        f"{name:22s} round trips/msg: {per_call:5.1f}   "
+        f"median {statistics.median(latencies):6.2f} ms   p95 {sorted(latencies)[int(0.95 * (iterations - 1))]:6.2f} ms"
+    )
+    return per_call
+
+
+async def main():
+    from src.services.db_service import engine, init_db
+
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    await init_db()
+    trips = RoundTrips(engine)
+    try:
+        await reset()
+        old = await measure("old (5 calls)", old_sequence, iterations, trips)
+        await reset()
+        new = await measure("record_transcription", new_sequence, iterations, trips)
+        print(f"round trips saved per message: {old - new:.1f} ({old / new:.1f}x fewer)")
+    finally:
+        await cleanup()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
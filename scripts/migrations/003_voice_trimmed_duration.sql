@@ -0,0 +1,6 @@
+-- VAD: длительность аудио после вырезания тишины (то, что реально ушло в Whisper).
+-- duration_seconds остаётся исходной длительностью (по ней списывается баланс).
+ALTER TABLE voice_messages
+  ADD COLUMN IF NOT EXISTS trimmed_duration_seconds DOUBLE PRECISION;
+
+COMMENT ON COLUMN voice_messages.trimmed_duration_seconds IS 'Длительность после VAD (сек); NULL, если тишина не вырезалась.';
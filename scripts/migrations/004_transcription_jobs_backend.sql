@@ -0,0 +1,4 @@
+-- Движок расшифровки для конкретного задания (openai / local); NULL — TRANSCRIPTION_BACKEND из .env.
+-- Нужна, только если таблица transcription_jobs уже была создана без этой колонки.
+ALTER TABLE transcription_jobs
+  ADD COLUMN IF NOT EXISTS backend VARCHAR;
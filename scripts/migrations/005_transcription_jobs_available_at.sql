@@ -0,0 +1,3 @@
+-- Отложенные задания (OpenAI недоступен, circuit breaker открыт): не берутся воркером раньше этого времени.
+ALTER TABLE transcription_jobs
+  ADD COLUMN IF NOT EXISTS available_at TIMESTAMP WITHOUT TIME ZONE;
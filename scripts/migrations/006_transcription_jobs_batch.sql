@@ -0,0 +1,8 @@
+-- Альбомы (несколько файлов одной медиагруппой): общий batch_id, порядок файла и имя для заголовка в общем результате.
+ALTER TABLE transcription_jobs
+  ADD COLUMN IF NOT EXISTS file_name VARCHAR,
+  ADD COLUMN IF NOT EXISTS batch_id VARCHAR,
+  ADD COLUMN IF NOT EXISTS batch_index INTEGER NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS batch_size INTEGER NOT NULL DEFAULT 1;
+
+CREATE INDEX IF NOT EXISTS ix_transcription_jobs_batch_id ON transcription_jobs (batch_id);
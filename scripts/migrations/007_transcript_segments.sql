@@ -0,0 +1,10 @@
+-- Сегменты Whisper с таймкодами (JSON [[start, end, text], ...]): из них по кнопке строятся SRT, VTT и JSON.
+ALTER TABLE voice_messages
+  ADD COLUMN IF NOT EXISTS transcription_segments TEXT;
+
+ALTER TABLE transcription_cache
+  ADD COLUMN IF NOT EXISTS segments TEXT;
+
+ALTER TABLE transcription_jobs
+  ADD COLUMN IF NOT EXISTS result_segments TEXT,
+  ADD COLUMN IF NOT EXISTS voice_message_id INTEGER;
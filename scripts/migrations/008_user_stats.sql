@@ -0,0 +1,12 @@
+-- Сводка по пользователю (user_stats): счётчики сообщений, суммы длительности и символов, сообщения по дням за 30 дней.
+-- Обновляется в той же транзакции, что и вставка в voice_messages; get_user_stats читает одну строку.
+-- После создания таблицы заполните её из истории: python scripts/rebuild_user_stats.py
+CREATE TABLE IF NOT EXISTS user_stats (
+  user_id BIGINT PRIMARY KEY REFERENCES users (id),
+  total_msgs INTEGER NOT NULL DEFAULT 0,
+  total_duration_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+  total_chars BIGINT NOT NULL DEFAULT 0,
+  chars_msgs INTEGER NOT NULL DEFAULT 0,
+  day_counts TEXT,
+  days_anchor DATE
+);
@@ -0,0 +1,16 @@
+-- Индексы для частых запросов: история сообщений пользователя, FIFO-списание с покупок, поиск платежа.
+-- CONCURRENTLY: таблицы не блокируются на запись, поэтому файл выполняется вне транзакции, по одному оператору.
+-- Если построение прервалось, индекс остаётся INVALID: удалите его (DROP INDEX CONCURRENTLY ...) и перезапустите.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_voice_messages_user_created
+  ON voice_messages (user_id, created_at);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_transactions_user_status_id
+  ON transactions (user_id, status, id);
+
+-- Только покупки с остатком секунд: индекс маленький, FIFO читает его без обращения к таблице.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_transactions_fifo
+  ON transactions (user_id, id) INCLUDE (seconds_remaining)
+  WHERE status = 'success' AND seconds_remaining > 0;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_transactions_user_payment
+  ON transactions (user_id, payment_id);
@@ -0,0 +1,20 @@
+-- Резервирование баланса: при приёме файла оценка его длительности блокируется (balance_holds),
+-- при списании резерв гасится, при ошибке снимается. users.held_seconds — сумма активных резервов пользователя.
+ALTER TABLE users
+  ADD COLUMN IF NOT EXISTS held_seconds DOUBLE PRECISION NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS balance_holds (
+  id SERIAL PRIMARY KEY,
+  user_id BIGINT NOT NULL REFERENCES users (id),
+  seconds DOUBLE PRECISION NOT NULL,
+  created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+  expires_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_balance_holds_user_id ON balance_holds (user_id);
+CREATE INDEX IF NOT EXISTS ix_balance_holds_expires_at ON balance_holds (expires_at);
+
+ALTER TABLE transcription_jobs
+  ADD COLUMN IF NOT EXISTS hold_id INTEGER;
+
+CREATE INDEX IF NOT EXISTS ix_transcription_jobs_hold_id ON transcription_jobs (hold_id);
@@ -0,0 +1,32 @@
+-- Кэш пользователей в процессе бота: при изменении баланса или имени (в том числе воркерами)
+-- строка users отправляется в канал user_changed (LISTEN/NOTIFY), бот сбрасывает устаревшую запись.
+-- Тело функции в одинарных кавычках (не $$): так его не разрезает разбор миграций по ";".
+CREATE OR REPLACE FUNCTION notify_user_changed() RETURNS trigger LANGUAGE plpgsql AS '
+BEGIN
+  IF TG_OP = ''DELETE'' THEN
+    PERFORM pg_notify(''user_changed'', json_build_object(''id'', OLD.id)::text);
+    RETURN OLD;
+  END IF;
+  IF NEW.balance_seconds IS DISTINCT FROM OLD.balance_seconds
+     OR NEW.used_free_seconds IS DISTINCT FROM OLD.used_free_seconds
+     OR NEW.held_seconds IS DISTINCT FROM OLD.held_seconds
+     OR NEW.username IS DISTINCT FROM OLD.username
+     OR NEW.first_name IS DISTINCT FROM OLD.first_name THEN
+    PERFORM pg_notify(''user_changed'', json_build_object(
+      ''id'', NEW.id,
+      ''username'', NEW.username,
+      ''first_name'', NEW.first_name,
+      ''balance_seconds'', NEW.balance_seconds,
+      ''used_free_seconds'', NEW.used_free_seconds,
+      ''held_seconds'', NEW.held_seconds
+    )::text);
+  END IF;
+  RETURN NEW;
+END
+';
+
+DROP TRIGGER IF EXISTS users_changed ON users;
+
+CREATE TRIGGER users_changed
+  AFTER UPDATE OR DELETE ON users
+  FOR EACH ROW EXECUTE FUNCTION notify_user_changed();
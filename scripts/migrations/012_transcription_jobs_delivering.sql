@@ -0,0 +1,4 @@
+-- Доставка результата: воркер берёт её на время (delivering_until), delivered_at ставится только после отправки.
+-- Если отправка упала или воркер умер, задание повторяется и доставляет результат снова.
+ALTER TABLE transcription_jobs
+  ADD COLUMN IF NOT EXISTS delivering_until TIMESTAMP WITHOUT TIME ZONE;
@@ -0,0 +1,4 @@
+-- Очередь обслуживает пользователей по кругу: следующим берётся задание пользователя, которого дольше всех не обслуживали.
+-- claimed_at — когда воркер взял задание последний раз.
+ALTER TABLE transcription_jobs
+  ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP WITHOUT TIME ZONE;
@@ -0,0 +1,27 @@
+"""Backfill / repair the user_stats rollup from voice_messages.
+
+Run inside container: python scripts/rebuild_user_stats.py [telegram_user_id]
+Without an id every user is rebuilt.
+"""
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+async def main():
+    from src.services.db_service import engine, init_db, rebuild_user_stats
+
+    user_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    await init_db()
+    started = time.monotonic()
+    n = await rebuild_user_stats(user_id)
+    print(f"user_stats rebuilt for {n} users in {time.monotonic() - started:.1f}s")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,27 +1,40 @@
 import asyncio
 import logging
-import os
 import time
-import math
-import mutagen
 import traceback
-from openai import OpenAIError
+from typing import Optional
 from aiogram import Bot, Dispatcher, F, types
 from aiogram.exceptions import TelegramForbiddenError
 from aiogram.filters import Command, StateFilter
-from aiogram.types import FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, LabeledPrice, PreCheckoutQuery
+from aiogram.types import BufferedInputFile, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, LabeledPrice, PreCheckoutQuery
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from src.config import BOT_TOKEN, YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY, ADMIN_ID
+from src.config import (
+    BOT_TOKEN, YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY, ADMIN_ID, METRICS_PORT, MAX_QUEUED_PER_USER, ALBUM_COLLECT_SECONDS,
+)
 from src.services.db_service import (
-    init_db, get_or_create_user, add_voice_message, get_user_stats,
-    add_review, check_user_limit, update_user_usage,
+    init_db, engine, flush_user_activity, get_or_create_user, get_user_balance, get_user_stats, run_activity_flush,
+    add_review,
     create_transaction, complete_transaction, get_transaction, get_all_user_ids,
     add_balance_seconds,
 )
 from src.services.google_sheets_service import gs_service
+from src.services.http_transport import close_all as close_http_pools, telegram_session, warm_up
+from src.services import balance_holds, metrics
+from src.services.album_batch import AlbumCollector, album_batch_id
+from src.services.audio_probe import codec_hint, min_duration
 from src.services.openai_service import transcribe_audio
+from src.services.purchased_fifo import FREE_SECONDS
 from src.services.stars_invoice import parse_stars_invoice_payload
+from src.services.transcription_backends import backend_for_user
+from src.services.transcription_cache import transcription_cache
+from src.services.user_cache import user_cache
+from src.services.workspace import workspace
+from src.services.transcription_pipeline import (
+    TRANSCRIBE_STATUS_LABELS, TranscriptionJob, download_to_buffer, job_queue, probe_remote_duration,
+    report_critical_error, run_transcription_job, send_limit_exceeded, send_transcript_file, upload_name,
+)
+from src.services.transcript import FORMATS
 from src.services.stars_refund_service import (
     refund_telegram_stars_by_charge_id,
     refund_telegram_stars_by_tx_id,
@@ -32,19 +45,14 @@ from src.services.payment_service import (
     create_yookassa_payment,
     check_yookassa_payment,
 )
-from datetime import datetime, timezone
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
 # Initialize bot and dispatcher
-bot = Bot(token=BOT_TOKEN)
+bot = Bot(token=BOT_TOKEN, session=telegram_session())
 dp = Dispatcher()
 
-# Temp directory
-TEMP_DIR = "data/temp"
-os.makedirs(TEMP_DIR, exist_ok=True)
-
 # --- States ---
 class FeedbackState(StatesGroup):
     waiting_for_negative_custom = State()
@@ -114,22 +122,26 @@ def get_check_payment_kb(payment_id: str, url: str):
         [InlineKeyboardButton(text="🔙 Отмена", callback_data="payment_back_to_tariffs")]
     ])
 
-def get_feedback_kb():
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="✅ Да", callback_data="feedback_yes"),
-            InlineKeyboardButton(text="❌ Нет", callback_data="feedback_no")
-        ]
-    ])
-
-def get_negative_reason_kb():
+def get_negative_reason_kb(extra_rows=()):
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🤷‍♂️ Не уловил суть", callback_data="reason_bad_meaning")],
         [InlineKeyboardButton(text="📝 Плохая грамматика", callback_data="reason_bad_grammar")],
         [InlineKeyboardButton(text="🚫 Не прислал расшифровку", callback_data="reason_no_text")],
-        [InlineKeyboardButton(text="✍️ Свой вариант", callback_data="reason_custom")]
+        [InlineKeyboardButton(text="✍️ Свой вариант", callback_data="reason_custom")],
+        *extra_rows,
     ])
 
+def format_rows(message: types.Message) -> list:
+    """The SRT/VTT/JSON buttons of a result document, kept while its feedback buttons change."""
+    markup = message.reply_markup
+    if markup is None:
+        return []
+    return [row for row in markup.inline_keyboard if any((b.callback_data or "").startswith("fmt_") for b in row)]
+
+def format_kb(message: types.Message):
+    rows = format_rows(message)
+    return InlineKeyboardMarkup(inline_keyboard=rows) if rows else None
+
 def get_cancel_kb():
     return ReplyKeyboardMarkup(
         keyboard=[
@@ -139,35 +151,25 @@ def get_cancel_kb():
     )
 
 # --- Helper for downloading and transcribing ---
-def get_audio_duration(file_path: str) -> float:
-    try:
-        audio = mutagen.File(file_path)
-        if audio is not None and audio.info is not None:
-            return audio.info.length
-    except Exception as e:
-        logging.error(f"Error getting duration: {e}")
-    return 0.0
-
-async def process_voice_file(bot: Bot, file_id: str) -> str:
+async def process_voice_file(bot: Bot, file_id: str, duration: float = 0.0) -> str:
     """Downloads and transcribes a voice file, returns text."""
-    local_filename = None
+    audio = None
+    space = None
     try:
         file = await bot.get_file(file_id)
-        file_path = file.file_path
-        ext = os.path.splitext(file_path)[1]
-        if not ext: ext = ".ogg"
-        
-        local_filename = f"{TEMP_DIR}/{file_id}{ext}"
-        await bot.download_file(file_path, local_filename)
+        space = await workspace.acquire("feedback", file.file_size or 0)
+        audio = await download_to_buffer(bot, file.file_path, space)
         
-        text_result, _ = await transcribe_audio(local_filename)
-        return text_result
+        result = await transcribe_audio(audio, upload_name(file_id, file.file_path), duration)
+        return result.text
     except Exception as e:
         logging.error(f"Transcribe error: {e}")
         raise e
     finally:
-        if local_filename and os.path.exists(local_filename):
-            os.remove(local_filename)
+        if audio is not None:
+            audio.close()
+        if space is not None:
+            await space.release()
 
 # --- Handlers ---
 
@@ -227,10 +229,10 @@ def format_minutes(minutes: float) -> str:
 @dp.message(F.text == "💎 Мой баланс / Купить")
 async def menu_balance(message: types.Message):
     user_id = message.from_user.id
-    stats = await get_user_stats(user_id)
-    
-    balance_min = stats.get("balance_minutes", 0)
-    free_min = stats.get("free_left_minutes", 0)
+    # Two numbers: the cached balance, not the whole stats card
+    user = await get_user_balance(user_id)
+    balance_min = round(user.balance_seconds / 60, 1) if user else 0
+    free_min = round(max(0.0, FREE_SECONDS - user.used_free_seconds) / 60, 1) if user else FREE_SECONDS / 60
     
     balance_str = format_minutes(balance_min)
     free_str = format_minutes(free_min)
@@ -343,7 +345,7 @@ async def pay_yookassa(callback: types.CallbackQuery, state: FSMContext):
     )
     
     # Create YooKassa payment
-    res = create_yookassa_payment(
+    res = await create_yookassa_payment(
         amount=float(amount),
         description=f"Покупка {minutes} минут",
         return_url="https://t.me/Voice2Text_Instant_bot",
@@ -383,7 +385,7 @@ async def check_pay_handler(callback: types.CallbackQuery):
         return
 
     # Check yookassa
-    status = check_yookassa_payment(tx.payment_id)
+    status = await check_yookassa_payment(tx.payment_id)
     
     if status == "succeeded":
         await complete_transaction(tx_id, "success")
@@ -440,7 +442,7 @@ async def successful_payment_handler(message: types.Message, state: FSMContext):
             return
 
         u = message.from_user
-        await get_or_create_user(u.id, u.username or "", u.first_name or "")
+        await get_or_create_user(u.id, u.username, u.first_name)
 
         # total_amount: для валюты XTR — фактически списанное число Stars (Bot API)
         stars_paid = int(payment_info.total_amount)
@@ -577,6 +579,18 @@ async def cmd_admin_refund_stars_charge(message: types.Message, bot: Bot):
     await message.answer(prefix + text)
 
 
+@dp.message(Command("admin_metrics"))
+async def cmd_admin_metrics(message: types.Message):
+    """Снимок метрик процесса бота (только ADMIN_ID)."""
+    if not _is_admin(message.from_user.id):
+        return
+    text = metrics.render()
+    await message.answer_document(
+        BufferedInputFile(text.encode("utf-8"), filename="metrics.txt"),
+        caption="Метрики процесса бота",
+    )
+
+
 @dp.message(Command("admin_add_balance"))
 async def cmd_admin_add_balance(message: types.Message):
     """Ручное начисление купленных секунд (только ADMIN_ID). См. ReadMe/PROD.md."""
@@ -659,7 +673,7 @@ async def process_suggestion_content(message: types.Message, state: FSMContext):
 
         msg_wait = await message.answer("Расшифровываю ваш отзыв...")
         try:
-            content = await process_voice_file(bot, message.voice.file_id)
+            content = await process_voice_file(bot, message.voice.file_id, message.voice.duration)
         except:
             await message.answer("Ошибка обработки аудио.")
             return
@@ -694,7 +708,7 @@ async def process_negative_custom_content(message: types.Message, state: FSMCont
 
         msg_wait = await message.answer("Расшифровываю ваш отзыв...")
         try:
-            content = await process_voice_file(bot, message.voice.file_id)
+            content = await process_voice_file(bot, message.voice.file_id, message.voice.duration)
         except:
              await message.answer("Ошибка.")
              return
@@ -719,213 +733,204 @@ async def process_negative_custom_content(message: types.Message, state: FSMCont
 
 
 # --- Main Audio Handler ---
+def audio_of(message: types.Message) -> Optional[dict]:
+    """File fields of a voice, audio or audio document message; None for anything else."""
+    if message.voice:
+        media, file_name = message.voice, None
+    elif message.audio:
+        media, file_name = message.audio, message.audio.file_name
+    elif message.document and message.document.mime_type and message.document.mime_type.startswith('audio/'):
+        media, file_name = message.document, message.document.file_name
+    else:
+        return None
+    return {
+        "file_id": media.file_id,
+        "file_unique_id": media.file_unique_id,
+        "duration": getattr(media, "duration", None) or 0,  # documents: probed before download
+        "file_size": media.file_size or 0,
+        "mime_type": media.mime_type,
+        "file_name": file_name,
+    }
+
+
+def new_job(message: types.Message, status_message_id: int, audio: dict, **extra) -> TranscriptionJob:
+    user = message.from_user
+    return TranscriptionJob(
+        user_id=user.id,
+        username=user.username,
+        first_name=user.first_name,
+        chat_id=message.chat.id,
+        status_message_id=status_message_id,
+        file_path=None,
+        duration_exact=bool(audio["duration"]),
+        backend=backend_for_user(user.id),
+        **audio,
+        **extra,
+    )
+
+
+async def prepare_job(job: TranscriptionJob) -> float:
+    """Cache lookup and duration probe; returns the seconds to admit the job on."""
+    # Forwarded copies of a known voice note skip get_file, download and Whisper
+    cached = await transcription_cache.by_file_unique_id(job.file_unique_id)
+    if cached is not None:
+        job.cached_text, job.cached_segments = cached.text, cached.segments
+        if not job.duration_exact:
+            job.duration, job.duration_exact = cached.duration, True
+
+    hint = codec_hint(job.mime_type, None)
+    if cached is None:
+        file = await bot.get_file(job.file_id)
+        job.file_path = file.file_path
+        hint = codec_hint(job.mime_type, file.file_path)
+        if not job.duration_exact:
+            job.duration = await probe_remote_duration(bot, file)
+            job.duration_exact = job.duration > 0
+
+    # Admission before the download: the exact duration, or at least the shortest
+    # length this file size allows, so users without balance cost no bandwidth
+    return job.duration if job.duration_exact else min_duration(job.file_size, hint)
+
+
 @dp.message(F.audio | F.voice | F.document)
 async def handle_audio(message: types.Message, state: FSMContext):
+    """Admission only: cache lookup, duration probe and balance hold, then the job is queued."""
     current_state = await state.get_state()
     if current_state in [FeedbackState.waiting_for_suggestion, FeedbackState.waiting_for_negative_custom]:
         await message.answer("Пожалуйста, отправьте голосовое сообщение или текст для отзыва, либо нажмите 'Назад'.")
         return
 
+    audio = audio_of(message)
+    if audio is None:
+        return
+    if message.media_group_id:
+        # Several files sent together: admitted, transcribed and answered as one album
+        album_collector.add((message.chat.id, message.media_group_id), message)
+        return
+
     user = message.from_user
-    file_id = None
-    duration = 0
-    file_size = 0
-    
-    if message.voice:
-        file_id = message.voice.file_id
-        duration = message.voice.duration
-        file_size = message.voice.file_size
-    elif message.audio:
-        file_id = message.audio.file_id
-        duration = message.audio.duration
-        file_size = message.audio.file_size
-    elif message.document:
-        if message.document.mime_type and message.document.mime_type.startswith('audio/'):
-            file_id = message.document.file_id
-            duration = 0 # Will verify later
-            file_size = message.document.file_size
-        else:
-            return
 
-    if not file_id:
+    # Backpressure: one user cannot fill the queue for everybody
+    if await job_queue.pending_for(user.id) >= MAX_QUEUED_PER_USER:
+        await message.answer(
+            f"⏳ У вас уже {MAX_QUEUED_PER_USER} файлов в очереди. Дождитесь их расшифровки и отправьте остальные."
+        )
         return
         
     # Warn user about processing
     status_msg = await message.answer("Скачиваю и обрабатываю файл... / Downloading and processing...")
+    job = new_job(message, status_msg.message_id, audio)
+    queued = False
 
-    local_filename = None
-    txt_filename = None
-    
     try:
-        file = await bot.get_file(file_id)
-        file_path = file.file_path
-        ext = os.path.splitext(file_path)[1]
-        if not ext: ext = ".ogg"
-        
-        local_filename = f"{TEMP_DIR}/{file_id}{ext}"
-        await bot.download_file(file_path, local_filename)
-        
-        # Determine duration if unknown
-        if duration == 0:
-            duration = get_audio_duration(local_filename)
-            if duration == 0:
-                await bot.delete_message(chat_id=message.chat.id, message_id=status_msg.message_id)
-                await message.answer("Не удалось определить длительность аудио.")
-                if local_filename and os.path.exists(local_filename):
-                    os.remove(local_filename)
-                return
-
-        # Check Limits
-        can_process, missing_seconds = await check_user_limit(user.id, duration)
-        
-        if not can_process:
-            if local_filename and os.path.exists(local_filename):
-                os.remove(local_filename)
-            
+        admit_seconds = await prepare_job(job)
+        # Reserved now, settled when the job is billed: queued files cannot overspend the balance
+        hold_ids, missing_seconds = await balance_holds.reserve(user.id, user.username, user.first_name, [admit_seconds])
+        if hold_ids is None:
             await bot.delete_message(chat_id=message.chat.id, message_id=status_msg.message_id)
-            
-            text = (
-                "⛔️ **Недостаточно минут!**\n\n"
-                f"Для расшифровки этого файла ({int(duration)} сек) вам не хватает **{int(missing_seconds)} секунд**."
-            )
-            
-            needed_minutes = math.ceil(missing_seconds / 60)
-            price = get_tariff_price(needed_minutes)
-            
-            upsell_kb = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text=f"Купить {needed_minutes} мин за {price} ₽", callback_data=f"buy_{needed_minutes}")],
-                [InlineKeyboardButton(text="💎 Выбрать тариф", callback_data="payment_back_to_tariffs")]
-            ])
-            
-            await message.answer(text, reply_markup=upsell_kb, parse_mode="Markdown")
+            await send_limit_exceeded(bot, message.chat.id, admit_seconds, missing_seconds)
             return
+        job.hold_id = hold_ids[0]
 
-        # Let's update status message
-        await bot.edit_message_text("Отправляю в обработку... / Sending to processing...", chat_id=message.chat.id, message_id=status_msg.message_id)
-
-        start_time = time.time()
-        
-        try:
-            # transcribe_audio now returns (text, status_detail)
-            text_result, status_detail = await transcribe_audio(local_filename)
-            
-            # Map status_detail to human readable string for DB/Logs
-            final_status = "Без сжатия" if status_detail == "original" else "Сжатие"
-            error = None
-            
-        except ValueError as ve:
-            # Handled errors from service
-            final_status = "Ошибка" # General Russian fail status
-            error_raw = str(ve)
-            error = error_raw # Default
-            
-            if "FILE_TOO_LARGE" in error_raw:
-                await bot.delete_message(chat_id=message.chat.id, message_id=status_msg.message_id)
-                await message.answer("⚠️ Файл слишком большой даже после сжатия. Пожалуйста, разделите его на части.")
-                error = "Слишком большой (после сжатия)"
-            elif "COMPRESSION_FAILED" in error_raw:
-                await bot.delete_message(chat_id=message.chat.id, message_id=status_msg.message_id)
-                await message.answer("⚠️ Ошибка при обработке файла.")
-                error = "Ошибка сжатия"
-            else:
-                await bot.delete_message(chat_id=message.chat.id, message_id=status_msg.message_id)
-                await message.answer("⚠️ Ошибка при расшифровке.")
-                error = "Ошибка Whisper"
-            
-            # Log failure
-            await add_voice_message(user.id, duration, 0, 0, final_status, error, text=None)
-            asyncio.create_task(gs_service.log_voice_message({
-                "user_id": user.id,
-                "process_speed": 0,
-                "length_sec": duration,
-                "length_chars": 0,
-                "status": final_status,
-                "error_reason": error
-            }))
+        if job.cached_text is not None:
+            # Nothing to download or transcribe: no need to wait in line
+            await run_transcription_job(bot, job)
             return
 
-        end_time = time.time()
-        
-        processing_time = round(end_time - start_time, 2)
-        text_len = len(text_result)
-        
-        await get_or_create_user(user.id, user.username, user.first_name)
-        await update_user_usage(user.id, duration)
-        await add_voice_message(user.id, duration, text_len, processing_time, final_status, None, text=text_result)
-        
-        # Stats logging
-        stats = await get_user_stats(user.id)
-        asyncio.create_task(gs_service.log_voice_message({
-            "user_id": user.id,
-            "process_speed": processing_time,
-            "length_sec": duration,
-            "length_chars": text_len,
-            "status": final_status,
-            "error_reason": ""
-        }))
-        asyncio.create_task(gs_service.update_user_stats(stats))
-
-        # File creation
-        timestamp = datetime.now(timezone.utc).strftime("%d.%m.%Y_%H-%M")
-        txt_filename = f"{TEMP_DIR}/{timestamp}.txt"
-        with open(txt_filename, "w", encoding="utf-8") as f:
-            f.write(text_result)
-            
-        input_file = FSInputFile(txt_filename, filename=f"{timestamp}.txt")
-        
-        await bot.delete_message(chat_id=message.chat.id, message_id=status_msg.message_id)
-
-        if text_len < 4090:
-            await message.answer(f"```\n{text_result}\n```", parse_mode="Markdown")
-            await message.answer_document(input_file, caption="Вам понравилась расшифровка?", reply_markup=get_feedback_kb())
-        else:
-            await message.answer("⚠️ Расшифровка получилась очень длинной (больше лимита Telegram), поэтому отправляю её только файлом 👇")
-            await message.answer_document(input_file, caption="Вам понравилась расшифровка?", reply_markup=get_feedback_kb())
-
-    except OpenAIError as oe:
-        logging.error(f"OpenAI API Error: {oe}")
-        await bot.delete_message(chat_id=message.chat.id, message_id=status_msg.message_id)
-        await message.answer("⚠️ Сервис расшифровки временно недоступен (ошибка API). Попробуйте позже.")
-        
-        if ADMIN_ID:
-            await bot.send_message(
-                ADMIN_ID,
-                f"🚨 **OpenAI Error**\nUser: {user.id} (@{user.username})\nError: `{oe}`"
+        # Picked up by a worker process (python -m src.worker)
+        job, position = await job_queue.put(user.id, job.queue_fields())
+        queued = True
+        if position > 1:
+            await bot.edit_message_text(
+                f"⏳ Файл в очереди, позиция {position}. / Queued, position {position}.",
+                chat_id=message.chat.id,
+                message_id=status_msg.message_id,
             )
 
     except Exception as e:
-        logging.error(f"Critical error processing voice: {e}")
+        logging.error(f"Critical error admitting voice: {e}")
         logging.error(traceback.format_exc())
-        await bot.delete_message(chat_id=message.chat.id, message_id=status_msg.message_id)
-        await message.answer("Произошла внутренняя ошибка сервера. Мы уже разбираемся.")
-        
-        if ADMIN_ID:
-            tb = traceback.format_exc()[-1000:] # Last 1000 chars
-            await bot.send_message(
-                ADMIN_ID,
-                f"🚨 **Critical Error**\nUser: {user.id} (@{user.username})\nError: `{e}`\nTrace:\n`{tb}`",
-                parse_mode="Markdown"
+        if not queued:
+            await balance_holds.release([job.hold_id])
+        await report_critical_error(bot, job, e)
+
+
+async def admit_album(messages: list[types.Message]):
+    """One status message, one balance hold for the whole album and one enqueue transaction."""
+    messages.sort(key=lambda m: m.message_id)
+    first = messages[0]
+    user = first.from_user
+    chat_id = first.chat.id
+    count = len(messages)
+
+    if await job_queue.pending_for(user.id) + count > MAX_QUEUED_PER_USER:
+        await first.answer(
+            f"⏳ В очереди может быть не больше {MAX_QUEUED_PER_USER} ваших файлов. Дождитесь расшифровки и отправьте альбом ещё раз."
+        )
+        return
+
+    status_msg = await first.answer(f"Скачиваю и обрабатываю {count} файлов... / Downloading and processing {count} files...")
+    batch_id = album_batch_id(chat_id, first.media_group_id, first.message_id)
+    jobs = [
+        new_job(m, status_msg.message_id, audio_of(m), batch_id=batch_id, batch_index=i, batch_size=count)
+        for i, m in enumerate(messages)
+    ]
+    queued = False
+
+    try:
+        amounts = await asyncio.gather(*(prepare_job(job) for job in jobs))
+        # All files or none: an album is never half admitted
+        hold_ids, missing_seconds = await balance_holds.reserve(user.id, user.username, user.first_name, list(amounts))
+        if hold_ids is None:
+            await bot.delete_message(chat_id=chat_id, message_id=status_msg.message_id)
+            await send_limit_exceeded(bot, chat_id, sum(amounts), missing_seconds)
+            return
+        for job, hold_id in zip(jobs, hold_ids):
+            job.hold_id = hold_id
+
+        rows = []
+        for job in jobs:
+            fields = job.queue_fields()
+            if job.cached_text is not None:
+                # Known file: the worker only bills it and adds it to the combined result
+                fields.update(
+                    result_text=job.cached_text, result_segments=job.cached_segments,
+                    result_status=TRANSCRIBE_STATUS_LABELS["cached"],
+                )
+            rows.append(fields)
+        # Files of one album go to different workers and are transcribed side by side
+        _, position = await job_queue.put_many(user.id, rows)
+        queued = True
+        if position > 1:
+            await bot.edit_message_text(
+                f"⏳ Альбом из {count} файлов в очереди, позиция {position}. / Queued, position {position}.",
+                chat_id=chat_id,
+                message_id=status_msg.message_id,
             )
-    
-    finally:
-        if local_filename and os.path.exists(local_filename):
-            os.remove(local_filename)
-        if txt_filename and os.path.exists(txt_filename):
-            os.remove(txt_filename)
+
+    except Exception as e:
+        logging.error(f"Critical error admitting album: {e}")
+        logging.error(traceback.format_exc())
+        if not queued:
+            await balance_holds.release(job.hold_id for job in jobs)
+        await report_critical_error(bot, jobs[0], e)
+
+
+album_collector: AlbumCollector[types.Message] = AlbumCollector(ALBUM_COLLECT_SECONDS, admit_album)
 
 @dp.callback_query(F.data == "feedback_yes")
 async def feedback_yes(callback: types.CallbackQuery):
     user = callback.from_user
     await add_review(user.id, "positive", None)
     asyncio.create_task(gs_service.log_review({"user_id": user.id, "type": "Positive", "content": "-"}))
-    await callback.message.edit_caption(caption="Спасибо за отзыв! 🚀")
+    await callback.message.edit_caption(caption="Спасибо за отзыв! 🚀", reply_markup=format_kb(callback.message))
     await callback.answer()
 
 @dp.callback_query(F.data == "feedback_no")
 async def feedback_no(callback: types.CallbackQuery):
     await callback.message.edit_caption(
         caption="Укажите причину:",
-        reply_markup=get_negative_reason_kb()
+        reply_markup=get_negative_reason_kb(format_rows(callback.message))
     )
     await callback.answer()
 
@@ -944,7 +949,19 @@ async def feedback_reason(callback: types.CallbackQuery, state: FSMContext):
 
     await add_review(callback.from_user.id, f"negative_{reason_code}", reason_code)
     # Log to sheets...
-    await callback.message.edit_caption(caption="Спасибо, мы учтём это! 🛠")
+    await callback.message.edit_caption(caption="Спасибо, мы учтём это! 🛠", reply_markup=format_kb(callback.message))
+    await callback.answer()
+
+@dp.callback_query(F.data.startswith("fmt_"))
+async def transcript_format(callback: types.CallbackQuery):
+    """SRT / VTT / JSON of a delivered transcript, rendered from its stored segments."""
+    _, voice_message_id, fmt = callback.data.split("_", 2)
+    if fmt not in FORMATS:
+        await callback.answer()
+        return
+    if not await send_transcript_file(bot, callback.message.chat.id, callback.from_user.id, int(voice_message_id), fmt):
+        await callback.answer("Расшифровка не найдена.")
+        return
     await callback.answer()
 
 # --- Catch-all for text messages (never swallow /commands) ---
@@ -959,8 +976,22 @@ async def main():
 
     await init_db()
     gs_service.connect()
+    if METRICS_PORT:
+        await metrics.start_metrics_server(METRICS_PORT)
+    asyncio.create_task(transcription_cache.run_eviction())
+    asyncio.create_task(transcription_cache.run_hit_flush())
+    asyncio.create_task(workspace.run_sweeper())
+    asyncio.create_task(balance_holds.run_expiry())
+    asyncio.create_task(user_cache.run_invalidation(engine))
+    asyncio.create_task(run_activity_flush())
+    await warm_up(bot, yookassa=bool(YOOKASSA_SHOP_ID and YOOKASSA_SECRET_KEY))
     logging.info("Starting polling…")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await flush_user_activity()
+        await transcription_cache.flush_hits()
+        await close_http_pools()
 
 if __name__ == "__main__":
     asyncio.run(main())
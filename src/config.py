@@ -14,4 +14,122 @@ YOOKASSA_SECRET_KEY = os.getenv("YOOKASSA_SECRET_KEY")
 
 ADMIN_ID = os.getenv("ADMIN_ID")
 if ADMIN_ID:
-    ADMIN_ID = int(ADMIN_ID)
\ No newline at end of file
+    ADMIN_ID = int(ADMIN_ID)
+
+# Audio buffers: downloads stay in memory up to this size, then spill to a temp file
+AUDIO_SPOOL_MAX_BYTES = int(os.getenv("AUDIO_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# ffmpeg: max concurrent transcoder processes and per-job timeout (seconds)
+FFMPEG_MAX_PROCS = int(os.getenv("FFMPEG_MAX_PROCS", "2"))
+FFMPEG_TIMEOUT_SECONDS = float(os.getenv("FFMPEG_TIMEOUT_SECONDS", "600"))
+
+# Long recordings are transcribed as overlapping chunks in parallel
+CHUNK_SECONDS = float(os.getenv("CHUNK_SECONDS", "600"))
+CHUNK_OVERLAP_SECONDS = float(os.getenv("CHUNK_OVERLAP_SECONDS", "3"))
+TRANSCRIBE_CONCURRENCY = int(os.getenv("TRANSCRIBE_CONCURRENCY", "4"))
+
+# Voice activity detection: cut long silences from recordings of at least VAD_MIN_SECONDS
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1") == "1"
+VAD_MIN_SECONDS = float(os.getenv("VAD_MIN_SECONDS", "60"))
+VAD_MIN_SILENCE_SECONDS = float(os.getenv("VAD_MIN_SILENCE_SECONDS", "1.0"))
+
+# Metrics: Prometheus text on :METRICS_PORT/metrics (0 = do not listen)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Transcription cache (file_unique_id / sha256 -> text): in-memory LRU in front of Postgres
+TRANSCRIPTION_CACHE_ENABLED = os.getenv("TRANSCRIPTION_CACHE_ENABLED", "1") == "1"
+TRANSCRIPTION_CACHE_HOT_ENTRIES = int(os.getenv("TRANSCRIPTION_CACHE_HOT_ENTRIES", "1000"))
+TRANSCRIPTION_CACHE_TTL_DAYS = float(os.getenv("TRANSCRIPTION_CACHE_TTL_DAYS", "30"))
+TRANSCRIPTION_CACHE_MAX_MB = float(os.getenv("TRANSCRIPTION_CACHE_MAX_MB", "512"))
+# Hits answered from memory are written to Postgres (hits, last_hit_at) in one batch this often
+TRANSCRIPTION_CACHE_HIT_FLUSH_SECONDS = float(os.getenv("TRANSCRIPTION_CACHE_HIT_FLUSH_SECONDS", "60"))
+
+# Duration probing before download: bytes read from each end of the file
+PROBE_EDGE_BYTES = int(os.getenv("PROBE_EDGE_BYTES", str(64 * 1024)))
+
+# Transcription job queue: worker count, per-user queue cap, global in-flight Whisper requests
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", "4"))
+MAX_QUEUED_PER_USER = int(os.getenv("MAX_QUEUED_PER_USER", "20"))
+OPENAI_MAX_INFLIGHT = int(os.getenv("OPENAI_MAX_INFLIGHT", "8"))
+
+# Durable job queue (transcription_jobs table): lease length, heartbeat and poll intervals, retries after a crash
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Pre-upload normalization: assumed uplink, initial ffmpeg speed guess (x realtime, then measured), speech Opus bitrate
+UPLOAD_MBPS = float(os.getenv("UPLOAD_MBPS", "20"))
+TRANSCODE_SPEED_X = float(os.getenv("TRANSCODE_SPEED_X", "100"))
+SPEECH_OPUS_KBPS = int(os.getenv("SPEECH_OPUS_KBPS", "24"))
+
+# Speech-to-text engine: "openai" (Whisper API) or "local" (faster-whisper on CPU); fallback used when the primary fails
+TRANSCRIPTION_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", "openai")
+TRANSCRIPTION_FALLBACK_BACKEND = os.getenv("TRANSCRIPTION_FALLBACK_BACKEND", "")
+# Per-job engine: "user_id:backend,..." - jobs of these users (test accounts, load generators) are
+# admitted with that backend, stored in transcription_jobs.backend
+TRANSCRIPTION_BACKEND_BY_USER = {
+    int(user_id): backend.strip().lower()
+    for user_id, _, backend in (
+        item.partition(":") for item in os.getenv("TRANSCRIPTION_BACKEND_BY_USER", "").split(",") if item.strip()
+    )
+}
+LOCAL_WHISPER_MODEL = os.getenv("LOCAL_WHISPER_MODEL", "small")
+LOCAL_WHISPER_COMPUTE_TYPE = os.getenv("LOCAL_WHISPER_COMPUTE_TYPE", "int8")
+LOCAL_WHISPER_PROCS = int(os.getenv("LOCAL_WHISPER_PROCS", "1"))
+
+# Whisper API resilience: attempts per call, per-attempt timeout, backoff bounds, circuit breaker
+WHISPER_MAX_ATTEMPTS = int(os.getenv("WHISPER_MAX_ATTEMPTS", "4"))
+WHISPER_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("WHISPER_ATTEMPT_TIMEOUT_SECONDS", "300"))
+WHISPER_BACKOFF_BASE_SECONDS = float(os.getenv("WHISPER_BACKOFF_BASE_SECONDS", "1"))
+WHISPER_BACKOFF_MAX_SECONDS = float(os.getenv("WHISPER_BACKOFF_MAX_SECONDS", "30"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "60"))
+
+# Hedged Whisper requests: off by default; fire a second request after the HEDGE_QUANTILE latency, at most HEDGE_BUDGET_RATIO extra calls
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "0") == "1"
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "95"))
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.05"))
+HEDGE_BACKEND = os.getenv("HEDGE_BACKEND", "openai_hedge")
+# Second OpenAI key for hedged requests (separate rate limits); empty = the main OPENAI_KEY
+OPENAI_HEDGE_KEY = os.getenv("OPENAI_HEDGE_KEY", "")
+
+# Partial transcripts of long files: minimum seconds between edits of the chat messages (Telegram rate limits)
+PROGRESS_EDIT_INTERVAL_SECONDS = float(os.getenv("PROGRESS_EDIT_INTERVAL_SECONDS", "3"))
+
+# Shared HTTP transport (OpenAI, Telegram, YooKassa): pool sizes, keep-alive, timeouts, HTTP/2, DNS cache
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "20"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "10"))
+HTTP_READ_TIMEOUT_SECONDS = float(os.getenv("HTTP_READ_TIMEOUT_SECONDS", "60"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1") == "1"
+DNS_CACHE_SECONDS = int(os.getenv("DNS_CACHE_SECONDS", "300"))
+
+# Albums: wait this long after the last file of a media group before admitting the whole group
+ALBUM_COLLECT_SECONDS = float(os.getenv("ALBUM_COLLECT_SECONDS", "1.5"))
+
+# Job scratch space: per-job directories for downloads that spill out of memory (tmpfs recommended),
+# byte quota across all jobs of all processes sharing WORKSPACE_DIR, age after which a leftover directory is removed
+WORKSPACE_DIR = os.getenv("WORKSPACE_DIR", "/tmp/stt-workspace")
+WORKSPACE_QUOTA_MB = int(os.getenv("WORKSPACE_QUOTA_MB", "2048"))
+WORKSPACE_ORPHAN_SECONDS = float(os.getenv("WORKSPACE_ORPHAN_SECONDS", str(6 * 3600)))
+
+# Result delivery: at most this many preformatted messages inline, partial text included (longer: file only);
+# SRT/VTT/JSON files kept by Telegram file_id so a repeated request is not rendered or uploaded again
+INLINE_MAX_PAGES = int(os.getenv("INLINE_MAX_PAGES", "3"))
+RENDERED_FILES_CACHE_ENTRIES = int(os.getenv("RENDERED_FILES_CACHE_ENTRIES", "2048"))
+
+# Balance holds: seconds reserved at admission until the job is billed; a hold no queued/running job
+# refers to (admission crashed, job ended without billing) is released after this many seconds
+BALANCE_HOLD_TTL_SECONDS = float(os.getenv("BALANCE_HOLD_TTL_SECONDS", "900"))
+
+# User/balance cache (per process): entries kept, and the longest an entry is trusted; changes made by other
+# processes arrive through Postgres LISTEN/NOTIFY (migration 011), the TTL only bounds the damage of a missed one
+USER_CACHE_ENTRIES = int(os.getenv("USER_CACHE_ENTRIES", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+
+# users.last_activity_at: written at most once per this many seconds per user (the value is that coarse);
+# activity of known users is collected in memory and written in one UPDATE every USER_ACTIVITY_FLUSH_SECONDS
+USER_ACTIVITY_GRANULARITY_SECONDS = float(os.getenv("USER_ACTIVITY_GRANULARITY_SECONDS", "300"))
+USER_ACTIVITY_FLUSH_SECONDS = float(os.getenv("USER_ACTIVITY_FLUSH_SECONDS", "30"))
@@ -0,0 +1,70 @@
+"""Albums: several audio files sent as one media group become one batch.
+
+Telegram delivers an album as separate messages sharing ``media_group_id``, a few
+hundred milliseconds apart. ``AlbumCollector`` gathers them until no new file arrived
+for ``window`` seconds (or the album is full), then hands the whole group over at once.
+A file that arrives after its group was handed over starts a new group of its own, so
+every flush is admitted as a separate batch (``album_batch_id``). ``render_album`` builds
+the combined result document.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Generic, Hashable, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+# Telegram allows at most 10 items per media group
+ALBUM_MAX_ITEMS = 10
+
+
+class AlbumCollector(Generic[T]):
+    def __init__(self, window: float, flush: Callable[[list[T]], Awaitable[None]], max_items: int = ALBUM_MAX_ITEMS):
+        self.window = window
+        self.flush = flush
+        self.max_items = max_items
+        self._items: dict[Hashable, list[T]] = {}
+        self._timers: dict[Hashable, asyncio.TimerHandle] = {}
+
+    def add(self, key: Hashable, item: T) -> None:
+        items = self._items.setdefault(key, [])
+        items.append(item)
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        loop = asyncio.get_running_loop()
+        if len(items) >= self.max_items:
+            loop.call_soon(self._fire, key)
+        else:
+            self._timers[key] = loop.call_later(self.window, self._fire, key)
+
+    def _fire(self, key: Hashable) -> None:
+        self._timers.pop(key, None)
+        items = self._items.pop(key, None)
+        if items:
+            asyncio.ensure_future(self._run(items))
+
+    async def _run(self, items: list[T]) -> None:
+        try:
+            await self.flush(items)
+        except Exception:
+            logging.exception("Album flush failed")
+
+
+def album_batch_id(chat_id: int, media_group_id: str, first_message_id: int) -> str:
+    """``transcription_jobs.batch_id`` of one flushed group; a late file of the same album gets its own."""
+    return f"{chat_id}:{media_group_id}:{first_message_id}"
+
+
+def render_album(entries: Sequence[tuple[str, Optional[str], Optional[str]]]) -> str:
+    """``(title, text, error)`` per file, in album order -> one text with a numbered heading per file."""
+    parts = []
+    for index, (title, text, error) in enumerate(entries, start=1):
+        if text is not None:
+            body = text.strip()
+        else:
+            body = "⚠️ " + (error or "Не удалось расшифровать").removeprefix("⚠️ ")
+        parts.append(f"{index}. {title}\n\n{body or '(тишина)'}")
+    return "\n\n———\n\n".join(parts)
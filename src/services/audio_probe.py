@@ -0,0 +1,197 @@
+"""Duration probing without downloading the whole file.
+
+Order of attempts: mutagen on the first/last few KB (the rest of the file is presented
+as zeros), ffprobe reading the file from a pipe (the download streamed into it), and
+finally an estimate from the file size and the codec's typical bitrate.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+import os
+from typing import Optional
+
+import mutagen
+
+# kbit/s: (typical, maximum) per container/codec guess. The maximum gives a lower bound on
+# duration ("this file is at least N seconds"), the typical value a best guess.
+_BITRATES_KBPS: dict[str, tuple[float, float]] = {
+    "ogg": (32, 510),   # Telegram voice (Opus) / Vorbis
+    "oga": (32, 510),
+    "opus": (32, 510),
+    "mp3": (128, 320),
+    "m4a": (128, 512),
+    "mp4": (128, 512),
+    "aac": (128, 512),
+    "webm": (64, 510),
+    "flac": (700, 4608),
+    "wav": (1411, 4608),
+}
+_DEFAULT_BITRATES_KBPS = (128, 4608)
+
+_MIME_EXT = {
+    "audio/ogg": "ogg",
+    "audio/opus": "opus",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/mp4": "m4a",
+    "audio/x-m4a": "m4a",
+    "audio/m4a": "m4a",
+    "audio/aac": "aac",
+    "audio/webm": "webm",
+    "audio/flac": "flac",
+    "audio/x-flac": "flac",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/vnd.wave": "wav",
+}
+
+
+def codec_hint(mime_type: Optional[str], file_path: Optional[str]) -> Optional[str]:
+    ext = os.path.splitext(file_path or "")[1].lstrip(".").lower()
+    if ext in _BITRATES_KBPS:
+        return ext
+    return _MIME_EXT.get((mime_type or "").lower())
+
+
+def estimate_duration(file_size: int, hint: Optional[str]) -> float:
+    """Best guess from size and the codec's typical bitrate."""
+    typical, _ = _BITRATES_KBPS.get(hint or "", _DEFAULT_BITRATES_KBPS)
+    return file_size * 8 / (typical * 1000) if file_size else 0.0
+
+
+def min_duration(file_size: int, hint: Optional[str]) -> float:
+    """The file cannot be shorter than this, even at the codec's maximum bitrate."""
+    _, maximum = _BITRATES_KBPS.get(hint or "", _DEFAULT_BITRATES_KBPS)
+    return file_size * 8 / (maximum * 1000) if file_size else 0.0
+
+
+class EdgeFile(io.RawIOBase):
+    """Read-only file of ``size`` bytes: ``head`` at the start, ``tail`` at the end, zeros between."""
+
+    def __init__(self, head: bytes, tail: bytes, size: int):
+        self._head = head
+        self._tail = tail
+        self._size = max(size, len(head))
+        self._tail_start = max(len(head), self._size - len(tail))
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._pos = max(0, offset)
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        n = max(0, min(len(buffer), self._size - self._pos))
+        out = bytearray(n)
+        # head part
+        if self._pos < len(self._head):
+            chunk = self._head[self._pos:self._pos + n]
+            out[:len(chunk)] = chunk
+        # tail part
+        tail_from = max(self._pos, self._tail_start)
+        if tail_from < self._pos + n:
+            chunk = self._tail[tail_from - (self._size - len(self._tail)):][: self._pos + n - tail_from]
+            out[tail_from - self._pos: tail_from - self._pos + len(chunk)] = chunk
+        buffer[:n] = out
+        self._pos += n
+        return n
+
+
+def mutagen_duration(fileobj) -> float:
+    """Duration via mutagen, 0.0 if the container is not recognised."""
+    try:
+        fileobj.seek(0)
+        info = mutagen.File(fileobj)
+        if info is not None and info.info is not None and info.info.length:
+            return float(info.info.length)
+    except Exception as e:
+        logging.debug("mutagen probe failed: %s", e)
+    finally:
+        fileobj.seek(0)
+    return 0.0
+
+
+def duration_from_edges(head: bytes, tail: bytes, size: int) -> float:
+    return mutagen_duration(EdgeFile(head, tail, size))
+
+
+async def ffprobe_duration(source, timeout: float = 30.0) -> float:
+    """
+    ffprobe over a local path (``source`` as str), or fed on stdin: a bytes buffer, or an
+    async iterator of chunks (an HTTP body, read only as far as ffprobe needs). 0.0 on failure.
+    """
+    piped = not isinstance(source, str)
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1",
+           "pipe:0" if piped else source]
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if piped else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except OSError as e:
+        logging.warning("ffprobe not available: %s", e)
+        return 0.0
+
+    async def run() -> tuple[bytes, bytes]:
+        if not piped:
+            return await proc.communicate()
+        if hasattr(source, "__aiter__"):
+            try:
+                async for chunk in source:
+                    proc.stdin.write(chunk)
+                    await proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # ffprobe has what it needs and closed its input
+            proc.stdin.close()
+            return await proc.communicate()
+        source.seek(0)
+        data = source.read()
+        source.seek(0)
+        return await proc.communicate(data)
+
+    try:
+        out, err = await asyncio.wait_for(run(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        logging.warning("ffprobe timed out")
+        return 0.0
+    try:
+        return float(out.decode().strip())
+    except ValueError:
+        logging.info("ffprobe could not read duration: %s", err.decode("utf8", errors="replace").strip()[:300])
+        return 0.0
+
+
+async def fetch_edges(session, url: str, size: int, edge_bytes: int) -> tuple[bytes, bytes]:
+    """First and last ``edge_bytes`` of a remote file via HTTP Range (aiohttp session)."""
+    async def ranged(range_header: str) -> bytes:
+        async with session.get(url, headers={"Range": range_header}) as resp:
+            resp.raise_for_status()
+            if resp.status == 206:
+                return await resp.read()
+            # Range ignored: take what we need from the start and drop the connection
+            return await resp.content.read(edge_bytes) if range_header.startswith("bytes=0-") else b""
+
+    head = await ranged(f"bytes=0-{edge_bytes - 1}")
+    if size and size <= len(head):
+        return head, head
+    tail = await ranged(f"bytes=-{edge_bytes}")
+    return head, tail
@@ -0,0 +1,65 @@
+"""Balance holds: a user's seconds are reserved when a file is admitted, not when it is billed.
+
+``reserve`` holds the estimated duration of every admitted file (all-or-nothing for an
+album), so several files of one user can be queued and transcribed side by side without
+together spending more than the balance. Billing (``db_service.record_transcription``)
+settles the hold; a failed or refused job ``release``\\s it; a hold left behind by a crash
+is released by ``run_expiry`` once BALANCE_HOLD_TTL_SECONDS have passed and no queued
+or running job refers to it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Iterable, Optional
+
+from src.config import BALANCE_HOLD_TTL_SECONDS
+from src.services import db_service, metrics
+
+_holds = metrics.counter("balance_holds_total", "Balance holds by outcome")
+
+
+async def reserve(
+    user_id: int, username: Optional[str], first_name: Optional[str], amounts: list[float],
+) -> tuple[Optional[list[int]], float]:
+    """Hold ``amounts`` seconds (one per job); (hold ids, 0) or (None, missing seconds)."""
+    hold_ids, missing = await db_service.reserve_balance(user_id, username, first_name, amounts, BALANCE_HOLD_TTL_SECONDS)
+    _holds.inc(len(amounts), outcome="reserved" if hold_ids is not None else "refused")
+    return hold_ids, missing
+
+
+async def resize(hold_id: Optional[int], user_id: int, seconds: float) -> tuple[bool, float]:
+    """
+    Adjust a hold to the measured duration; (True, 0) or (False, missing seconds). Jobs
+    queued before holds existed have none: they get the plain balance check.
+    """
+    resized = await db_service.resize_balance_hold(hold_id, seconds) if hold_id is not None else None
+    if resized is None:
+        return await db_service.check_user_limit(user_id, seconds)
+    return resized
+
+
+async def release(hold_ids: Iterable[Optional[int]]) -> None:
+    """Give the seconds back. Never raises: a hold that cannot be released now expires later."""
+    ids = [h for h in hold_ids if h is not None]
+    if not ids:
+        return
+    try:
+        await db_service.release_balance_holds(ids)
+        _holds.inc(len(ids), outcome="released")
+    except Exception as e:
+        logging.warning("Balance holds %s not released (they expire later): %s", ids, e)
+
+
+async def run_expiry(interval_seconds: float = 60) -> None:
+    """Background loop: release holds whose job never got stored or ended without billing."""
+    while True:
+        try:
+            expired = await db_service.expire_balance_holds()
+            if expired:
+                _holds.inc(expired, outcome="expired")
+                logging.warning("Balance holds: released %s expired holds", expired)
+        except Exception as e:
+            logging.warning("Balance hold expiry failed: %s", e)
+        await asyncio.sleep(interval_seconds)
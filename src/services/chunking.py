@@ -0,0 +1,128 @@
+"""Splitting long audio into overlapping segments and stitching their transcripts back."""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+_WORD_CHARS = re.compile(r"[^\w]+", re.UNICODE)
+_WORD = re.compile(r"\S+")
+
+
+@dataclass(frozen=True)
+class Segment:
+    index: int
+    start: float  # seconds
+    end: float
+    overlap: float = 0.0  # seconds shared with the previous segment (0 when cut on silence)
+
+    @property
+    def length(self) -> float:
+        return self.end - self.start
+
+
+def plan_segments(
+    duration: float,
+    max_seconds: float,
+    overlap_seconds: float,
+    boundaries: Sequence[float] = (),
+) -> list[Segment]:
+    """
+    Cover ``[0, duration]`` with segments of at most ``max_seconds``.
+
+    A segment ends on the latest silence in ``boundaries`` that falls in the second half
+    of its window; nothing is cut there, so the next segment starts right at it.
+    Without a usable silence the cut is hard and the next segment starts
+    ``overlap_seconds`` earlier, so a word cut at the boundary is fully heard by at
+    least one of the two requests.
+    """
+    if duration <= 0:
+        return []
+    if duration <= max_seconds:
+        return [Segment(0, 0.0, float(duration))]
+    overlap = max(0.0, min(overlap_seconds, max_seconds / 2))
+    cuts = sorted(boundaries)
+    segments: list[Segment] = []
+    start, shared = 0.0, 0.0
+    while True:
+        end = min(duration, start + max_seconds)
+        silent = end < duration and _last_between(cuts, start + max_seconds / 2, end)
+        if silent:
+            end = silent
+        segments.append(Segment(len(segments), start, end, shared))
+        if end >= duration:
+            return segments
+        shared = 0.0 if silent else overlap
+        start = end - shared
+
+
+def _last_between(values: list[float], low: float, high: float) -> Optional[float]:
+    found = None
+    for v in values:
+        if v > high:
+            break
+        if v > low:
+            found = v
+    return found
+
+
+def prompt_tail(text: Optional[str], max_chars: int = 200) -> Optional[str]:
+    """Last ``max_chars`` of a transcript, starting on a word boundary (Whisper ``prompt``)."""
+    if not text:
+        return None
+    text = text.strip()
+    if len(text) <= max_chars:
+        return text
+    tail = text[-max_chars:]
+    cut = tail.find(" ")
+    return tail[cut + 1:] if cut != -1 else tail
+
+
+def _norm(word: str) -> str:
+    return _WORD_CHARS.sub("", word).lower()
+
+
+def _overlap_cut(prev_words: list[str], next_words: list[str], max_words: int, max_skip: int, min_match: int) -> int:
+    """Number of leading words of ``next_words`` that repeat the tail of ``prev_words``."""
+    prev_norm = [_norm(w) for w in prev_words[-max_words:]]
+    next_norm = [_norm(w) for w in next_words[: max_words + max_skip]]
+    for k in range(min(len(prev_norm), len(next_norm)), min_match - 1, -1):
+        tail = prev_norm[-k:]
+        # The first overlapped word is often cut mid-way, so allow skipping a few leading words.
+        for skip in range(0, min(max_skip, len(next_norm) - k) + 1):
+            if next_norm[skip:skip + k] == tail:
+                return skip + k
+    return 0
+
+
+def stitch_transcripts(
+    parts: list[str],
+    overlapped: Optional[Sequence[bool]] = None,
+    max_overlap_words: int = 40,
+    max_skip: int = 2,
+    min_match: int = 2,
+) -> str:
+    """
+    Join per-segment transcripts in order, dropping words repeated across the overlap.
+    ``overlapped[i]`` says whether part ``i`` shares audio with the previous one (default: all do).
+    Parts keep their own line breaks. Where an overlap was dropped, the part continues
+    after the whitespace that preceded its first kept word; otherwise parts join with a space.
+    """
+    words: list[str] = []
+    stitched = ""
+    for i, part in enumerate(parts):
+        spans = [m.span() for m in _WORD.finditer(part or "")]
+        if not spans:
+            continue
+        part_words = [part[start:end] for start, end in spans]
+        cut = 0
+        if words and (overlapped is None or overlapped[i]):
+            cut = _overlap_cut(words, part_words, max_overlap_words, max_skip, min_match)
+        if cut == len(part_words):
+            continue
+        if stitched:
+            stitched += part[spans[cut - 1][1]:spans[cut][0]] if cut else " "
+        stitched += part[spans[cut][0]:spans[-1][1]]
+        words.extend(part_words[cut:])
+    return stitched
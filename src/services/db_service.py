@@ -1,12 +1,15 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 from typing import Optional
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import DateTime, BigInteger, Float, Integer, ForeignKey, func, String, Text
-from datetime import datetime, timezone
-from src.config import DATABASE_URL
+from sqlalchemy.orm import DeclarativeBase, Mapped, aliased, mapped_column
+from sqlalchemy import Boolean, Date, DateTime, BigInteger, Float, Index, Integer, ForeignKey, func, String, Text, text as sql_text
+from datetime import date, datetime, timedelta, timezone
+from src.config import DATABASE_URL, USER_ACTIVITY_FLUSH_SECONDS, USER_ACTIVITY_GRANULARITY_SECONDS
+from src.services.migrations import migrate
+from src.services.user_cache import CachedUser, user_cache
 
 class Base(DeclarativeBase):
     pass
@@ -26,6 +29,8 @@ class User(Base):
     # Balance & Usage
     balance_seconds: Mapped[float] = mapped_column(Float, default=0.0)
     used_free_seconds: Mapped[float] = mapped_column(Float, default=0.0)
+    # Sum of the user's balance_holds: admitted jobs not billed yet. Server default as in migration 010
+    held_seconds: Mapped[float] = mapped_column(Float, default=0.0, server_default="0")
 
 class Transaction(Base):
     __tablename__ = "transactions"
@@ -46,18 +51,60 @@ class Transaction(Base):
     # Telegram Stars refund lifecycle (only meaningful for provider telegram_stars)
     stars_refund_status: Mapped[str] = mapped_column(String, default="none")  # none, refunded, failed
 
+    # Same indexes as scripts/migrations/009_hot_path_indexes.sql
+    __table_args__ = (
+        Index("ix_transactions_user_status_id", "user_id", "status", "id"),
+        Index("ix_transactions_user_payment", "user_id", "payment_id"),
+        # FIFO buckets: only purchases with seconds left, oldest first, answered from the index alone
+        Index(
+            "ix_transactions_fifo", "user_id", "id",
+            postgresql_where=sql_text("status = 'success' AND seconds_remaining > 0"),
+            postgresql_include=["seconds_remaining"],
+        ),
+    )
+
 class VoiceMessage(Base):
     __tablename__ = "voice_messages"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     created_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now)
-    duration_seconds: Mapped[float] = mapped_column(Float)
+    duration_seconds: Mapped[float] = mapped_column(Float) # Original length (billed)
+    # Length actually sent to Whisper after VAD cut the silence; NULL if nothing was cut
+    trimmed_duration_seconds: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     transcription_length_chars: Mapped[int] = mapped_column(Integer, nullable=True) # Nullable for failed
     processing_time_seconds: Mapped[float] = mapped_column(Float, nullable=True) # Nullable for failed
     status: Mapped[str] = mapped_column(String, default="success") # success, failed
     error_reason: Mapped[str] = mapped_column(String, nullable=True) # compression_failed, too_large, etc.
     transcription_text: Mapped[str] = mapped_column(Text, nullable=True) # Stored transcription
+    # Whisper segments as JSON [[start, end, text], ...]; SRT/VTT/JSON are rendered from them
+    transcription_segments: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    __table_args__ = (Index("ix_voice_messages_user_created", "user_id", "created_at"),)
+
+class UserStats(Base):
+    """Per-user rollup of voice_messages, updated in the same transaction as every insert."""
+    __tablename__ = "user_stats"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    total_msgs: Mapped[int] = mapped_column(Integer, default=0)
+    total_duration_seconds: Mapped[float] = mapped_column(Float, default=0.0)
+    total_chars: Mapped[int] = mapped_column(BigInteger, default=0)
+    chars_msgs: Mapped[int] = mapped_column(Integer, default=0) # rows with transcription_length_chars set (AVG skips NULL)
+    # Messages per UTC day, newest first, JSON [n, ...]; see stats_rollup
+    day_counts: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    days_anchor: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
+
+class BalanceHold(Base):
+    """Seconds reserved at admission for a job; settled when it is billed, released if it fails."""
+    __tablename__ = "balance_holds"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    seconds: Mapped[float] = mapped_column(Float)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now)
+    # Released after this unless a queued/running job still refers to it
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
 
 class Review(Base):
     __tablename__ = "reviews"
@@ -68,6 +115,69 @@ class Review(Base):
     feedback_type: Mapped[str] = mapped_column() # 'positive', 'negative_reason', 'negative_custom', 'suggestion'
     content: Mapped[str] = mapped_column(nullable=True)
 
+class TranscriptionCacheEntry(Base):
+    """Finished transcription keyed by Telegram file_unique_id (sha256 of the bytes as fallback)."""
+    __tablename__ = "transcription_cache"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    file_unique_id: Mapped[str] = mapped_column(String, unique=True)
+    sha256: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)
+    text: Mapped[str] = mapped_column(Text)
+    segments: Mapped[Optional[str]] = mapped_column(Text, nullable=True) # JSON, see VoiceMessage
+    duration_seconds: Mapped[float] = mapped_column(Float)
+    size_bytes: Mapped[int] = mapped_column(Integer) # UTF-8 size of text and segments, for size-based eviction
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now)
+    last_hit_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now, index=True)
+    hits: Mapped[int] = mapped_column(Integer, default=0)
+
+class TranscriptionJobRecord(Base):
+    """Durable transcription job: queued -> running (leased by a worker) -> done / failed."""
+    __tablename__ = "transcription_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    username: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    first_name: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    status_message_id: Mapped[int] = mapped_column(BigInteger)
+    file_id: Mapped[str] = mapped_column(String)
+    file_unique_id: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    file_path: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    file_size: Mapped[int] = mapped_column(BigInteger, default=0)
+    mime_type: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    duration: Mapped[float] = mapped_column(Float, default=0.0)
+    duration_exact: Mapped[bool] = mapped_column(Boolean, default=False)
+    backend: Mapped[Optional[str]] = mapped_column(String, nullable=True) # None = deployment default
+    file_name: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    hold_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True) # balance_holds.id
+    # Album (media group): all files share batch_id and one combined result
+    batch_id: Mapped[Optional[str]] = mapped_column(String, nullable=True, index=True)
+    batch_index: Mapped[int] = mapped_column(Integer, default=0)
+    batch_size: Mapped[int] = mapped_column(Integer, default=1)
+
+    state: Mapped[str] = mapped_column(String, default="queued", index=True) # queued, running, done, failed
+    # Deferred job (upstream down): not claimable before this time
+    available_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    lease_owner: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    lease_expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    claimed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True) # last taken by a worker
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+
+    # Set once, so a job retried after a crash is neither billed nor delivered twice
+    result_text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    result_status: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    result_trimmed_duration: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    result_segments: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    voice_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True) # set when charged
+    charged_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    delivered_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    # A worker is sending the result until then; past it (worker died mid-send) delivery can be taken again
+    delivering_until: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
 engine = create_async_engine(DATABASE_URL, echo=False)
 async_session = async_sessionmaker(engine, expire_on_commit=False)
 
@@ -75,54 +185,143 @@ async def init_db():
     retries = 5
     while retries > 0:
         try:
-            async with engine.begin() as conn:
-                # Note: This won't migrate existing tables if columns change. 
-                # In prod we should use alembic, but for now we might need to drop tables manually if schema changes drastically.
-                # Since we are changing User schema significantly, assume we handle it (or use a fresh DB).
-                await conn.run_sync(Base.metadata.create_all)
+            # Tables from the models on a new database, then scripts/migrations/*.sql not applied yet
+            applied = await migrate(engine, Base.metadata)
+            if applied:
+                logging.info(f"Database migrated: {', '.join(map(str, applied))}")
             return
         except Exception as e:
             retries -= 1
             if retries == 0:
                 raise e
-            import asyncio
-            import logging
             logging.warning(f"Database not ready, retrying in 5 seconds... ({retries} attempts left)")
             await asyncio.sleep(5)
 
-async def get_or_create_user(user_id: int, username: str, first_name: str):
+# --- User touch: last_activity_at is written at most once per USER_ACTIVITY_GRANULARITY_SECONDS ---
+_ACTIVITY_GRANULARITY = timedelta(seconds=USER_ACTIVITY_GRANULARITY_SECONDS)
+
+# user id -> latest activity not written yet; flushed in bulk by run_activity_flush
+_pending_activity: dict[int, datetime] = {}
+
+
+def _user_names(username: Optional[str], first_name: Optional[str]) -> tuple[str, str]:
+    """Telegram leaves either name out for some accounts; stored (and compared) as ""."""
+    return username or "", first_name or ""
+
+
+def touch_user_statement(user_id: int, username: Optional[str], first_name: Optional[str], now: datetime):
+    """
+    Create the user, or update its name and activity - but the row is written only when the
+    name changed or the stored activity is older than the granularity. RETURNING has a row
+    only when something was written.
+    """
+    username, first_name = _user_names(username, first_name)
+    ins = pg_insert(User).values(
+        id=user_id, username=username, first_name=first_name, created_at=now, last_activity_at=now,
+        balance_seconds=0.0, used_free_seconds=0.0, held_seconds=0.0,
+    )
+    return ins.on_conflict_do_update(
+        index_elements=[User.id],
+        set_={
+            "username": ins.excluded.username,
+            "first_name": ins.excluded.first_name,
+            "last_activity_at": func.greatest(User.last_activity_at, ins.excluded.last_activity_at),
+        },
+        where=or_(
+            User.username.is_distinct_from(ins.excluded.username),
+            User.first_name.is_distinct_from(ins.excluded.first_name),
+            User.last_activity_at < ins.excluded.last_activity_at - _ACTIVITY_GRANULARITY,
+        ),
+    ).returning(*_CACHED_USER_COLUMNS)
+
+
+def note_activity(user_id: int, at: datetime) -> None:
+    """Remember activity for the next bulk flush instead of writing the row now."""
+    if at > _pending_activity.get(user_id, datetime.min):
+        _pending_activity[user_id] = at
+
+
+def activity_flush_statement(batch: dict[int, datetime]):
+    """One UPDATE for the whole batch; rows whose stored activity is recent enough are not written."""
+    rows = values(column("id", BigInteger), column("at", DateTime), name="activity").data(sorted(batch.items()))
+    return (
+        update(User)
+        .where(User.id == rows.c.id, User.last_activity_at < rows.c.at - _ACTIVITY_GRANULARITY)
+        .values(last_activity_at=rows.c.at)
+    )
+
+
+async def flush_user_activity() -> int:
+    """
+    Write pending activity timestamps; returns the number of users rows written. Never
+    raises: on failure the batch stays pending for the next flush.
+    """
+    if not _pending_activity:
+        return 0
+    batch = dict(_pending_activity)
+    _pending_activity.clear()
+    try:
+        async with async_session() as session:
+            written = (await session.execute(activity_flush_statement(batch))).rowcount
+            await session.commit()
+            return written
+    except Exception as e:
+        logging.warning("User activity flush of %s users failed, kept for the next one: %s", len(batch), e)
+        for user_id, at in batch.items():
+            note_activity(user_id, at)  # newer activity noted meanwhile wins
+        return 0
+
+
+async def run_activity_flush(interval_seconds: float = USER_ACTIVITY_FLUSH_SECONDS) -> None:
+    """Background loop: bulk-write the activity noted by get_or_create_user and add_voice_message."""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        await flush_user_activity()
+
+
+async def get_or_create_user(user_id: int, username: Optional[str], first_name: Optional[str]) -> None:
+    """
+    Make sure the user exists with its current name. A known user (user_cache) with the
+    same name costs no database call: its activity goes to the next bulk flush. Otherwise
+    one upsert, which writes the row only if something changed (``touch_user_statement``).
+    """
+    now = utc_now()
+    cached = user_cache.get(user_id)
+    if cached is not None and (cached.username, cached.first_name) == _user_names(username, first_name):
+        note_activity(user_id, now)
+        return
+    since = user_cache.begin()
     async with async_session() as session:
-        user = await session.get(User, user_id)
-        if not user:
-            user = User(id=user_id, username=username, first_name=first_name)
-            session.add(user)
-        else:
-            # Update info if changed
-            user.username = username
-            user.first_name = first_name
-            user.last_activity_at = utc_now()
+        row = (await session.execute(touch_user_statement(user_id, username, first_name, now))).first()
         await session.commit()
-        return user
+    if row is not None:
+        _cache_users([row], since)
 
-async def add_voice_message(user_id: int, duration: float, chars: int = 0, process_time: float = 0.0, status: str = "success", error: str = None, text: str = None):
+async def add_voice_message(user_id: int, duration: float, chars: int = 0, process_time: float = 0.0, status: str = "success", error: str = None, text: str = None, trimmed_duration: Optional[float] = None, segments: Optional[str] = None) -> int:
+    now = utc_now()
+    note_activity(user_id, now)
     async with async_session() as session:
         msg = VoiceMessage(
             user_id=user_id,
+            created_at=now,
             duration_seconds=duration,
+            trimmed_duration_seconds=trimmed_duration,
             transcription_length_chars=chars,
             processing_time_seconds=process_time,
             status=status,
             error_reason=error,
-            transcription_text=text
+            transcription_text=text,
+            transcription_segments=segments,
         )
         session.add(msg)
-        
-        # Update user last activity
-        user = await session.get(User, user_id)
-        if user:
-            user.last_activity_at = utc_now()
-            
+        await session.flush()
+        await _bump_user_stats(session, user_id, duration, chars, now)
         await session.commit()
+        return msg.id
+
+async def get_voice_message(voice_message_id: int) -> Optional[VoiceMessage]:
+    async with async_session() as session:
+        return await session.get(VoiceMessage, voice_message_id)
 
 async def add_review(user_id: int, feedback_type: str, content: str = None):
     async with async_session() as session:
@@ -134,38 +333,198 @@ async def add_review(user_id: int, feedback_type: str, content: str = None):
         session.add(review)
         await session.commit()
 
-from sqlalchemy import select
+from sqlalchemy import and_, column, delete, insert, literal_column, or_, select, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
-from src.services.purchased_fifo import fifo_allocate
+from src.services import stats_rollup
+from src.services.purchased_fifo import FREE_SECONDS, available_seconds, split_usage
 
-async def check_user_limit(user_id: int, duration: float) -> tuple[bool, float]:
-    """Returns (True, 0) if allowed, (False, missing_seconds) if limit exceeded."""
+# Columns of a users row kept by user_cache; write-through statements return them
+_CACHED_USER_COLUMNS = (
+    User.id, User.username, User.first_name, User.balance_seconds, User.used_free_seconds, User.held_seconds,
+)
+
+
+def _cache_users(rows, since: int) -> None:
+    """Write-through after commit: ``rows`` returned ``_CACHED_USER_COLUMNS``."""
+    for row in rows:
+        user_cache.put(CachedUser.of(row), since)
+
+
+async def get_user_balance(user_id: int) -> Optional[CachedUser]:
+    """Name and balance of a user from the in-process cache, else one primary-key read. None if unknown."""
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    since = user_cache.begin()
     async with async_session() as session:
         user = await session.get(User, user_id)
         if not user:
-            return True, 0.0 # Allow, will be created later
-        
-        remaining_free = max(0.0, 300 - user.used_free_seconds)
-        total_available = remaining_free + user.balance_seconds
-        
-        if total_available >= duration:
-            return True, 0.0
-        else:
-            missing = duration - total_available
+            return None
+        snapshot = CachedUser.of(user)
+    user_cache.put(snapshot, since)
+    return snapshot
+
+
+async def check_user_limit(user_id: int, duration: float) -> tuple[bool, float]:
+    """Returns (True, 0) if allowed, (False, missing_seconds) if limit exceeded."""
+    user = await get_user_balance(user_id)
+    if not user:
+        return True, 0.0 # Allow, will be created later
+
+    # Seconds already reserved by the user's other admitted jobs are not available
+    total_available = available_seconds(user.used_free_seconds, user.balance_seconds, user.held_seconds)
+
+    if total_available >= duration:
+        return True, 0.0
+    else:
+        missing = duration - total_available
+        return False, missing
+
+# --- Balance holds: admission reserves, billing settles, failure releases ---
+def _available_expr():
+    return func.greatest(0.0, FREE_SECONDS - User.used_free_seconds) + User.balance_seconds - User.held_seconds
+
+
+async def reserve_balance(
+    user_id: int, username: Optional[str], first_name: Optional[str], amounts: list[float], ttl_seconds: float,
+) -> tuple[Optional[list[int]], float]:
+    """
+    Hold ``amounts`` (one per job) against the user's free + purchased seconds, all or nothing.
+    Returns (hold ids in order, 0) or (None, missing seconds). Creates the user if needed.
+
+    The hold is a conditional UPDATE (available - held >= total), so concurrent admissions
+    of the same user cannot together reserve more than there is.
+    """
+    total = sum(amounts)
+    now = utc_now()
+    since = user_cache.begin()
+    async with async_session() as session:
+        # Usually writes nothing: the hold UPDATE below rewrites the row anyway
+        await session.execute(touch_user_statement(user_id, username, first_name, now))
+        hold = (
+            update(User)
+            .where(User.id == user_id, _available_expr() >= total)
+            .values(held_seconds=User.held_seconds + total)
+            .returning(*_CACHED_USER_COLUMNS)
+        )
+        row = (await session.execute(hold)).first()
+        if row is None:
+            user = await session.get(User, user_id)
+            missing = total - available_seconds(user.used_free_seconds, user.balance_seconds, user.held_seconds)
+            await session.rollback()
+            return None, missing
+        expires_at = now + timedelta(seconds=ttl_seconds)
+        rows = [{"user_id": user_id, "seconds": s, "created_at": now, "expires_at": expires_at} for s in amounts]
+        ids = (await session.execute(
+            insert(BalanceHold).returning(BalanceHold.id, sort_by_parameter_order=True), rows
+        )).scalars().all()
+        await session.commit()
+    _cache_users([row], since)
+    return list(ids), 0.0
+
+
+async def resize_balance_hold(hold_id: int, seconds: float) -> Optional[tuple[bool, float]]:
+    """
+    Change a hold to ``seconds`` (the duration measured after download). Growing it is
+    conditional like ``reserve_balance``. Returns (True, 0), (False, missing seconds), or
+    None if the hold no longer exists.
+    """
+    since = user_cache.begin()
+    async with async_session() as session:
+        current = (await session.execute(
+            select(BalanceHold.user_id, BalanceHold.seconds).where(BalanceHold.id == hold_id).with_for_update()
+        )).first()
+        if current is None:
+            return None
+        user_id, held_now = current
+        delta = seconds - held_now
+        conditions = [User.id == user_id]
+        if delta > 0:
+            conditions.append(_available_expr() >= delta)
+        grow = (
+            update(User)
+            .where(*conditions)
+            .values(held_seconds=func.greatest(0.0, User.held_seconds + delta))
+            .returning(*_CACHED_USER_COLUMNS)
+        )
+        row = (await session.execute(grow)).first()
+        if row is None:
+            user = await session.get(User, user_id)
+            missing = delta - available_seconds(user.used_free_seconds, user.balance_seconds, user.held_seconds)
+            await session.rollback()
             return False, missing
+        await session.execute(update(BalanceHold).where(BalanceHold.id == hold_id).values(seconds=seconds))
+        await session.commit()
+    _cache_users([row], since)
+    return True, 0.0
+
+
+def _release_holds_statement(where):
+    """Delete the holds matching ``where`` and take their seconds off users.held_seconds, in one statement."""
+    released = delete(BalanceHold).where(where).returning(BalanceHold.user_id, BalanceHold.seconds).cte("released")
+    per_user = (
+        select(released.c.user_id, func.sum(released.c.seconds).label("seconds"), func.count().label("holds"))
+        .group_by(released.c.user_id)
+        .cte("per_user")
+    )
+    return (
+        update(User)
+        .where(User.id == per_user.c.user_id)
+        .values(held_seconds=func.greatest(0.0, User.held_seconds - per_user.c.seconds))
+        .returning(*_CACHED_USER_COLUMNS, per_user.c.holds)
+        # The ORM cannot sync a multi-table UPDATE; in "fetch" mode it replaced RETURNING with its own
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def release_balance_holds(hold_ids: list[int]) -> None:
+    """Give held seconds back (the job failed or was refused). Already settled or released ids are ignored."""
+    if not hold_ids:
+        return
+    since = user_cache.begin()
+    async with async_session() as session:
+        rows = (await session.execute(_release_holds_statement(BalanceHold.id.in_(hold_ids)))).all()
+        await session.commit()
+    _cache_users(rows, since)
+
+
+async def expire_balance_holds() -> int:
+    """
+    Release holds past ``expires_at`` that no queued or running job refers to: admission
+    crashed before the job was stored, or the job ended without settling. Returns the
+    number of holds released.
+    """
+    live_job = (
+        select(TranscriptionJobRecord.id)
+        .where(TranscriptionJobRecord.hold_id == BalanceHold.id, TranscriptionJobRecord.state.in_(("queued", "running")))
+        .exists()
+    )
+    since = user_cache.begin()
+    async with async_session() as session:
+        rows = (await session.execute(
+            _release_holds_statement((BalanceHold.expires_at < utc_now()) & ~live_job)
+        )).all()
+        await session.commit()
+    _cache_users(rows, since)
+    return sum(row.holds for row in rows)
+
 
 async def update_user_usage(user_id: int, duration: float):
+    since = user_cache.begin()
+    snapshot = None
     async with async_session() as session:
-        user = await session.get(User, user_id)
+        # Row lock: the FIFO deduction below relies on no other charge running for this user
+        user = await session.get(User, user_id, with_for_update=True)
         if user:
-            remaining_free = max(0, 300 - user.used_free_seconds)
+            remaining_free = max(0, FREE_SECONDS - user.used_free_seconds)
             
             if remaining_free > 0:
                 if duration <= remaining_free:
                     user.used_free_seconds += duration
                 else:
                     # Consume all free, rest from balance
-                    user.used_free_seconds = 300.0
+                    user.used_free_seconds = FREE_SECONDS
                     to_deduct = duration - remaining_free
                     user.balance_seconds = max(0.0, user.balance_seconds - to_deduct)
                     await _apply_fifo_deduct(session, user_id, to_deduct)
@@ -176,28 +535,175 @@ async def update_user_usage(user_id: int, duration: float):
                 
             user.last_activity_at = utc_now()
             await session.commit()
+            snapshot = CachedUser.of(user)
+    if snapshot is not None:
+        user_cache.put(snapshot, since)
 
 
-async def _apply_fifo_deduct(session, user_id: int, amount: float) -> None:
-    """Reduce seconds_remaining on successful purchase rows, oldest first."""
-    if amount <= 0:
-        return
-    stmt = (
-        select(Transaction.id, Transaction.seconds_remaining)
+def fifo_deduct_statement(user_id: int, amount: float):
+    """
+    Take ``amount`` seconds from the user's open purchases, oldest first, in one statement:
+    a running SUM over the buckets before each row gives what is still to take when that
+    row is reached (same result as ``purchased_fifo.fifo_allocate``). RETURNING (id, taken).
+
+    The caller must hold the users row lock (a concurrent deduction would read a stale sum).
+    """
+    buckets = (
+        select(
+            Transaction.id.label("id"),
+            Transaction.seconds_remaining.label("remaining"),
+            func.coalesce(
+                func.sum(Transaction.seconds_remaining).over(order_by=Transaction.id, rows=(None, -1)), 0.0
+            ).label("prior_total"),
+        )
         .where(
             Transaction.user_id == user_id,
-            Transaction.status == "success",
-            Transaction.seconds_remaining > 0,
+            # Inline constants, not bind parameters: a generic prepared plan can only use the
+            # partial index ix_transactions_fifo if it sees its predicate literally
+            Transaction.status == literal_column("'success'"),
+            Transaction.seconds_remaining > literal_column("0"),
         )
-        .order_by(Transaction.id.asc())
+        .subquery("open_buckets")
     )
-    rows = (await session.execute(stmt)).all()
-    buckets = [(r[0], float(r[1])) for r in rows]
-    plan = fifo_allocate(buckets, amount)
-    for tx_id, take in plan:
-        tx = await session.get(Transaction, tx_id)
-        if tx:
-            tx.seconds_remaining = max(0.0, tx.seconds_remaining - take)
+    taken = func.least(buckets.c.remaining, amount - buckets.c.prior_total)
+    return (
+        update(Transaction)
+        .where(Transaction.id == buckets.c.id, buckets.c.prior_total < amount)
+        .values(seconds_remaining=func.greatest(0.0, Transaction.seconds_remaining - taken))
+        .returning(Transaction.id, taken.label("taken"))
+    )
+
+
+async def _apply_fifo_deduct(session, user_id: int, amount: float) -> list[tuple[int, float]]:
+    """Reduce seconds_remaining on successful purchase rows, oldest first; returns (tx_id, taken)."""
+    if amount <= 0:
+        return []
+    rows = (await session.execute(fifo_deduct_statement(user_id, amount))).all()
+    return sorted((tx_id, float(taken)) for tx_id, taken in rows)
+
+
+async def _bump_user_stats(session, user_id: int, duration: float, chars: Optional[int], now: datetime) -> None:
+    """Count one new voice_messages row in user_stats (caller commits, same transaction as the insert)."""
+    with_chars = 1 if chars is not None else 0
+    upsert = (
+        pg_insert(UserStats)
+        .values(
+            user_id=user_id, total_msgs=1, total_duration_seconds=duration, total_chars=chars or 0,
+            chars_msgs=with_chars,
+        )
+        .on_conflict_do_update(
+            index_elements=[UserStats.user_id],
+            set_={
+                "total_msgs": UserStats.total_msgs + 1,
+                "total_duration_seconds": UserStats.total_duration_seconds + duration,
+                "total_chars": UserStats.total_chars + (chars or 0),
+                "chars_msgs": UserStats.chars_msgs + with_chars,
+            },
+        )
+        .returning(UserStats.day_counts, UserStats.days_anchor)
+    )
+    # Row locked by the upsert until commit, so the day list cannot change under us
+    raw, anchor = (await session.execute(upsert)).one()
+    counts, anchor = stats_rollup.add(stats_rollup.loads(raw), anchor, now.date())
+    await session.execute(
+        update(UserStats)
+        .where(UserStats.user_id == user_id)
+        .values(day_counts=stats_rollup.dumps(counts), days_anchor=anchor)
+    )
+
+
+async def record_transcription(
+    user_id: int, username: Optional[str], first_name: Optional[str], duration: float,
+    chars: int, process_time: float, status: str, text: str,
+    trimmed_duration: Optional[float] = None, segments: Optional[str] = None, job_id: Optional[int] = None,
+    hold_id: Optional[int] = None,
+) -> Optional[tuple[int, float]]:
+    """
+    Bill a finished transcription in one transaction: settle the job's balance hold, touch
+    the user (creating it if needed), charge the free pool then the purchased one, take the
+    purchased part from purchase rows oldest first, insert the VoiceMessage (counted in
+    user_stats) and, for a queued job, mark it charged.
+
+    Returns ``(voice_message_id, balance_seconds)`` after the charge, or None when ``job_id``
+    was already charged (a retried job) - then nothing is written.
+    """
+    now = utc_now()
+    username, first_name = _user_names(username, first_name)
+    since = user_cache.begin()
+    async with async_session() as session:
+        held = 0.0
+        if hold_id is not None:
+            # Hold row before users row: the same lock order as release_balance_holds
+            settled = (await session.execute(
+                delete(BalanceHold).where(BalanceHold.id == hold_id).returning(BalanceHold.seconds)
+            )).scalar_one_or_none()
+            held = settled or 0.0
+
+        # The upsert takes the row lock, so the usage it returns cannot change before the UPDATE below
+        upsert = (
+            pg_insert(User)
+            .values(id=user_id, username=username, first_name=first_name, created_at=now, last_activity_at=now,
+                    balance_seconds=0.0, used_free_seconds=0.0, held_seconds=0.0)
+            .on_conflict_do_update(
+                index_elements=[User.id],
+                set_={"username": username, "first_name": first_name, "last_activity_at": now},
+            )
+            .returning(User.used_free_seconds, User.balance_seconds)
+        )
+        used_free, balance_before = (await session.execute(upsert)).one()
+        from_free, from_purchased = split_usage(used_free, duration)
+        if from_purchased > balance_before + 1e-6:
+            logging.warning(
+                "record_transcription: user %s charged %.1fs with %.1fs purchased balance (job %s, hold %s)",
+                user_id, from_purchased, balance_before, job_id, hold_id,
+            )
+
+        charge = (
+            update(User)
+            .where(User.id == user_id)
+            .values(
+                used_free_seconds=User.used_free_seconds + from_free,
+                balance_seconds=func.greatest(0.0, User.balance_seconds - from_purchased),
+                held_seconds=func.greatest(0.0, User.held_seconds - held),
+            )
+            .returning(*_CACHED_USER_COLUMNS)
+        )
+        charged = (await session.execute(charge)).one()
+
+        await _apply_fifo_deduct(session, user_id, from_purchased)
+
+        voice = (
+            pg_insert(VoiceMessage)
+            .values(
+                user_id=user_id,
+                created_at=now,
+                duration_seconds=duration,
+                trimmed_duration_seconds=trimmed_duration,
+                transcription_length_chars=chars,
+                processing_time_seconds=process_time,
+                status=status,
+                transcription_text=text,
+                transcription_segments=segments,
+            )
+            .returning(VoiceMessage.id)
+        )
+        voice_message_id = (await session.execute(voice)).scalar_one()
+        await _bump_user_stats(session, user_id, duration, chars, now)
+
+        if job_id is not None:
+            mark = (
+                update(TranscriptionJobRecord)
+                .where(TranscriptionJobRecord.id == job_id, TranscriptionJobRecord.charged_at.is_(None))
+                .values(charged_at=now, voice_message_id=voice_message_id)
+            )
+            if not (await session.execute(mark)).rowcount:
+                # Charged by an earlier attempt of this job: undo everything above
+                await session.rollback()
+                return None
+
+        await session.commit()
+    _cache_users([charged], since)
+    return voice_message_id, float(charged.balance_seconds)
 
 async def create_transaction(
     user_id: int,
@@ -230,17 +736,20 @@ async def get_transaction(tx_id: int):
         return await session.get(Transaction, tx_id)
 
 
+def transaction_by_payment_query(user_id: int, payment_id: str):
+    return (
+        select(Transaction)
+        .where(
+            Transaction.user_id == user_id,
+            Transaction.payment_id == payment_id,
+        )
+        .limit(1)
+    )
+
+
 async def get_transaction_by_payment_id(user_id: int, payment_id: str):
     async with async_session() as session:
-        stmt = (
-            select(Transaction)
-            .where(
-                Transaction.user_id == user_id,
-                Transaction.payment_id == payment_id,
-            )
-            .limit(1)
-        )
-        return (await session.execute(stmt)).scalar_one_or_none()
+        return (await session.execute(transaction_by_payment_query(user_id, payment_id))).scalar_one_or_none()
 
 
 async def get_all_user_ids() -> list[int]:
@@ -252,30 +761,37 @@ async def get_all_user_ids() -> list[int]:
 
 
 async def complete_transaction(tx_id: int, status: str = "success"):
+    since = user_cache.begin()
+    snapshot = None
     async with async_session() as session:
         tx = await session.get(Transaction, tx_id)
-        if tx and tx.status == "pending":
-            tx.status = status
-            if status == "success":
-                tx.seconds_remaining = tx.seconds_added
-                user = await session.get(User, tx.user_id)
-                if user:
-                    user.balance_seconds += tx.seconds_added
-                else:
-                    logging.warning(
-                        "complete_transaction: user %s missing, balance not updated (tx_id=%s)",
-                        tx.user_id,
-                        tx_id,
-                    )
-            await session.commit()
-            return True
-        return False
+        if not tx or tx.status != "pending":
+            return False
+        tx.status = status
+        if status == "success":
+            tx.seconds_remaining = tx.seconds_added
+            user = await session.get(User, tx.user_id, with_for_update=True)
+            if user:
+                user.balance_seconds += tx.seconds_added
+            else:
+                logging.warning(
+                    "complete_transaction: user %s missing, balance not updated (tx_id=%s)",
+                    tx.user_id,
+                    tx_id,
+                )
+        await session.commit()
+        if status == "success" and user:
+            snapshot = CachedUser.of(user)
+    if snapshot is not None:
+        user_cache.put(snapshot, since)
+    return True
 
 
 async def add_balance_seconds(user_id: int, seconds: float) -> bool:
     """Manual credit (support): increases balance and records a FIFO bucket row."""
+    since = user_cache.begin()
     async with async_session() as session:
-        user = await session.get(User, user_id)
+        user = await session.get(User, user_id, with_for_update=True)
         if not user:
             return False
         user.balance_seconds += seconds
@@ -293,48 +809,22 @@ async def add_balance_seconds(user_id: int, seconds: float) -> bool:
         )
         session.add(tx)
         await session.commit()
-        return True
+        snapshot = CachedUser.of(user)
+    user_cache.put(snapshot, since)
+    return True
 
 
 async def get_user_stats(user_id: int):
+    """User card for /start, the balance view and Sheets: one row read (users + user_stats rollup)."""
     async with async_session() as session:
-        # Basic counts
-        stmt_total = select(func.count(VoiceMessage.id)).where(VoiceMessage.user_id == user_id)
-        total_msgs = await session.scalar(stmt_total) or 0
-        
-        # 30 days
-        thirty_days_ago = datetime.now(timezone.utc).timestamp() - 30 * 24 * 60 * 60
-        stmt_30d = select(func.count(VoiceMessage.id)).where(
-            VoiceMessage.user_id == user_id,
-            VoiceMessage.created_at >= datetime.fromtimestamp(thirty_days_ago)
-        )
-        msgs_30d = await session.scalar(stmt_30d) or 0
-        
-        # 7 days
-        seven_days_ago = datetime.now(timezone.utc).timestamp() - 7 * 24 * 60 * 60
-        stmt_7d = select(func.count(VoiceMessage.id)).where(
-            VoiceMessage.user_id == user_id,
-            VoiceMessage.created_at >= datetime.fromtimestamp(seven_days_ago)
-        )
-        msgs_7d = await session.scalar(stmt_7d) or 0
-        
-        # Today
-        today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0).replace(tzinfo=None)
-        stmt_today = select(func.count(VoiceMessage.id)).where(
-            VoiceMessage.user_id == user_id,
-            VoiceMessage.created_at >= today_start
+        stmt = (
+            select(User, UserStats)
+            .outerjoin(UserStats, UserStats.user_id == User.id)
+            .where(User.id == user_id)
         )
-        msgs_today = await session.scalar(stmt_today) or 0
-        
-        # Averages
-        stmt_avg_len = select(func.avg(VoiceMessage.duration_seconds)).where(VoiceMessage.user_id == user_id)
-        avg_length = await session.scalar(stmt_avg_len) or 0
-        
-        stmt_avg_chars = select(func.avg(VoiceMessage.transcription_length_chars)).where(VoiceMessage.user_id == user_id)
-        avg_chars = await session.scalar(stmt_avg_chars) or 0
+        row = (await session.execute(stmt)).first()
+        user, rollup = row if row else (None, None)
 
-        user = await session.get(User, user_id)
-        
         if not user:
             return {
                 "user_id": user_id,
@@ -347,21 +837,454 @@ async def get_user_stats(user_id: int):
                 "avg_length_sec": 0,
                 "avg_chars": 0,
                 "balance_minutes": 0,
-                "free_left_minutes": 5.0 # Default 300 sec
+                "free_left_minutes": FREE_SECONDS / 60
             }
 
-        remaining_free = max(0, 300 - user.used_free_seconds)
-        
+        remaining_free = max(0, FREE_SECONDS - user.used_free_seconds)
+        total_msgs = rollup.total_msgs if rollup else 0
+        avg_length = rollup.total_duration_seconds / total_msgs if total_msgs else 0
+        avg_chars = rollup.total_chars / rollup.chars_msgs if rollup and rollup.chars_msgs else 0
+        counts = stats_rollup.loads(rollup.day_counts) if rollup else []
+        anchor = rollup.days_anchor if rollup else None
+        today = utc_now().date()
+
         return {
             "user_id": user_id,
             "reg_date": user.created_at,
             "last_activity": user.last_activity_at,
             "total_msgs": total_msgs,
-            "msgs_30d": msgs_30d,
-            "msgs_7d": msgs_7d,
-            "msgs_today": msgs_today,
+            "msgs_30d": stats_rollup.last_days(counts, anchor, today, 30),
+            "msgs_7d": stats_rollup.last_days(counts, anchor, today, 7),
+            "msgs_today": stats_rollup.last_days(counts, anchor, today, 1),
             "avg_length_sec": round(float(avg_length), 2),
             "avg_chars": round(float(avg_chars), 2),
             "balance_minutes": round(user.balance_seconds / 60, 1),
             "free_left_minutes": round(remaining_free / 60, 1)
         }
+
+
+def messages_per_day_query(since: datetime, user_id: Optional[int] = None):
+    """voice_messages per (user, UTC day) since ``since``; for one user it is a range scan of ix_voice_messages_user_created."""
+    day = func.date(VoiceMessage.created_at)
+    stmt = (
+        select(VoiceMessage.user_id, day, func.count(VoiceMessage.id))
+        .where(VoiceMessage.created_at >= since)
+        .group_by(VoiceMessage.user_id, day)
+    )
+    if user_id is not None:
+        stmt = stmt.where(VoiceMessage.user_id == user_id)
+    return stmt
+
+
+async def rebuild_user_stats(user_id: Optional[int] = None) -> int:
+    """
+    Recompute user_stats rows from voice_messages (backfill, or repair after manual edits):
+    every user, or only ``user_id``. Blocks inserts into voice_messages while it runs so
+    nothing is counted twice or missed. Returns the number of users written.
+    """
+    today = utc_now().date()
+    since = datetime.combine(today - timedelta(days=stats_rollup.WINDOW_DAYS - 1), datetime.min.time())
+    totals_stmt = select(
+        VoiceMessage.user_id,
+        func.count(VoiceMessage.id),
+        func.coalesce(func.sum(VoiceMessage.duration_seconds), 0.0),
+        func.coalesce(func.sum(VoiceMessage.transcription_length_chars), 0),
+        func.count(VoiceMessage.transcription_length_chars),
+    ).group_by(VoiceMessage.user_id)
+    per_day_stmt = messages_per_day_query(since, user_id)
+    clear_stmt = delete(UserStats)
+    if user_id is not None:
+        totals_stmt = totals_stmt.where(VoiceMessage.user_id == user_id)
+        clear_stmt = clear_stmt.where(UserStats.user_id == user_id)
+    async with async_session() as session:
+        await session.execute(sql_text("LOCK TABLE voice_messages IN SHARE MODE"))
+        per_user_days: dict[int, dict[date, int]] = {}
+        for user_id, d, n in (await session.execute(per_day_stmt)).all():
+            per_user_days.setdefault(user_id, {})[d] = n
+        rows = [
+            {
+                "user_id": user_id,
+                "total_msgs": total,
+                "total_duration_seconds": float(duration),
+                "total_chars": int(chars),
+                "chars_msgs": with_chars,
+                "day_counts": stats_rollup.dumps(stats_rollup.from_history(per_user_days.get(user_id, {}), today)),
+                "days_anchor": today,
+            }
+            for user_id, total, duration, chars, with_chars in (await session.execute(totals_stmt)).all()
+        ]
+        await session.execute(clear_stmt)
+        if rows:
+            await session.execute(insert(UserStats), rows)
+        await session.commit()
+    return len(rows)
+
+
+async def get_cached_transcription(file_unique_id: Optional[str] = None, sha256: Optional[str] = None):
+    """Cache row by file_unique_id, else by sha256; bumps hits/last_hit_at. None on miss."""
+    async with async_session() as session:
+        entry = None
+        if file_unique_id:
+            stmt = select(TranscriptionCacheEntry).where(TranscriptionCacheEntry.file_unique_id == file_unique_id)
+            entry = (await session.execute(stmt)).scalar_one_or_none()
+        if entry is None and sha256:
+            stmt = (
+                select(TranscriptionCacheEntry)
+                .where(TranscriptionCacheEntry.sha256 == sha256)
+                .order_by(TranscriptionCacheEntry.last_hit_at.desc())
+                .limit(1)
+            )
+            entry = (await session.execute(stmt)).scalar_one_or_none()
+        if entry is None:
+            return None
+        entry.hits += 1
+        entry.last_hit_at = utc_now()
+        await session.commit()
+        return entry
+
+
+async def put_cached_transcription(
+    file_unique_id: str, sha256: Optional[str], text: str, duration: float, segments: Optional[str] = None
+) -> None:
+    now = utc_now()
+    values = dict(
+        file_unique_id=file_unique_id,
+        sha256=sha256,
+        text=text,
+        segments=segments,
+        duration_seconds=duration,
+        size_bytes=len(text.encode("utf-8")) + len((segments or "").encode("utf-8")),
+        created_at=now,
+        last_hit_at=now,
+        hits=0,
+    )
+    stmt = pg_insert(TranscriptionCacheEntry).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TranscriptionCacheEntry.file_unique_id],
+        set_={k: stmt.excluded[k] for k in ("sha256", "text", "segments", "duration_seconds", "size_bytes", "last_hit_at")},
+    )
+    async with async_session() as session:
+        await session.execute(stmt)
+        await session.commit()
+
+
+def cache_hits_statement(key_column, batch: dict[str, int], at: datetime):
+    """One UPDATE for hits answered from memory: ``batch`` maps a ``key_column`` value to its hit count."""
+    rows = values(column("key", String), column("n", Integer), name="cache_hits").data(sorted(batch.items()))
+    return (
+        update(TranscriptionCacheEntry)
+        .where(key_column == rows.c.key)
+        .values(
+            hits=TranscriptionCacheEntry.hits + rows.c.n,
+            last_hit_at=func.greatest(TranscriptionCacheEntry.last_hit_at, at),
+        )
+    )
+
+
+async def touch_cached_transcriptions(by_file_unique_id: dict[str, int], by_sha256: dict[str, int]) -> int:
+    """Record hits served by the in-memory tier; returns the number of rows written."""
+    now = utc_now()
+    written = 0
+    async with async_session() as session:
+        if by_file_unique_id:
+            stmt = cache_hits_statement(TranscriptionCacheEntry.file_unique_id, by_file_unique_id, now)
+            written += (await session.execute(stmt)).rowcount
+        if by_sha256:
+            stmt = cache_hits_statement(TranscriptionCacheEntry.sha256, by_sha256, now)
+            written += (await session.execute(stmt)).rowcount
+        await session.commit()
+    return written
+
+
+async def evict_transcription_cache(ttl_days: float, max_bytes: int) -> int:
+    """Drop entries not hit for ttl_days, then the least recently hit ones beyond max_bytes."""
+    cutoff = utc_now() - timedelta(days=ttl_days)
+    running = select(
+        TranscriptionCacheEntry.id,
+        func.sum(TranscriptionCacheEntry.size_bytes)
+        .over(order_by=(TranscriptionCacheEntry.last_hit_at.desc(), TranscriptionCacheEntry.id.desc()))
+        .label("running_bytes"),
+    ).subquery()
+    async with async_session() as session:
+        expired = await session.execute(
+            delete(TranscriptionCacheEntry).where(TranscriptionCacheEntry.last_hit_at < cutoff)
+        )
+        oversize = await session.execute(
+            delete(TranscriptionCacheEntry).where(
+                TranscriptionCacheEntry.id.in_(select(running.c.id).where(running.c.running_bytes > max_bytes))
+            )
+        )
+        await session.commit()
+        return (expired.rowcount or 0) + (oversize.rowcount or 0)
+
+
+
+# --- Durable transcription job queue ---
+async def enqueue_transcription_job(**fields) -> TranscriptionJobRecord:
+    async with async_session() as session:
+        job = TranscriptionJobRecord(state="queued", **fields)
+        session.add(job)
+        await session.commit()
+        return job
+
+
+async def enqueue_transcription_jobs(rows: list[dict]) -> list[TranscriptionJobRecord]:
+    """Several jobs in one transaction (an album)."""
+    async with async_session() as session:
+        jobs = [TranscriptionJobRecord(state="queued", **fields) for fields in rows]
+        session.add_all(jobs)
+        await session.commit()
+        return jobs
+
+
+async def count_queued_transcription_jobs() -> dict[int, int]:
+    """Queued jobs per user_id, oldest user first."""
+    stmt = (
+        select(TranscriptionJobRecord.user_id, func.count(TranscriptionJobRecord.id))
+        .where(TranscriptionJobRecord.state == "queued")
+        .group_by(TranscriptionJobRecord.user_id)
+        .order_by(func.min(TranscriptionJobRecord.id))
+    )
+    async with async_session() as session:
+        return {user_id: n for user_id, n in (await session.execute(stmt)).all()}
+
+
+async def claim_transcription_job(worker_id: str, lease_seconds: float) -> Optional[TranscriptionJobRecord]:
+    """
+    Lease the next queued job to ``worker_id``, round-robin across users: the user served
+    least recently (never served first) goes next, with their oldest job; the oldest job
+    breaks ties. Rows locked by another worker are skipped, not waited on.
+    """
+    served = aliased(TranscriptionJobRecord)
+    last_served = (
+        select(func.max(served.claimed_at))
+        .where(served.user_id == TranscriptionJobRecord.user_id)
+        .scalar_subquery()
+    )
+    now = utc_now()
+    stmt = (
+        select(TranscriptionJobRecord)
+        .where(
+            TranscriptionJobRecord.state == "queued",
+            or_(TranscriptionJobRecord.available_at.is_(None), TranscriptionJobRecord.available_at <= now),
+        )
+        .order_by(last_served.asc().nulls_first(), TranscriptionJobRecord.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    async with async_session() as session:
+        job = (await session.execute(stmt)).scalar_one_or_none()
+        if job is None:
+            return None
+        job.state = "running"
+        job.attempts += 1
+        job.lease_owner = worker_id
+        job.heartbeat_at = now
+        job.claimed_at = now
+        job.lease_expires_at = now + timedelta(seconds=lease_seconds)
+        await session.commit()
+        return job
+
+
+async def heartbeat_transcription_job(job_id: int, worker_id: str, lease_seconds: float) -> bool:
+    """Extend the lease; False if the job is no longer ours (lease expired and was taken over)."""
+    now = utc_now()
+    stmt = (
+        update(TranscriptionJobRecord)
+        .where(
+            TranscriptionJobRecord.id == job_id,
+            TranscriptionJobRecord.lease_owner == worker_id,
+            TranscriptionJobRecord.state == "running",
+        )
+        .values(heartbeat_at=now, lease_expires_at=now + timedelta(seconds=lease_seconds))
+    )
+    async with async_session() as session:
+        result = await session.execute(stmt)
+        await session.commit()
+        return bool(result.rowcount)
+
+
+async def finish_transcription_job(job_id: int, worker_id: str, state: str, error: Optional[str] = None) -> None:
+    """Drop the lease and move the job to ``state`` (done / failed, or back to queued); an error already recorded is kept."""
+    finished_at = utc_now() if state in ("done", "failed") else None
+    values = dict(state=state, finished_at=finished_at, lease_owner=None, lease_expires_at=None)
+    if error is not None:
+        values["error"] = error
+    stmt = (
+        update(TranscriptionJobRecord)
+        .where(TranscriptionJobRecord.id == job_id, TranscriptionJobRecord.lease_owner == worker_id)
+        .values(**values)
+    )
+    async with async_session() as session:
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def defer_transcription_job(job_id: int, worker_id: str, delay_seconds: float, consume_attempt: bool = False) -> None:
+    """Requeue a job that could not run now (upstream down); unless ``consume_attempt``, the try is not counted."""
+    stmt = (
+        update(TranscriptionJobRecord)
+        .where(TranscriptionJobRecord.id == job_id, TranscriptionJobRecord.lease_owner == worker_id)
+        .values(
+            state="queued",
+            available_at=utc_now() + timedelta(seconds=delay_seconds),
+            attempts=TranscriptionJobRecord.attempts - (0 if consume_attempt else 1),
+            lease_owner=None,
+            lease_expires_at=None,
+        )
+    )
+    async with async_session() as session:
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def recover_transcription_jobs(max_attempts: int) -> list[TranscriptionJobRecord]:
+    """
+    Requeue running jobs whose lease expired (the worker crashed or was restarted).
+    Jobs that already used ``max_attempts`` are failed instead and returned, so the
+    caller can tell their users.
+    """
+    now = utc_now()
+    expired = (
+        TranscriptionJobRecord.state == "running",
+        TranscriptionJobRecord.lease_expires_at < now,
+    )
+    since = user_cache.begin()
+    async with async_session() as session:
+        failed = (await session.execute(
+            update(TranscriptionJobRecord)
+            .where(*expired, TranscriptionJobRecord.attempts >= max_attempts)
+            .values(state="failed", error="lease expired", finished_at=now, lease_owner=None, lease_expires_at=None)
+            .returning(TranscriptionJobRecord)
+        )).scalars().all()
+        requeued = await session.execute(
+            update(TranscriptionJobRecord)
+            .where(*expired)
+            .values(state="queued", lease_owner=None, lease_expires_at=None)
+        )
+        hold_ids = [job.hold_id for job in failed if job.hold_id is not None]
+        released = []
+        if hold_ids:
+            released = (await session.execute(_release_holds_statement(BalanceHold.id.in_(hold_ids)))).all()
+        await session.commit()
+    _cache_users(released, since)
+    if requeued.rowcount:
+        logging.warning("transcription_jobs: requeued %s orphaned jobs", requeued.rowcount)
+    return list(failed)
+
+
+async def save_transcription_job_result(
+    job_id: int, text: str, status: str, duration: float, trimmed_duration: Optional[float] = None,
+    segments: Optional[str] = None,
+) -> None:
+    """Keep the transcript (and the measured duration) so a retry skips straight to billing/delivery."""
+    stmt = (
+        update(TranscriptionJobRecord)
+        .where(TranscriptionJobRecord.id == job_id, TranscriptionJobRecord.result_text.is_(None))
+        .values(
+            result_text=text, result_status=status, result_trimmed_duration=trimmed_duration,
+            result_segments=segments, duration=duration, duration_exact=True,
+        )
+    )
+    async with async_session() as session:
+        await session.execute(stmt)
+        await session.commit()
+
+
+def _delivery_free(now: datetime):
+    """Not delivered, and nobody is sending it (or the sender's lease ran out)."""
+    return and_(
+        TranscriptionJobRecord.delivered_at.is_(None),
+        or_(TranscriptionJobRecord.delivering_until.is_(None), TranscriptionJobRecord.delivering_until < now),
+    )
+
+
+async def claim_transcription_delivery(job_id: int, lease_seconds: float) -> str:
+    """
+    Take the job's delivery for ``lease_seconds``. Returns "claimed", "delivered" (sent
+    already, or the job is gone) or "busy" (another worker is sending it right now).
+    The claim ends with ``finish_transcription_delivery`` or ``release_transcription_delivery``.
+    """
+    now = utc_now()
+    stmt = (
+        update(TranscriptionJobRecord)
+        .where(TranscriptionJobRecord.id == job_id, _delivery_free(now))
+        .values(delivering_until=now + timedelta(seconds=lease_seconds))
+        .returning(TranscriptionJobRecord.id)
+    )
+    async with async_session() as session:
+        if (await session.execute(stmt)).first() is not None:
+            await session.commit()
+            return "claimed"
+        row = (await session.execute(
+            select(TranscriptionJobRecord.delivered_at).where(TranscriptionJobRecord.id == job_id)
+        )).first()
+    return "delivered" if row is None or row.delivered_at is not None else "busy"
+
+
+async def finish_transcription_delivery(job_ids: list[int]) -> None:
+    """The result reached the user: delivered for good."""
+    stmt = (
+        update(TranscriptionJobRecord)
+        .where(TranscriptionJobRecord.id.in_(job_ids))
+        .values(delivered_at=utc_now(), delivering_until=None)
+    )
+    async with async_session() as session:
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def release_transcription_delivery(job_ids: list[int]) -> None:
+    """Sending failed: give the delivery up so the next attempt can take it at once."""
+    stmt = (
+        update(TranscriptionJobRecord)
+        .where(TranscriptionJobRecord.id.in_(job_ids), TranscriptionJobRecord.delivered_at.is_(None))
+        .values(delivering_until=None)
+    )
+    async with async_session() as session:
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def record_transcription_job_error(job_id: int, error: str) -> None:
+    """The file could not be transcribed; for an album this is its entry in the combined result."""
+    stmt = update(TranscriptionJobRecord).where(TranscriptionJobRecord.id == job_id).values(error=error)
+    async with async_session() as session:
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def claim_transcription_batch(batch_id: str, lease_seconds: float) -> tuple[str, list[TranscriptionJobRecord]]:
+    """
+    Take the album's delivery for ``lease_seconds`` once every file has a result or an error.
+    Returns ("claimed", the album's jobs in order), or with no jobs "pending" (files still
+    running), "delivered" or "busy" (another worker is sending it). Ends like a single
+    job's claim: ``finish_transcription_delivery`` or ``release_transcription_delivery``.
+    """
+    in_batch = TranscriptionJobRecord.batch_id == batch_id
+    unfinished = (
+        select(func.count(TranscriptionJobRecord.id))
+        .where(
+            in_batch,
+            TranscriptionJobRecord.result_text.is_(None),
+            TranscriptionJobRecord.error.is_(None),
+            TranscriptionJobRecord.state != "failed",
+        )
+    )
+    now = utc_now()
+    async with async_session() as session:
+        if (await session.execute(unfinished)).scalar():
+            return "pending", []
+        claimed = (await session.execute(
+            update(TranscriptionJobRecord)
+            .where(in_batch, _delivery_free(now))
+            .values(delivering_until=now + timedelta(seconds=lease_seconds))
+            .returning(TranscriptionJobRecord)
+        )).scalars().all()
+        if claimed:
+            await session.commit()
+            return "claimed", sorted(claimed, key=lambda job: job.batch_index)
+        undelivered = (await session.execute(
+            select(func.count(TranscriptionJobRecord.id)).where(in_batch, TranscriptionJobRecord.delivered_at.is_(None))
+        )).scalar()
+    return ("busy" if undelivered else "delivered"), []
@@ -0,0 +1,143 @@
+"""Hedged requests: when a call is slower than usual, race a second one against it.
+
+"Usual" is the rolling p95 latency of calls for audio of similar length
+(``LatencyTracker``). Extra calls are paid for, so ``HedgeBudget`` lets only a
+fixed share of calls be hedged.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, Sequence, TypeVar
+
+from src.services import metrics
+
+T = TypeVar("T")
+
+_hedges = metrics.counter("whisper_hedges_total", "Hedged requests by outcome")
+_latency_pct = metrics.gauge("whisper_latency_seconds", "Rolling Whisper latency percentiles by audio duration bucket")
+
+# Upper edges (seconds of audio) of the duration buckets; the last bucket is open-ended
+DEFAULT_BUCKETS = (30.0, 120.0, 300.0, 600.0)
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile, ``q`` in [0, 100]."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))  # ceil
+    return ordered[int(rank) - 1]
+
+
+class LatencyTracker:
+    """Last ``window`` latencies per duration bucket."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, window: int = 200, min_samples: int = 20):
+        self.buckets = tuple(buckets)
+        self.min_samples = min_samples
+        self._samples = [deque(maxlen=window) for _ in range(len(self.buckets) + 1)]
+
+    def bucket_of(self, duration: float) -> int:
+        return bisect.bisect_left(self.buckets, duration)
+
+    def bucket_label(self, index: int) -> str:
+        low = 0 if index == 0 else int(self.buckets[index - 1])
+        return f"{low}-{int(self.buckets[index])}s" if index < len(self.buckets) else f"{low}s+"
+
+    def observe(self, duration: float, latency: float) -> None:
+        index = self.bucket_of(duration)
+        samples = self._samples[index]
+        samples.append(latency)
+        label = self.bucket_label(index)
+        for q in (50, 95, 99):
+            _latency_pct.set(percentile(samples, q), bucket=label, quantile=str(q / 100))
+
+    def quantile(self, duration: float, q: float) -> Optional[float]:
+        """The ``q``-th percentile for this duration, None until ``min_samples`` were seen."""
+        samples = self._samples[self.bucket_of(duration)]
+        if len(samples) < self.min_samples:
+            return None
+        return percentile(samples, q)
+
+    def snapshot(self, q: float = 95) -> dict[str, Optional[float]]:
+        return {
+            self.bucket_label(i): (percentile(s, q) if s else None)
+            for i, s in enumerate(self._samples)
+        }
+
+
+class HedgeBudget:
+    """Each primary call earns ``ratio`` of a hedge; a hedge spends one. At most ``burst`` saved up."""
+
+    def __init__(self, ratio: float, burst: float = 5.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = min(1.0, burst)
+
+    def earn(self) -> None:
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+async def hedged(
+    primary: Callable[[], Awaitable[T]],
+    secondary: Callable[[], Awaitable[T]],
+    delay: Optional[float],
+    budget: HedgeBudget,
+    on_latency: Callable[[float], None] = lambda latency: None,
+) -> T:
+    """
+    Run ``primary``; if it is still pending after ``delay`` seconds and the budget allows,
+    start ``secondary`` too. The first successful result wins and the other call is
+    cancelled; if one fails, the other one's outcome is used. ``on_latency`` gets the
+    latency of every call that completed successfully.
+    """
+    budget.earn()
+
+    async def timed(call: Callable[[], Awaitable[T]]) -> T:
+        started = time.monotonic()
+        result = await call()
+        on_latency(time.monotonic() - started)
+        return result
+
+    first = asyncio.ensure_future(timed(primary))
+    if delay is None:
+        return await first
+    try:
+        done, _ = await asyncio.wait({first}, timeout=delay)
+    except BaseException:
+        first.cancel()
+        raise
+    if done:
+        _hedges.inc(outcome="primary")  # answered within the delay, no hedge needed
+        return first.result()
+    if not budget.try_spend():
+        _hedges.inc(outcome="budget_exhausted")
+        return await first
+
+    _hedges.inc(outcome="fired")
+    second = asyncio.ensure_future(timed(secondary))
+    pending = {first, second}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    _hedges.inc(outcome="hedge_won" if task is second else "hedge_lost")
+                    return task.result()
+                error = task.exception()
+                logging.warning(f"Hedged request failed, waiting for the other one: {error}")
+        _hedges.inc(outcome="both_failed")
+        raise error
+    finally:
+        for task in (first, second):
+            task.cancel()
@@ -0,0 +1,251 @@
+"""Connection pools for every outbound HTTP client, in one place.
+
+- OpenAI: an ``httpx.AsyncClient`` (HTTP/2 when ``h2`` is installed, so parallel
+  chunk uploads share one TLS connection).
+- Telegram: aiogram's ``AiohttpSession`` with per-host limits, keep-alive and a DNS cache.
+- YooKassa: the SDK opens and closes a ``requests`` session per call; it is handed one
+  pooled session instead, with connect/read timeouts (the SDK sets none).
+
+Pools are created lazily, once per process, and ``warm_up`` opens the first connections
+at startup so the first user request does not pay for DNS and TLS.
+
+aiogram has no public setting for its connector and the YooKassa SDK none for its
+session, so both are configured through the nearest hook (see ``telegram_session`` and
+``install_yookassa_session``); the pool metrics read client internals. Each of those
+degrades to the library default or a missing sample, never to an error.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import logging
+from typing import Optional
+
+import httpx
+import requests
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiohttp import ClientSession
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.config import (
+    DNS_CACHE_SECONDS,
+    HTTP2_ENABLED,
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+    HTTP_KEEPALIVE_SECONDS,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_PER_HOST,
+    HTTP_READ_TIMEOUT_SECONDS,
+    WHISPER_ATTEMPT_TIMEOUT_SECONDS,
+)
+from src.services import metrics
+
+OPENAI_BASE_URL = "https://api.openai.com/v1/"
+YOOKASSA_BASE_URL = "https://api.yookassa.ru/v3/"
+
+_openai_client: Optional[httpx.AsyncClient] = None
+_telegram_sessions: list["_TelegramSession"] = []
+_yookassa_session: Optional["_PooledSession"] = None
+_sdk_get_session = None  # ApiClient.get_session before install_yookassa_session
+
+
+# --- OpenAI ---
+def openai_http_client() -> httpx.AsyncClient:
+    """The process-wide httpx client for the OpenAI SDK (``AsyncOpenAI(http_client=...)``)."""
+    global _openai_client
+    if _openai_client is None:
+        http2 = HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+        _openai_client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_PER_HOST,
+                keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+            ),
+            # Whisper answers only after it has transcribed the upload: read timeout = attempt timeout
+            timeout=httpx.Timeout(WHISPER_ATTEMPT_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+        )
+        logging.info("OpenAI HTTP pool: http2=%s, max %s connections", http2, HTTP_MAX_CONNECTIONS)
+    return _openai_client
+
+
+# --- Telegram ---
+class _TelegramSession(AiohttpSession):
+    """Keeps the aiohttp session it creates, for the pool metrics."""
+
+    client_session: Optional[ClientSession] = None
+
+    async def create_session(self) -> ClientSession:
+        self.client_session = await super().create_session()
+        return self.client_session
+
+
+def telegram_session() -> AiohttpSession:
+    """A new aiogram session with the shared pool settings (``Bot(token, session=...)``)."""
+    session = _TelegramSession(limit=HTTP_MAX_CONNECTIONS, timeout=HTTP_READ_TIMEOUT_SECONDS)
+    # aiogram builds its TCPConnector from these kwargs when the session is first used;
+    # only ``limit`` is a public parameter
+    connector_init = getattr(session, "_connector_init", None)
+    if isinstance(connector_init, dict):
+        connector_init.update(
+            limit_per_host=HTTP_MAX_PER_HOST,
+            ttl_dns_cache=DNS_CACHE_SECONDS,
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+        )
+    else:
+        logging.warning("aiogram session has no connector settings: Telegram pool uses aiogram defaults")
+    _telegram_sessions.append(session)
+    return session
+
+
+# --- YooKassa ---
+class _TimeoutAdapter(HTTPAdapter):
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = (HTTP_CONNECT_TIMEOUT_SECONDS, HTTP_READ_TIMEOUT_SECONDS)
+        return super().send(request, **kwargs)
+
+
+class _PooledSession(requests.Session):
+    """Survives the SDK's ``session.close()`` after every call; ``shutdown`` really closes it."""
+
+    def close(self) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        super().close()
+
+
+def yookassa_session() -> requests.Session:
+    global _yookassa_session
+    if _yookassa_session is None:
+        session = _PooledSession()
+        # Same retry policy the SDK mounts on its own sessions (202 = "still processing")
+        retries = Retry(total=3, backoff_factor=1.8, allowed_methods=["POST"], status_forcelist=[202])
+        session.mount("https://", _TimeoutAdapter(pool_connections=4, pool_maxsize=HTTP_MAX_PER_HOST, max_retries=retries))
+        _yookassa_session = session
+    return _yookassa_session
+
+
+def install_yookassa_session() -> None:
+    """
+    Make the YooKassa SDK use the pooled session instead of a new one per request. The SDK
+    creates its ``ApiClient`` inside every call and takes no session from outside, so
+    ``get_session`` is replaced on the class; idempotent, undone by ``uninstall_yookassa_session``.
+    """
+    global _sdk_get_session
+    from yookassa.client import ApiClient
+
+    if _sdk_get_session is None:
+        _sdk_get_session = ApiClient.get_session
+        ApiClient.get_session = lambda self: yookassa_session()
+
+
+def uninstall_yookassa_session() -> None:
+    global _sdk_get_session
+    from yookassa.client import ApiClient
+
+    if _sdk_get_session is not None:
+        ApiClient.get_session = _sdk_get_session
+        _sdk_get_session = None
+
+
+# --- Startup / shutdown ---
+async def warm_up(bot=None, openai: bool = False, yookassa: bool = False) -> None:
+    """Resolve DNS and complete TLS handshakes before the first real request. Best effort."""
+    async def touch(name: str, coro) -> None:
+        try:
+            await coro
+        except Exception as e:
+            logging.info("HTTP warm-up of %s failed: %s", name, e)
+
+    tasks = []
+    if bot is not None:
+        tasks.append(touch("telegram", bot.get_me()))
+    if openai:
+        tasks.append(touch("openai", openai_http_client().head(OPENAI_BASE_URL)))
+    if yookassa:
+        tasks.append(touch("yookassa", asyncio.to_thread(yookassa_session().head, YOOKASSA_BASE_URL)))
+    await asyncio.gather(*tasks)
+
+
+async def close_all() -> None:
+    global _openai_client, _yookassa_session
+    if _openai_client is not None:
+        await _openai_client.aclose()
+        _openai_client = None
+    for session in _telegram_sessions:
+        await session.close()
+    _telegram_sessions.clear()
+    if _yookassa_session is not None:
+        _yookassa_session.shutdown()
+        _yookassa_session = None
+
+
+# --- Pool utilization (reads client internals; a missing attribute just drops the sample) ---
+def _openai_pool() -> list[tuple[dict, float]]:
+    # httpx exposes no pool state; its transport wraps an httpcore pool with public ``connections``
+    pool = getattr(getattr(_openai_client, "_transport", None), "_pool", None)
+    if pool is None:
+        return []
+    connections = pool.connections
+    idle = sum(1 for c in connections if c.is_idle())
+    return [
+        ({"client": "openai", "state": "active"}, len(connections) - idle),
+        ({"client": "openai", "state": "idle"}, idle),
+    ]
+
+
+def _telegram_pool() -> list[tuple[dict, float]]:
+    active = idle = 0
+    for session in _telegram_sessions:
+        client = session.client_session
+        if client is None or client.closed:
+            continue
+        # aiohttp keeps no public connection counts
+        connector = client.connector
+        active += len(getattr(connector, "_acquired", ()))
+        idle += sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+    return [
+        ({"client": "telegram", "state": "active"}, active),
+        ({"client": "telegram", "state": "idle"}, idle),
+    ]
+
+
+def _yookassa_pool() -> list[tuple[dict, float]]:
+    if _yookassa_session is None:
+        return []
+    active = idle = 0
+    for adapter in _yookassa_session.adapters.values():
+        if not isinstance(adapter, HTTPAdapter):
+            continue
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            free = pool.pool.qsize() if pool.pool is not None else 0
+            # the queue holds None placeholders for never-opened slots
+            opened = pool.num_connections
+            idle += min(free, opened)
+            active += max(0, opened - free)
+    return [
+        ({"client": "yookassa", "state": "active"}, active),
+        ({"client": "yookassa", "state": "idle"}, idle),
+    ]
+
+
+def _pool_samples() -> list[tuple[dict, float]]:
+    samples: list[tuple[dict, float]] = []
+    for sampler in (_openai_pool, _telegram_pool, _yookassa_pool):
+        try:
+            samples.extend(sampler())
+        except (AttributeError, TypeError) as e:
+            logging.debug("pool sampler %s: %s", sampler.__name__, e)
+    return samples
+
+
+metrics.gauge("http_pool_connections", "Open HTTP connections per client, active vs idle", fn=_pool_samples)
+metrics.gauge("http_pool_limit", "Configured connection limits", fn=lambda: [
+    ({"scope": "total"}, HTTP_MAX_CONNECTIONS),
+    ({"scope": "per_host"}, HTTP_MAX_PER_HOST),
+])
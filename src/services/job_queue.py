@@ -0,0 +1,217 @@
+"""Job queue served by a fixed pool of workers, round-robin across users.
+
+``DurableQueue`` keeps jobs in the Postgres ``transcription_jobs`` table, leased to
+workers with heartbeats, so a restart loses nothing: orphaned jobs are requeued once
+their lease expires. Users are served round-robin, so a user who dumps 50 files
+cannot starve the rest.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+from typing import Any, Awaitable, Callable, Generic, Iterable, Optional, TypeVar
+
+from src.config import JOB_HEARTBEAT_SECONDS, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_POLL_SECONDS
+from src.services import db_service, metrics
+
+T = TypeVar("T")
+
+_wait_seconds = metrics.summary("job_queue_wait_seconds", "Time a job spent queued before a worker took it")
+_jobs_total = metrics.counter("job_queue_jobs_total", "Jobs by outcome")
+_busy_workers = metrics.gauge("job_queue_busy_workers", "Workers currently running a job")
+
+
+class RetryLater(Exception):
+    """
+    Raised by a handler to put its job back in the queue for ``delay`` seconds (e.g. upstream
+    down). With ``consume_attempt`` False the try does not count towards JOB_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, delay: float, reason: str = "", consume_attempt: bool = False):
+        super().__init__(reason or f"retry in {delay:.0f}s")
+        self.delay = delay
+        self.consume_attempt = consume_attempt
+
+
+def fair_position(index: int, other_counts: Iterable[int]) -> int:
+    """
+    Upper bound on the 1-based serving position of a user's ``index``-th queued job when
+    users are served round-robin: everyone else gets up to ``index + 1`` turns first.
+    """
+    return index + 1 + sum(min(n, index + 1) for n in other_counts)
+
+
+class DurableQueue(Generic[T]):
+    """
+    Jobs in ``transcription_jobs``. ``get`` claims the next row with
+    ``FOR UPDATE SKIP LOCKED`` (the user served least recently first), ``hold`` keeps the
+    lease alive while the job runs, and ``recover`` requeues jobs whose worker died.
+    """
+
+    def __init__(self, from_record: Callable[[Any], T], job_id: Callable[[T], int]):
+        self.from_record = from_record
+        self.job_id = job_id
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._depth = 0
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def _event(self) -> asyncio.Event:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        return self._wakeup
+
+    def __len__(self) -> int:
+        # Last depth seen by put/pending_for; cheap enough for a metrics gauge
+        return self._depth
+
+    async def pending_for(self, user_id: int) -> int:
+        counts = await db_service.count_queued_transcription_jobs()
+        self._depth = sum(counts.values())
+        return counts.get(user_id, 0)
+
+    async def put(self, user_id: int, fields: dict) -> tuple[T, int]:
+        """Persist a job; returns it and its (approximate) queue position."""
+        record = await db_service.enqueue_transcription_job(user_id=user_id, **fields)
+        self._event().set()
+        counts = await db_service.count_queued_transcription_jobs()
+        self._depth = sum(counts.values())
+        own = counts.pop(user_id, 1)
+        return self.from_record(record), fair_position(own - 1, counts.values())
+
+    async def put_many(self, user_id: int, rows: list[dict]) -> tuple[list[T], int]:
+        """Persist several jobs in one transaction; returns them and the position of the first."""
+        records = await db_service.enqueue_transcription_jobs([dict(fields, user_id=user_id) for fields in rows])
+        self._event().set()
+        counts = await db_service.count_queued_transcription_jobs()
+        self._depth = sum(counts.values())
+        own = counts.pop(user_id, len(records))
+        return [self.from_record(r) for r in records], fair_position(max(0, own - len(records)), counts.values())
+
+    async def get(self) -> tuple[T, float]:
+        while True:
+            try:
+                record = await db_service.claim_transcription_job(self.worker_id, JOB_LEASE_SECONDS)
+            except Exception as e:
+                logging.warning("Job queue: claim failed: %s", e)
+                record = None
+            if record is not None:
+                waited = (db_service.utc_now() - record.created_at).total_seconds()
+                return self.from_record(record), max(0.0, waited)
+            # Other processes enqueue too, so poll; a local put wakes us early
+            event = self._event()
+            event.clear()
+            try:
+                await asyncio.wait_for(event.wait(), JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def hold(self, item: T) -> None:
+        """Heartbeat until cancelled; returns if the lease was lost to another worker."""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                owned = await db_service.heartbeat_transcription_job(self.job_id(item), self.worker_id, JOB_LEASE_SECONDS)
+            except Exception as e:
+                # A missed beat is fine as long as the lease has not run out
+                logging.warning("Job queue: heartbeat failed: %s", e)
+                continue
+            if not owned:
+                logging.warning("Job queue: lost lease on job %s", self.job_id(item))
+                return
+
+    async def done(self, item: T) -> None:
+        await db_service.finish_transcription_job(self.job_id(item), self.worker_id, "done")
+
+    async def failed(self, item: T, error: str) -> None:
+        await db_service.finish_transcription_job(self.job_id(item), self.worker_id, "failed", error[:500])
+
+    async def release(self, item: T) -> None:
+        """Give an interrupted job back to the queue right away instead of waiting for the lease."""
+        await db_service.finish_transcription_job(self.job_id(item), self.worker_id, "queued")
+
+    async def defer(self, item: T, delay: float, consume_attempt: bool = False) -> None:
+        """Back to the queue, not claimable for ``delay`` seconds."""
+        await db_service.defer_transcription_job(self.job_id(item), self.worker_id, delay, consume_attempt)
+
+    async def recover(self) -> list[T]:
+        """Requeue orphaned jobs; returns those that ran out of attempts (now failed)."""
+        failed = await db_service.recover_transcription_jobs(JOB_MAX_ATTEMPTS)
+        return [self.from_record(r) for r in failed]
+
+    async def run_recovery(self, on_failed: Callable[[T], Awaitable[None]]) -> None:
+        """Background loop: a recovery pass every heartbeat interval, the first one right away."""
+        while True:
+            try:
+                for item in await self.recover():
+                    await on_failed(item)
+            except Exception as e:
+                logging.warning("Job queue: recovery failed: %s", e)
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+
+
+class WorkerPool(Generic[T]):
+    """``workers`` tasks pulling from a DurableQueue (or anything with its interface) and running ``handler`` on each job."""
+
+    def __init__(self, queue, workers: int):
+        self.queue = queue
+        self.workers = max(1, workers)
+        self._tasks: list[asyncio.Task] = []
+        metrics.gauge("job_queue_depth", "Jobs waiting in the queue", fn=lambda: len(self.queue))
+
+    def start(self, handler: Callable[[T], Awaitable[None]]) -> None:
+        for n in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._run(n, handler)))
+        logging.info("Job queue: %s workers started", self.workers)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _run(self, n: int, handler: Callable[[T], Awaitable[None]]) -> None:
+        while True:
+            job, waited = await self.queue.get()
+            _wait_seconds.observe(waited)
+            _busy_workers.inc()
+            work = asyncio.create_task(handler(job))
+            lease = asyncio.create_task(self.queue.hold(job))
+            try:
+                await asyncio.wait({work, lease}, return_when=asyncio.FIRST_COMPLETED)
+                if not work.done():
+                    # Lease lost: someone else owns the job now
+                    work.cancel()
+                    await asyncio.gather(work, return_exceptions=True)
+                    _jobs_total.inc(outcome="lost")
+                    continue
+                lease.cancel()
+                error = work.exception()
+                if error is None:
+                    await self.queue.done(job)
+                    _jobs_total.inc(outcome="done")
+                elif isinstance(error, RetryLater):
+                    logging.info("Job queue worker %s: job deferred for %.0fs (%s)", n, error.delay, error)
+                    await self.queue.defer(job, error.delay, error.consume_attempt)
+                    _jobs_total.inc(outcome="deferred")
+                else:
+                    # handler reports to the user itself; a failure must not kill the worker
+                    logging.error("Job queue worker %s: job failed", n, exc_info=error)
+                    await self.queue.failed(job, repr(error))
+                    _jobs_total.inc(outcome="failed")
+            except asyncio.CancelledError:
+                work.cancel()
+                lease.cancel()
+                await asyncio.gather(work, lease, return_exceptions=True)
+                if not work.cancelled() and work.exception() is None:
+                    await self.queue.done(job)
+                else:
+                    await self.queue.release(job)
+                raise
+            except Exception:
+                logging.exception("Job queue worker %s: could not record job outcome", n)
+            finally:
+                lease.cancel()
+                _busy_workers.dec()
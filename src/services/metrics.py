@@ -0,0 +1,156 @@
+"""In-process counters and gauges, exported in Prometheus text format.
+
+Served on ``/metrics`` when METRICS_PORT is set and shown to the admin by ``/admin_metrics``.
+Values are per process (bot and each worker export their own).
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Callable, Optional
+
+_LabelKey = tuple[tuple[str, str], ...]
+
+
+def _key(labels: dict) -> _LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(key: _LabelKey) -> str:
+    if not key:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in key)
+    return "{" + inner + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: dict[_LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def value(self, **labels) -> float:
+        return self._values.get(_key(labels), 0.0)
+
+    def samples(self) -> list[tuple[str, _LabelKey, float]]:
+        with self._lock:
+            return [(self.name, k, v) for k, v in sorted(self._values.items())]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        k = _key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help_text)
+        self._fn = fn
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        k = _key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self) -> list[tuple[str, _LabelKey, float]]:
+        if self._fn is not None:
+            try:
+                value = self._fn()
+                # A callback may return one value, or (labels, value) pairs for a labelled gauge
+                if isinstance(value, list):
+                    for labels, v in value:
+                        self.set(v, **labels)
+                else:
+                    self.set(value)
+            except Exception as e:
+                logging.debug("gauge %s callback failed: %s", self.name, e)
+        return super().samples()
+
+
+class Summary(_Metric):
+    """Count and sum of observations (e.g. wait time), enough for averages and rates."""
+
+    kind = "summary"
+
+    def observe(self, value: float, **labels) -> None:
+        k = _key(labels)
+        with self._lock:
+            self._values[k + (("__part", "count"),)] = self._values.get(k + (("__part", "count"),), 0.0) + 1
+            self._values[k + (("__part", "sum"),)] = self._values.get(k + (("__part", "sum"),), 0.0) + value
+
+    def samples(self) -> list[tuple[str, _LabelKey, float]]:
+        out = []
+        for name, key, v in super().samples():
+            part = dict(key)["__part"]
+            out.append((f"{name}_{part}", tuple(kv for kv in key if kv[0] != "__part"), v))
+        return out
+
+
+_registry: dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(cls, name: str, help_text: str, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = cls(name, help_text, **kwargs)
+            _registry[name] = metric
+        return metric
+
+
+def counter(name: str, help_text: str) -> Counter:
+    return _get_or_create(Counter, name, help_text)
+
+
+def gauge(name: str, help_text: str, fn: Optional[Callable[[], float]] = None) -> Gauge:
+    return _get_or_create(Gauge, name, help_text, fn=fn)
+
+
+def summary(name: str, help_text: str) -> Summary:
+    return _get_or_create(Summary, name, help_text)
+
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format."""
+    lines: list[str] = []
+    for name in sorted(_registry):
+        metric = _registry[name]
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for sample_name, key, value in metric.samples():
+            lines.append(f"{sample_name}{_fmt_labels(key)} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+async def start_metrics_server(port: int):
+    """Serve ``GET /metrics`` on ``port`` (aiohttp ships with aiogram). Returns the runner."""
+    from aiohttp import web
+
+    async def handle(_request):
+        return web.Response(text=render(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    logging.info("Metrics on :%s/metrics", port)
+    return runner
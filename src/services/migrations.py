@@ -0,0 +1,150 @@
+"""Versioned schema migrations: ``scripts/migrations/NNN_name.sql``, applied once, in order.
+
+Applied versions are recorded in ``schema_migrations``. On the first boot with the runner
+(a new database, or one that predates it) the models' ``create_all`` creates whatever
+tables are missing; after that, schema changes go only through migration files, so a new
+table needs its ``CREATE TABLE IF NOT EXISTS`` in a migration too.
+
+A file runs in one transaction together with its ``schema_migrations`` row. A file with
+``CREATE INDEX CONCURRENTLY`` cannot run inside a transaction: its statements run one by
+one in autocommit mode, so it must be safe to re-run (``IF NOT EXISTS``) after a failure.
+
+Several processes start at once (bot, workers); a Postgres advisory lock lets one of them
+migrate while the others wait. The lock is polled rather than waited on: a session blocked
+in ``pg_advisory_lock`` would hold a snapshot that ``CREATE INDEX CONCURRENTLY`` waits for.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterable
+
+from sqlalchemy import MetaData, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "scripts", "migrations")
+
+# pg_advisory_lock key: any constant unique to this application
+LOCK_KEY = 0x5717_0001
+LOCK_POLL_SECONDS = 1.0
+
+_FILE_RE = re.compile(r"^(\d+)_([\w-]+)\.sql$")
+_CONCURRENTLY_RE = re.compile(r"\bCONCURRENTLY\b", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    path: str
+
+    def statements(self) -> list[str]:
+        with open(self.path, encoding="utf-8") as f:
+            return split_statements(f.read())
+
+    def is_concurrent(self) -> bool:
+        return any(_CONCURRENTLY_RE.search(s) for s in self.statements())
+
+
+def discover(directory: str = MIGRATIONS_DIR) -> list[Migration]:
+    migrations = []
+    for filename in os.listdir(directory):
+        match = _FILE_RE.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    migrations.sort(key=lambda m: m.version)
+    for prev, cur in zip(migrations, migrations[1:]):
+        if prev.version == cur.version:
+            raise ValueError(f"Two migrations with version {cur.version}: {prev.path}, {cur.path}")
+    return migrations
+
+
+def pending(migrations: Iterable[Migration], applied: Iterable[int]) -> list[Migration]:
+    done = set(applied)
+    return [m for m in migrations if m.version not in done]
+
+
+def split_statements(sql: str) -> list[str]:
+    """Statements of a SQL file, without ``--`` comments; ``;`` inside quotes does not split."""
+    statements: list[str] = []
+    current: list[str] = []
+    i, n = 0, len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch == "'":
+            end = i + 1
+            while end < n:
+                if sql[end] == "'":
+                    if end + 1 < n and sql[end + 1] == "'":  # '' escapes a quote
+                        end += 2
+                        continue
+                    break
+                end += 1
+            current.append(sql[i:end + 1])
+            i = end + 1
+        elif sql.startswith("--", i):
+            newline = sql.find("\n", i)
+            i = n if newline == -1 else newline
+        elif ch == ";":
+            statements.append("".join(current))
+            current = []
+            i += 1
+        else:
+            current.append(ch)
+            i += 1
+    statements.append("".join(current))
+    return [s.strip() for s in statements if s.strip()]
+
+
+_CREATE_VERSIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+  version INTEGER PRIMARY KEY,
+  name VARCHAR NOT NULL,
+  applied_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+)
+"""
+_RECORD = text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name) ON CONFLICT DO NOTHING")
+
+
+async def _apply(engine: AsyncEngine, migration: Migration) -> None:
+    statements = migration.statements()
+    if migration.is_concurrent():
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            for statement in statements:
+                await conn.execute(text(statement))
+            await conn.execute(_RECORD, {"version": migration.version, "name": migration.name})
+    else:
+        async with engine.begin() as conn:
+            for statement in statements:
+                await conn.execute(text(statement))
+            await conn.execute(_RECORD, {"version": migration.version, "name": migration.name})
+
+
+async def migrate(engine: AsyncEngine, metadata: MetaData, directory: str = MIGRATIONS_DIR) -> list[int]:
+    """Bring the schema up to date; returns the versions applied by this call."""
+    migrations = discover(directory)
+    async with engine.connect() as lock_conn:
+        lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        while not await lock_conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": LOCK_KEY}):
+            logging.info("Migrations: another process is migrating, waiting")
+            await asyncio.sleep(LOCK_POLL_SECONDS)
+        try:
+            async with engine.begin() as conn:
+                if await conn.scalar(text("SELECT to_regclass('schema_migrations')")) is None:
+                    logging.info("Migrations: no schema_migrations table, creating missing tables from the models")
+                    await conn.run_sync(metadata.create_all)
+                    await conn.execute(text(_CREATE_VERSIONS_TABLE))
+                applied = (await conn.execute(text("SELECT version FROM schema_migrations"))).scalars().all()
+            done = []
+            for migration in pending(migrations, applied):
+                logging.info("Migrations: applying %03d_%s", migration.version, migration.name)
+                await _apply(engine, migration)
+                done.append(migration.version)
+            return done
+        finally:
+            await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
@@ -0,0 +1,85 @@
+"""Pre-upload normalization: upload the original, re-pack it losslessly, or transcode to speech Opus.
+
+The choice is a cost estimate per file: seconds to push the bytes over the uplink
+versus seconds of ffmpeg plus uploading the (smaller) result. A 32 kbit/s voice note
+goes up as-is; a 20 MB WAV is worth a couple of seconds of encoding.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional
+
+# Lossless re-pack (PCM -> FLAC) only pays off for uncompressed input
+_LOSSLESS_SOURCES = {"wav"}
+# FLAC of speech is typically about half the size of 16-bit PCM
+FLAC_RATIO = 0.55
+# FLAC encodes far faster than Opus; relative to the measured Opus speed
+FLAC_SPEEDUP = 4.0
+
+
+@dataclass(frozen=True)
+class NormalizationPlan:
+    path: str  # 'original', 'lossless' or 'transcode'
+    expected_bytes: int
+    expected_seconds: float  # encode + upload
+    original_seconds: float  # upload of the file as-is
+
+
+class SpeedEstimate:
+    """Exponentially weighted average of observed transcode speed (x realtime)."""
+
+    def __init__(self, initial: float, weight: float = 0.2):
+        self.value = initial
+        self.weight = weight
+
+    def observe(self, audio_seconds: float, wall_seconds: float) -> None:
+        if audio_seconds <= 0 or wall_seconds <= 0:
+            return
+        self.value += self.weight * (audio_seconds / wall_seconds - self.value)
+
+
+def plan_normalization(
+    size_bytes: int,
+    duration: float,
+    codec: Optional[str],
+    uplink_bytes_per_second: float,
+    transcode_speed: float,
+    target_bitrate_bps: int,
+    limit_bytes: int,
+    min_gain_seconds: float = 1.0,
+) -> NormalizationPlan:
+    """
+    Cheapest of the three paths by estimated time. A re-encode must save at least
+    ``min_gain_seconds`` to be chosen, unless the original does not fit ``limit_bytes``.
+    """
+    upload_seconds = size_bytes / uplink_bytes_per_second
+    original = NormalizationPlan("original", size_bytes, upload_seconds, upload_seconds)
+    if duration <= 0 or transcode_speed <= 0:
+        return original
+
+    candidates = []
+    opus_bytes = int(duration * target_bitrate_bps / 8)
+    candidates.append(NormalizationPlan(
+        "transcode",
+        opus_bytes,
+        duration / transcode_speed + opus_bytes / uplink_bytes_per_second,
+        upload_seconds,
+    ))
+    if codec in _LOSSLESS_SOURCES:
+        flac_bytes = int(size_bytes * FLAC_RATIO)
+        candidates.append(NormalizationPlan(
+            "lossless",
+            flac_bytes,
+            duration / (transcode_speed * FLAC_SPEEDUP) + flac_bytes / uplink_bytes_per_second,
+            upload_seconds,
+        ))
+
+    # Lossless first on ties: same speed, no quality cost
+    best = min(candidates, key=lambda p: (p.expected_seconds, p.path != "lossless"))
+    if size_bytes > limit_bytes:
+        fitting = [p for p in candidates if p.expected_bytes <= limit_bytes]
+        return min(fitting, key=lambda p: p.expected_seconds) if fitting else best
+    if original.original_seconds - best.expected_seconds >= min_gain_seconds:
+        return best
+    return original
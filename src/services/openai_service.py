@@ -1,85 +1,286 @@
+import asyncio
+import io
 import logging
+import math
 import os
-import ffmpeg
-from openai import AsyncOpenAI
-from src.config import OPENAI_KEY
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, BinaryIO, Callable, Optional, Sequence
+from src.config import (
+    CHUNK_SECONDS, CHUNK_OVERLAP_SECONDS, TRANSCRIBE_CONCURRENCY,
+    VAD_ENABLED, VAD_MIN_SECONDS, VAD_MIN_SILENCE_SECONDS,
+    UPLOAD_MBPS, TRANSCODE_SPEED_X, SPEECH_OPUS_KBPS,
+    HEDGE_ENABLED, HEDGE_QUANTILE, HEDGE_BUDGET_RATIO, HEDGE_BACKEND,
+)
+from src.services import metrics, vad
+from src.services.audio_probe import codec_hint, estimate_duration
+from src.services.hedging import HedgeBudget, LatencyTracker, hedged
+from src.services.normalization import SpeedEstimate, plan_normalization
+from src.services.chunking import Segment, plan_segments, prompt_tail, stitch_transcripts
+from src.services.transcoder import TranscodeError, opus_args, transcoder
+from src.services.transcript import TimedSegment, Transcript, merge_chunks, untrim
+from src.services.transcription_backends import transcribe_with
 
-if not OPENAI_KEY:
-    logging.error("OPENAI_KEY is not set or empty in config!")
-else:
-    logging.info(f"OPENAI_KEY loaded (starts with: {OPENAI_KEY[:5]}...)")
+# OpenAI limit is 25MB. We use 24MB as safety threshold.
+UPLOAD_LIMIT_BYTES = 24 * 1024 * 1024
 
-client = AsyncOpenAI(api_key=OPENAI_KEY)
+_normalized = metrics.counter("upload_normalization_total", "Pre-upload normalization decisions by path")
+_bytes_saved = metrics.counter("upload_bytes_saved_total", "Upload bytes saved by normalization, by path")
+# Measured ffmpeg speed (x realtime) feeds the next normalization decision
+transcode_speed = SpeedEstimate(TRANSCODE_SPEED_X)
+# Whisper latency by audio length (exported as whisper_latency_seconds) and the hedging budget
+whisper_latency = LatencyTracker()
+hedge_budget = HedgeBudget(HEDGE_BUDGET_RATIO)
 
-async def compress_audio(input_path: str, output_path: str) -> bool:
+
+@dataclass
+class TranscriptionResult:
+    text: str
+    status_detail: str  # 'original', 'lossless', 'normalized', 'compressed', 'trimmed' or 'chunked'
+    # Seconds of audio actually sent to Whisper when silence was cut, else None
+    trimmed_duration: Optional[float] = None
+    # Speech spans (seconds, original timeline) found by VAD; empty if VAD did not run
+    speech_spans: list[tuple[float, float]] = field(default_factory=list)
+    # Whisper segments on the original timeline (silences cut by VAD put back)
+    segments: list[TimedSegment] = field(default_factory=list)
+
+
+def buffer_size(audio: BinaryIO) -> int:
+    """Size of a seekable buffer in bytes; leaves the position at the start."""
+    audio.seek(0, os.SEEK_END)
+    size = audio.tell()
+    audio.seek(0)
+    return size
+
+async def compress_audio(audio: BinaryIO, audio_filter: Optional[str] = None) -> Optional[bytes]:
     """
     Compresses audio to OGG Opus with low bitrate (32k) to fit into 25MB limit.
-    Returns True if successful, False otherwise.
+    ``audio_filter`` is an optional ffmpeg ``-af`` chain (e.g. the VAD silence cut).
+    Runs on the shared async transcoder (bounded ffmpeg pool, stdin -> stdout).
+    Returns the compressed bytes, or None on failure or timeout.
     """
     try:
-        # Convert to ogg opus with 32k bitrate and mono channel (ac 1) to save space
-        stream = ffmpeg.input(input_path)
-        stream = ffmpeg.output(stream, output_path, acodec='libopus', b='32k', ac=1, loglevel='error')
-        ffmpeg.run(stream, overwrite_output=True)
-        return True
-    except ffmpeg.Error as e:
-        logging.error(f"FFmpeg error: {e.stderr.decode('utf8') if e.stderr else str(e)}")
-        return False
+        # Convert to ogg opus with 32k bitrate and mono channel to save space
+        filters = ["-af", audio_filter] if audio_filter else []
+        return await transcoder.run(audio, filters + opus_args("32k"))
+    except TranscodeError as e:
+        logging.error(f"FFmpeg error: {e}")
+        return None
     except Exception as e:
         logging.error(f"Compression error: {e}")
-        return False
+        return None
+
+async def detect_speech(audio: BinaryIO) -> Optional[list[vad.Span]]:
+    """
+    Decodes the buffer to 16 kHz mono PCM (streamed, never held whole) and returns
+    speech spans. VAD is best effort: None means "could not analyse, keep everything".
+    """
+    acc = vad.RmsAccumulator(vad.SAMPLE_RATE)
+    try:
+        await transcoder.run(audio, ["-vn", "-ac", "1", "-ar", str(vad.SAMPLE_RATE), "-f", "s16le"], sink=acc.feed)
+    except TranscodeError as e:
+        logging.warning(f"VAD decode failed, sending audio untrimmed: {e}")
+        return None
+    return vad.detect_speech(acc.result(), acc.frame_seconds, min_silence=VAD_MIN_SILENCE_SECONDS)
+
+async def normalize_for_upload(audio: BinaryIO, filename: str, duration: float) -> tuple[Optional[bytes], str]:
+    """
+    Original, FLAC re-pack or 16 kHz mono speech Opus, whichever is estimated to reach
+    OpenAI first. Returns (bytes, path); bytes is None when the original should be sent.
+    """
+    size = buffer_size(audio)
+    codec = codec_hint(None, filename)
+    if duration <= 0:
+        duration = estimate_duration(size, codec)
+    plan = plan_normalization(
+        size, duration, codec,
+        uplink_bytes_per_second=UPLOAD_MBPS * 1_000_000 / 8,
+        transcode_speed=transcode_speed.value,
+        target_bitrate_bps=SPEECH_OPUS_KBPS * 1000,
+        limit_bytes=UPLOAD_LIMIT_BYTES,
+    )
+    if plan.path == "original":
+        _normalized.inc(path="original")
+        return None, "original"
+
+    args = ["-vn", "-c:a", "flac", "-f", "flac"] if plan.path == "lossless" else opus_args(f"{SPEECH_OPUS_KBPS}k", 16000)
+    started = time.monotonic()
+    try:
+        packed = await transcoder.run(audio, args)
+    except TranscodeError as e:
+        logging.warning(f"Normalization ({plan.path}) failed, uploading original: {e}")
+        _normalized.inc(path="original")
+        return None, "original"
+    elapsed = time.monotonic() - started
+    if plan.path == "transcode":
+        transcode_speed.observe(duration, elapsed)
+    if len(packed) >= size:
+        _normalized.inc(path="original")
+        return None, "original"
+
+    _normalized.inc(path=plan.path)
+    _bytes_saved.inc(size - len(packed), path=plan.path)
+    logging.info(
+        f"Normalized ({plan.path}): {size} -> {len(packed)} bytes in {elapsed:.1f}s "
+        f"(upload estimate {plan.original_seconds:.1f}s -> {plan.expected_seconds:.1f}s)"
+    )
+    return packed, ("lossless" if plan.path == "lossless" else "normalized")
+
+def _worth_trimming(duration: float, spans: Sequence[vad.Span]) -> bool:
+    saved = duration - vad.speech_seconds(spans)
+    return bool(spans) and saved >= max(10.0, duration * 0.05)
 
-async def transcribe_audio(file_path: str) -> tuple[str, str]:
+async def _whisper(
+    upload: BinaryIO, upload_name: str, prompt: Optional[str] = None, backend: Optional[str] = None,
+    duration: float = 0.0,
+) -> Transcript:
     """
-    Transcribes audio file using OpenAI Whisper API.
-    Handles files > 25MB by attempting to compress them first.
-    Returns: (text, status_detail)
-    status_detail: 'original' or 'compressed'
+    One transcription request for ``duration`` seconds of audio. With HEDGE_ENABLED, a
+    request still pending after the HEDGE_QUANTILE latency for that length is raced
+    against the same upload on HEDGE_BACKEND.
+    """
+    def observe(latency: float) -> None:
+        if duration > 0:
+            whisper_latency.observe(duration, latency)
+
+    delay = whisper_latency.quantile(duration, HEDGE_QUANTILE) if HEDGE_ENABLED and duration > 0 else None
+    if delay is None:
+        return await hedged(lambda: transcribe_with(backend, upload, upload_name, prompt), None, None, hedge_budget, observe)
+
+    # Both requests need their own buffer: they upload concurrently
+    upload.seek(0)
+    data = upload.read()
+    return await hedged(
+        lambda: transcribe_with(backend, io.BytesIO(data), upload_name, prompt),
+        lambda: transcribe_with(HEDGE_BACKEND, io.BytesIO(data), upload_name, prompt),
+        delay,
+        hedge_budget,
+        observe,
+    )
+
+ProgressCallback = Callable[[str], Awaitable[None]]
+
+async def _transcribe_chunks(
+    packed: bytes, filename: str, duration: float, boundaries: Sequence[float] = (), backend: Optional[str] = None,
+    on_progress: Optional[ProgressCallback] = None,
+) -> Transcript:
     """
-    file_size = os.path.getsize(file_path)
-    final_path = file_path
-    compressed_file = None
-    status_detail = "original"
-    
-    # OpenAI limit is 25MB. We use 24MB as safety threshold.
-    if file_size > 24 * 1024 * 1024:
-        logging.info(f"File size {file_size} bytes exceeds limit. Attempting compression...")
-        
-        dir_name = os.path.dirname(file_path)
-        base_name = os.path.splitext(os.path.basename(file_path))[0]
-        compressed_file = os.path.join(dir_name, f"{base_name}_compressed.ogg")
-        
-        success = await compress_audio(file_path, compressed_file)
-        
-        if success:
-            new_size = os.path.getsize(compressed_file)
-            logging.info(f"Compression successful. New size: {new_size} bytes.")
-            
-            if new_size > 24 * 1024 * 1024:
-                logging.warning("Compressed file still too large.")
-                # Clean up immediately if failed check
-                if os.path.exists(compressed_file):
-                    os.remove(compressed_file)
-                raise ValueError("FILE_TOO_LARGE_EVEN_AFTER_COMPRESSION")
-            
-            final_path = compressed_file
-            status_detail = "compressed"
-        else:
+    Cuts compressed Opus audio into segments (on silences from ``boundaries`` where
+    possible, otherwise overlapping) and transcribes them in up to TRANSCRIBE_CONCURRENCY
+    lanes. A lane is a run of consecutive segments transcribed one after another, each
+    with the tail of the previous segment's text as Whisper prompt. The trade-off: only
+    the first segment of each lane goes without a prompt (unless the lane before it is
+    already done), and latency is one lane's worth of calls instead of one call.
+    ``on_progress`` receives the stitched text of the leading finished segments each time
+    that prefix grows. Timestamps of the result are on the timeline of ``packed``.
+    """
+    segments = plan_segments(duration, CHUNK_SECONDS, CHUNK_OVERLAP_SECONDS, boundaries)
+    overlapped = [seg.overlap > 0 for seg in segments]
+    base_name = os.path.splitext(filename)[0]
+    texts: list[Optional[str]] = [None] * len(segments)
+    timed: list[list[TimedSegment]] = [[] for _ in segments]
+    reported = 0
+    per_lane = math.ceil(len(segments) / max(1, TRANSCRIBE_CONCURRENCY))
+    lanes = [segments[i:i + per_lane] for i in range(0, len(segments), per_lane)]
+    logging.info(f"Transcribing {duration:.0f}s in {len(segments)} chunks ({len(lanes)} lanes)")
+
+    async def run_segment(seg: Segment) -> None:
+        # Stream copy: the input is already Opus, so cutting needs no re-encode
+        piece = await transcoder.run(
+            packed,
+            ["-ss", f"{seg.start:.3f}", "-t", f"{seg.length:.3f}", "-c", "copy", "-f", "ogg"],
+        )
+        prompt = prompt_tail(texts[seg.index - 1]) if seg.index > 0 else None
+        part = await _whisper(io.BytesIO(piece), f"{base_name}_{seg.index:03d}.ogg", prompt, backend, seg.length)
+        timed[seg.index] = part.segments
+        texts[seg.index] = part.text
+        await report_progress()
+
+    async def run_lane(lane: list[Segment]) -> None:
+        for seg in lane:
+            await run_segment(seg)
+
+    async def report_progress() -> None:
+        nonlocal reported
+        if on_progress is None:
+            return
+        ready = next((i for i, text in enumerate(texts) if text is None), len(texts))
+        if ready > reported and ready < len(texts):
+            reported = ready
+            await on_progress(stitch_transcripts(texts[:ready], overlapped[:ready]))
+
+    tasks = [asyncio.ensure_future(run_lane(lane)) for lane in lanes]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    return Transcript(stitch_transcripts(texts, overlapped), merge_chunks(segments, timed))
+
+async def transcribe_audio(
+    audio: BinaryIO, filename: str, duration: float = 0.0, backend: Optional[str] = None,
+    on_progress: Optional[ProgressCallback] = None,
+) -> TranscriptionResult:
+    """
+    Transcribes an in-memory (or spooled) audio buffer with ``backend`` (see
+    transcription_backends; None = TRANSCRIPTION_BACKEND, OpenAI Whisper API by default).
+    ``filename`` is only used as the upload name, so Whisper can tell the container format.
+
+    Recordings of at least VAD_MIN_SECONDS go through VAD first and long silences are cut
+    before upload. Files over the upload limit are compressed; recordings longer than
+    CHUNK_SECONDS (or still too large after compression) are transcribed in parallel
+    chunks, split on silences where VAD found them; ``on_progress`` then gets the text
+    transcribed so far as chunks complete.
+    """
+    file_size = buffer_size(audio)
+
+    spans: list[vad.Span] = []
+    if VAD_ENABLED and duration >= VAD_MIN_SECONDS:
+        spans = await detect_speech(audio) or []
+
+    if spans and _worth_trimming(duration, spans):
+        trimmed_duration = vad.speech_seconds(spans)
+        logging.info(f"VAD: {duration:.0f}s -> {trimmed_duration:.0f}s of speech in {len(spans)} spans")
+        packed = await compress_audio(audio, vad.aselect_filter(spans))
+        if packed is None:
             logging.error("Compression failed.")
             raise ValueError("COMPRESSION_FAILED")
+        if trimmed_duration <= CHUNK_SECONDS and len(packed) <= UPLOAD_LIMIT_BYTES:
+            upload_name = f"{os.path.splitext(filename)[0]}_trimmed.ogg"
+            result = await _whisper(io.BytesIO(packed), upload_name, backend=backend, duration=trimmed_duration)
+            return TranscriptionResult(result.text, "trimmed", trimmed_duration, spans, untrim(result.segments, spans))
+        result = await _transcribe_chunks(
+            packed, filename, trimmed_duration, vad.trimmed_boundaries(spans), backend, on_progress
+        )
+        return TranscriptionResult(result.text, "chunked", trimmed_duration, spans, untrim(result.segments, spans))
 
-    try:
-        with open(final_path, "rb") as audio_file:
-            transcript = await client.audio.transcriptions.create(
-                model="whisper-1", 
-                file=audio_file,
-                response_format="text"
-            )
-        return transcript, status_detail
-    except Exception as e:
-        logging.error(f"Transcription error: {e}")
-        raise e
-    finally:
-        # Clean up compressed file if it was created
-        if compressed_file and os.path.exists(compressed_file):
-            os.remove(compressed_file)
+    if file_size <= UPLOAD_LIMIT_BYTES and duration <= CHUNK_SECONDS:
+        packed, path = await normalize_for_upload(audio, filename, duration)
+        if packed is None:
+            result = await _whisper(audio, filename, backend=backend, duration=duration)
+            return TranscriptionResult(result.text, "original", speech_spans=spans, segments=result.segments)
+        ext = ".flac" if path == "lossless" else ".ogg"
+        result = await _whisper(io.BytesIO(packed), f"{os.path.splitext(filename)[0]}{ext}", backend=backend, duration=duration)
+        return TranscriptionResult(result.text, path, speech_spans=spans, segments=result.segments)
+
+    logging.info(f"File size {file_size} bytes / {duration:.0f}s needs compression...")
+    compressed = await compress_audio(audio)
+
+    if compressed is None:
+        logging.error("Compression failed.")
+        raise ValueError("COMPRESSION_FAILED")
+
+    new_size = len(compressed)
+    logging.info(f"Compression successful. New size: {new_size} bytes.")
+
+    if duration <= CHUNK_SECONDS and new_size <= UPLOAD_LIMIT_BYTES:
+        upload_name = f"{os.path.splitext(filename)[0]}_compressed.ogg"
+        result = await _whisper(io.BytesIO(compressed), upload_name, backend=backend, duration=duration)
+        return TranscriptionResult(result.text, "compressed", speech_spans=spans, segments=result.segments)
+
+    if duration <= 0:
+        # Unknown length: derive it from the constant 32 kbit/s of the compressed stream
+        duration = new_size * 8 / 32000
+    result = await _transcribe_chunks(compressed, filename, duration, vad.silence_midpoints(spans), backend, on_progress)
+    return TranscriptionResult(result.text, "chunked", speech_spans=spans, segments=result.segments)
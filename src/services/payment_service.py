@@ -1,7 +1,9 @@
+import asyncio
 import uuid
 import logging
 from yookassa import Configuration, Payment
 from src.config import YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY
+from src.services.http_transport import install_yookassa_session
 
 _yookassa_configured = False
 
@@ -15,6 +17,7 @@ def _ensure_yookassa_config() -> bool:
         return False
     Configuration.account_id = YOOKASSA_SHOP_ID
     Configuration.secret_key = YOOKASSA_SECRET_KEY
+    install_yookassa_session()
     _yookassa_configured = True
     return True
 
@@ -57,7 +60,12 @@ def get_tariff_price(minutes: int) -> int:
     return int((minutes * 2.5) + 20)
 
 
-def create_yookassa_payment(amount: float, description: str, return_url: str, metadata: dict = None):
+async def create_yookassa_payment(amount: float, description: str, return_url: str, metadata: dict = None):
+    # The SDK is blocking (requests); keep it off the event loop
+    return await asyncio.to_thread(_create_yookassa_payment, amount, description, return_url, metadata)
+
+
+def _create_yookassa_payment(amount: float, description: str, return_url: str, metadata: dict = None):
     if not _ensure_yookassa_config():
         logging.error("YooKassa credentials missing")
         return None
@@ -86,7 +94,11 @@ def create_yookassa_payment(amount: float, description: str, return_url: str, me
         return None
 
 
-def check_yookassa_payment(payment_id: str):
+async def check_yookassa_payment(payment_id: str):
+    return await asyncio.to_thread(_check_yookassa_payment, payment_id)
+
+
+def _check_yookassa_payment(payment_id: str):
     if not _ensure_yookassa_config():
         logging.error("YooKassa credentials missing")
         return None
@@ -0,0 +1,158 @@
+"""Partial transcripts in the chat while a long file is still being transcribed.
+
+The status message is edited with the text accumulated so far, at most once per
+PROGRESS_EDIT_INTERVAL_SECONDS (Telegram limits edits per chat). When the text
+outgrows one message, the overflow goes to new messages that are edited in turn, up to
+INLINE_MAX_PAGES of them. Pages are preformatted like the inline result; a final text
+longer than INLINE_MAX_PAGES pages is replaced by a note, the file follows.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import html
+import logging
+import time
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from src.config import INLINE_MAX_PAGES, PROGRESS_EDIT_INTERVAL_SECONDS
+
+# Telegram allows 4096 characters per message; leave room for the "in progress" line
+PAGE_CHARS = 4000
+IN_PROGRESS_FOOTER = "\n\n⏳ Расшифровка продолжается… / Transcribing…"
+TOO_LONG_NOTE = "⚠️ Расшифровка получилась очень длинной (больше лимита Telegram), поэтому отправляю её только файлом 👇"
+
+
+def paginate(text: str, limit: int = PAGE_CHARS) -> list[str]:
+    """Split on whitespace into pages of at most ``limit`` characters (hard split for longer words)."""
+    pages: list[str] = []
+    rest = text.strip()
+    while len(rest) > limit:
+        cut = rest.rfind("\n", 0, limit + 1)
+        if cut < limit // 2:
+            cut = rest.rfind(" ", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        pages.append(rest[:cut].rstrip())
+        rest = rest[cut:].lstrip()
+    if rest or not pages:
+        pages.append(rest)
+    return pages
+
+
+def preformatted(page: str) -> str:
+    """A page as HTML ``<pre>``, escaped so backticks or asterisks in the text cannot break the markup."""
+    return f"<pre>{html.escape(page)}</pre>"
+
+
+class ProgressiveMessage:
+    """Mirrors a growing transcript into the status message (and follow-up messages)."""
+
+    def __init__(
+        self, bot: Bot, chat_id: int, status_message_id: int, min_interval: float = PROGRESS_EDIT_INTERVAL_SECONDS,
+        max_pages: int = INLINE_MAX_PAGES,
+    ):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_ids = [status_message_id]
+        self.min_interval = min_interval
+        self.max_pages = max(1, max_pages)
+        self._shown: list[str] = []  # what each message currently shows
+        self._latest: Optional[str] = None
+        self._last_flush = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._rendering = False
+
+    @property
+    def started(self) -> bool:
+        """True once any partial text reached the chat."""
+        return bool(self._shown)
+
+    async def update(self, text: str) -> None:
+        """New accumulated text; returns at once, the edit happens in the background."""
+        self._latest = text
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while self._latest is not None:
+            wait = self._last_flush + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if self._latest is None:
+                break
+            text, self._latest = self._latest, None
+            self._rendering = True
+            try:
+                # Beyond the page cap the shown text stops growing; the final delivery decides
+                pages = [preformatted(page) for page in paginate(text)[:self.max_pages]]
+                await self._render(pages, footer=IN_PROGRESS_FOOTER)
+            except Exception as e:
+                # Partial output is a courtesy; the final delivery does not depend on it
+                logging.warning(f"Progressive update failed: {e}")
+            finally:
+                self._rendering = False
+            self._last_flush = time.monotonic()
+
+    async def _render(self, pages: list[str], footer: str = "") -> None:
+        for index, page in enumerate(pages):
+            body = page + (footer if index == len(pages) - 1 else "")
+            if index < len(self._shown) and self._shown[index] == body:
+                continue
+            await self._show(index, body)
+
+    async def _show(self, index: int, body: str) -> None:
+        while True:
+            try:
+                if index < len(self.message_ids):
+                    await self.bot.edit_message_text(
+                        body, chat_id=self.chat_id, message_id=self.message_ids[index], parse_mode="HTML"
+                    )
+                else:
+                    sent = await self.bot.send_message(self.chat_id, body, parse_mode="HTML")
+                    self.message_ids.append(sent.message_id)
+                break
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except TelegramBadRequest as e:
+                if "not modified" not in str(e):
+                    raise
+                break
+        if index < len(self._shown):
+            self._shown[index] = body
+        else:
+            self._shown.append(body)
+
+    async def finish(self, text: str) -> None:
+        """
+        Show the complete text without the progress footer. Over ``max_pages`` pages the
+        first message becomes TOO_LONG_NOTE and the follow-up messages are removed.
+        """
+        await self.close()
+        wait = self._last_flush + self.min_interval - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        pages = paginate(text)
+        if len(pages) <= self.max_pages:
+            await self._render([preformatted(page) for page in pages])
+            return
+        await self._render([html.escape(TOO_LONG_NOTE)])
+        for message_id in self.message_ids[1:]:
+            try:
+                await self.bot.delete_message(chat_id=self.chat_id, message_id=message_id)
+            except Exception as e:
+                logging.warning(f"Could not remove a partial transcript message: {e}")
+        del self.message_ids[1:]
+        del self._shown[1:]
+
+    async def close(self) -> None:
+        """Stop background edits; an edit already on its way to Telegram is let through."""
+        self._latest = None
+        if self._task is not None:
+            if not self._rendering:
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -30,3 +30,24 @@ def fifo_allocate(
         out.append((bid, take))
         left -= take
     return out
+
+
+# Free seconds every user gets before the purchased balance is touched
+FREE_SECONDS = 300.0
+
+
+def split_usage(used_free_seconds: float, duration: float, free_limit: float = FREE_SECONDS) -> tuple[float, float]:
+    """
+    How ``duration`` seconds of usage are charged: ``(from_free, from_purchased)``.
+    The free allowance is used up first; only the overflow comes from the purchased balance.
+    """
+    if duration <= 0:
+        return 0.0, 0.0
+    from_free = min(duration, max(0.0, free_limit - used_free_seconds))
+    return from_free, duration - from_free
+
+
+def available_seconds(used_free_seconds: float, balance_seconds: float, held_seconds: float = 0.0,
+                      free_limit: float = FREE_SECONDS) -> float:
+    """Seconds a user can still start: free allowance left plus purchased balance, minus active holds."""
+    return max(0.0, free_limit - used_free_seconds) + balance_seconds - held_seconds
@@ -0,0 +1,164 @@
+"""Retries with jittered exponential backoff, per-attempt timeouts and a circuit breaker.
+
+Used around upstream calls (Whisper). A transient error (429, 5xx, timeout, dropped
+connection) is retried after ``backoff_delay``, or after the server's Retry-After if that
+is longer. Consecutive give-ups open the breaker: calls then fail fast with ``CircuitOpen``
+until ``reset_seconds`` pass and a single trial call is let through.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from src.services import metrics
+
+T = TypeVar("T")
+
+_retries = metrics.counter("upstream_retries_total", "Retried upstream calls by upstream and reason")
+_giveups = metrics.counter("upstream_giveups_total", "Upstream calls that failed after all retries")
+_breaker_state = metrics.gauge("circuit_breaker_state", "0 closed, 1 half-open, 2 open")
+_breaker_transitions = metrics.counter("circuit_breaker_transitions_total", "Breaker state changes")
+
+_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpen(Exception):
+    """The upstream is considered down; try again in ``retry_after`` seconds."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name}: circuit open, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def backoff_delay(
+    attempt: int,
+    base: float,
+    cap: float,
+    retry_after: Optional[float] = None,
+    rand: Callable[[], float] = random.random,
+) -> float:
+    """
+    Full-jitter delay before retry number ``attempt`` (1-based): uniform in
+    [0, min(cap, base * 2**(attempt-1))], but never shorter than the server's Retry-After.
+    """
+    delay = rand() * min(cap, base * 2 ** (attempt - 1))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        reset_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        _breaker_state.set(0, name=name)
+
+    def _set_state(self, state: str) -> None:
+        if state == self.state:
+            return
+        logging.warning("Circuit %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        _breaker_state.set(_STATE_VALUES[state], name=self.name)
+        _breaker_transitions.inc(name=self.name, state=state)
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_seconds - self.clock())
+
+    def check(self) -> None:
+        """Raise CircuitOpen unless a call may go through now."""
+        if self.state == "open":
+            if self.retry_after() > 0:
+                raise CircuitOpen(self.name, self.retry_after())
+            self._set_state("half_open")
+        if self.state == "half_open":
+            # One trial call at a time; everybody else keeps failing fast
+            if self._trial_running:
+                raise CircuitOpen(self.name, self.reset_seconds)
+            self._trial_running = True
+
+    def record_success(self) -> None:
+        self._trial_running = False
+        self.failures = 0
+        self._set_state("closed")
+
+    def record_failure(self) -> None:
+        self._trial_running = False
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+            self._set_state("open")
+
+    def release(self) -> None:
+        """A call ended without telling anything about upstream health (e.g. a 400)."""
+        self._trial_running = False
+
+
+async def call_with_retries(
+    call: Callable[[], Awaitable[T]],
+    *,
+    name: str,
+    attempts: int,
+    timeout: float,
+    base_delay: float,
+    max_delay: float,
+    is_transient: Callable[[BaseException], bool],
+    retry_after_of: Callable[[BaseException], Optional[float]] = lambda e: None,
+    breaker: Optional[CircuitBreaker] = None,
+) -> T:
+    """
+    ``call`` with up to ``attempts`` tries of at most ``timeout`` seconds each. Only
+    errors for which ``is_transient`` holds are retried, and only those count against
+    the breaker; a non-transient error (bad request) is raised as is.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        if breaker is not None:
+            breaker.check()
+        try:
+            result = await asyncio.wait_for(call(), timeout)
+        except Exception as e:
+            transient = isinstance(e, asyncio.TimeoutError) or is_transient(e)
+            if not transient:
+                if breaker is not None:
+                    breaker.release()
+                raise
+            if attempt >= attempts:
+                _giveups.inc(upstream=name)
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            if breaker is not None:
+                # Only a give-up counts as a failure, but a half-open trial must not stay claimed
+                breaker.release()
+            reason = type(e).__name__
+            delay = backoff_delay(attempt, base_delay, max_delay, retry_after_of(e))
+            _retries.inc(upstream=name, reason=reason)
+            logging.warning("%s: %s, retry %s/%s in %.1fs", name, reason, attempt, attempts - 1, delay)
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # Cancelled (a hedge lost, the worker stops): nothing learned, but free a half-open trial
+            if breaker is not None:
+                breaker.release()
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        return result
@@ -14,6 +14,7 @@ from src.services.db_service import (
     get_transaction,
     get_transaction_by_payment_id,
 )
+from src.services.user_cache import CachedUser, user_cache
 
 
 def _eligible_for_stars_refund(tx: Transaction | None) -> tuple[bool, str]:
@@ -37,6 +38,7 @@ def _eligible_for_stars_refund(tx: Transaction | None) -> tuple[bool, str]:
 
 async def finalize_stars_refund_in_db(tx_id: int) -> tuple[bool, str]:
     """After Telegram confirms refund: deduct balance and mark tx."""
+    since = user_cache.begin()
     async with async_session() as session:
         stmt = select(Transaction).where(Transaction.id == tx_id).with_for_update()
         tx = (await session.execute(stmt)).scalar_one_or_none()
@@ -60,7 +62,9 @@ async def finalize_stars_refund_in_db(tx_id: int) -> tuple[bool, str]:
         tx.seconds_remaining = 0.0
         tx.stars_refund_status = "refunded"
         await session.commit()
-        return True, ""
+        snapshot = CachedUser.of(user)
+    user_cache.put(snapshot, since)
+    return True, ""
 
 
 async def refund_telegram_stars_by_tx_id(bot: Bot, tx_id: int) -> tuple[bool, str]:
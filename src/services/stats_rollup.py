@@ -0,0 +1,68 @@
+"""Per-user message counters by day, kept in the ``user_stats`` rollup row.
+
+The last ``WINDOW_DAYS`` days are a list of counts, newest first, anchored at the (UTC)
+day of its first element. Adding a message rolls the list forward to today; reads roll
+a copy, so a user who was silent for a week reads zeros without anything being written.
+"Today", "7 days" and "30 days" are calendar days in UTC, today included.
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import date
+from typing import Mapping, Optional, Sequence
+
+WINDOW_DAYS = 30
+
+
+def roll(counts: Sequence[int], anchor: Optional[date], today: date) -> list[int]:
+    """``counts`` re-anchored at ``today`` (days that passed since ``anchor`` become zeros)."""
+    counts = list(counts)[:WINDOW_DAYS]
+    counts += [0] * (WINDOW_DAYS - len(counts))
+    if anchor is None:
+        return [0] * WINDOW_DAYS
+    gap = (today - anchor).days
+    if gap <= 0:
+        return counts
+    return ([0] * gap + counts)[:WINDOW_DAYS]
+
+
+def add(counts: Sequence[int], anchor: Optional[date], day: date, n: int = 1) -> tuple[list[int], date]:
+    """Count ``n`` messages on ``day``; returns the new list and its anchor."""
+    if anchor is not None and anchor > day:
+        # A message dated before the anchor (clock skew between processes): count it on its own day
+        counts = roll(counts, anchor, anchor)
+        index = (anchor - day).days
+        if index < WINDOW_DAYS:
+            counts[index] += n
+        return counts, anchor
+    counts = roll(counts, anchor, day)
+    counts[0] += n
+    return counts, day
+
+
+def last_days(counts: Sequence[int], anchor: Optional[date], today: date, days: int) -> int:
+    """Messages in the last ``days`` calendar days, today included."""
+    return sum(roll(counts, anchor, today)[:days])
+
+
+def from_history(per_day: Mapping[date, int], today: date) -> list[int]:
+    """The day list for ``today`` built from full history (``{day: count}``), for the rebuild."""
+    counts = [0] * WINDOW_DAYS
+    for day, n in per_day.items():
+        index = (today - day).days
+        if 0 <= index < WINDOW_DAYS:
+            counts[index] += n
+    return counts
+
+
+def dumps(counts: Sequence[int]) -> str:
+    # Trailing zeros carry no information; most users have a few recent days at most
+    trimmed = list(counts)
+    while trimmed and trimmed[-1] == 0:
+        trimmed.pop()
+    return json.dumps(trimmed, separators=(",", ":"))
+
+
+def loads(raw: Optional[str]) -> list[int]:
+    return json.loads(raw) if raw else []
@@ -0,0 +1,142 @@
+"""Non-blocking ffmpeg over asyncio subprocesses: stdin -> stdout, no intermediate files."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import BinaryIO, Callable, Optional, Sequence, Union
+
+from src.config import FFMPEG_MAX_PROCS, FFMPEG_TIMEOUT_SECONDS
+
+_FEED_CHUNK = 64 * 1024
+
+
+class TranscodeError(Exception):
+    """ffmpeg exited with a non-zero code (stderr is in the message)."""
+
+
+class TranscodeTimeout(TranscodeError):
+    """ffmpeg did not finish within the per-job timeout and was killed."""
+
+
+def opus_args(bitrate: str = "32k", sample_rate: Optional[int] = None) -> list[str]:
+    """Output options for mono OGG Opus (speech) written to stdout."""
+    args = ["-vn", "-ac", "1"]
+    if sample_rate:
+        args += ["-ar", str(sample_rate)]
+    return args + ["-c:a", "libopus", "-b:a", bitrate, "-f", "ogg"]
+
+
+class Transcoder:
+    """
+    Runs ffmpeg jobs with at most ``max_procs`` processes alive at once.
+
+    Input is fed through stdin and output collected from stdout. Timeouts and task
+    cancellation kill the process, so a stuck job never keeps holding a slot.
+    """
+
+    def __init__(self, max_procs: int = FFMPEG_MAX_PROCS, ffmpeg_bin: str = "ffmpeg"):
+        self.max_procs = max(1, max_procs)
+        self.ffmpeg_bin = ffmpeg_bin
+        # Created lazily: on Python 3.9 a Semaphore binds to the loop it was created in.
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_procs)
+        return self._slots
+
+    def _command(self, output_args: Sequence[str], input_args: Sequence[str]) -> list[str]:
+        return [
+            self.ffmpeg_bin, "-hide_banner", "-loglevel", "error",
+            *input_args, "-i", "pipe:0", *output_args, "pipe:1",
+        ]
+
+    async def run(
+        self,
+        source: Union[bytes, BinaryIO],
+        output_args: Sequence[str],
+        input_args: Sequence[str] = (),
+        timeout: Optional[float] = FFMPEG_TIMEOUT_SECONDS,
+        sink: Optional[Callable[[bytes], None]] = None,
+    ) -> bytes:
+        """
+        Transcode ``source`` and return everything ffmpeg wrote to stdout.
+
+        With ``sink``, stdout is handed over chunk by chunk instead (e.g. decoded PCM that
+        is too large to keep) and the return value is empty.
+        """
+        async with self._semaphore():
+            proc = await asyncio.create_subprocess_exec(
+                *self._command(output_args, input_args),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            feeder = asyncio.ensure_future(_feed(proc, source))
+            try:
+                out, err = await asyncio.wait_for(_collect(proc, feeder, sink), timeout)
+            except asyncio.TimeoutError:
+                logging.warning("ffmpeg timed out after %ss, killing pid %s", timeout, proc.pid)
+                raise TranscodeTimeout(f"ffmpeg timed out after {timeout}s")
+            finally:
+                feeder.cancel()
+                await _reap(proc)
+
+        if proc.returncode != 0:
+            raise TranscodeError(err.decode("utf8", errors="replace").strip() or f"exit code {proc.returncode}")
+        return out
+
+
+async def _feed(proc: asyncio.subprocess.Process, source: Union[bytes, BinaryIO]) -> None:
+    try:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            proc.stdin.write(bytes(source))
+            await proc.stdin.drain()
+        else:
+            source.seek(0)
+            while True:
+                chunk = source.read(_FEED_CHUNK)
+                if not chunk:
+                    break
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # ffmpeg stopped reading (error or it has all it needs); exit code tells the rest
+        pass
+    finally:
+        if not proc.stdin.is_closing():
+            proc.stdin.close()
+
+
+async def _drain(stream: asyncio.StreamReader, sink: Callable[[bytes], None]) -> bytes:
+    while True:
+        chunk = await stream.read(_FEED_CHUNK)
+        if not chunk:
+            return b""
+        sink(chunk)
+
+
+async def _collect(
+    proc: asyncio.subprocess.Process,
+    feeder: asyncio.Future,
+    sink: Optional[Callable[[bytes], None]],
+) -> tuple[bytes, bytes]:
+    stdout = _drain(proc.stdout, sink) if sink else proc.stdout.read()
+    out, err = await asyncio.gather(stdout, proc.stderr.read())
+    await feeder
+    await proc.wait()
+    return out, err
+
+
+async def _reap(proc: asyncio.subprocess.Process) -> None:
+    """Kill ffmpeg if it is still running (timeout / cancellation) and wait for it."""
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+        await proc.wait()
+
+
+transcoder = Transcoder()
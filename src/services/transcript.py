@@ -0,0 +1,139 @@
+"""Timestamped transcripts and their renderings (TXT, SRT, WebVTT, JSON).
+
+Whisper's verbose JSON is kept as a list of ``TimedSegment`` on the original audio
+timeline: chunk offsets are added and the silences cut by VAD are put back in. The
+segments are stored once (compact JSON); every format is rendered from them on demand.
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from typing import Iterable, Optional, Sequence
+
+from src.services.chunking import Segment
+
+FORMATS = ("txt", "srt", "vtt", "json")
+
+
+@dataclass(frozen=True)
+class TimedSegment:
+    start: float  # seconds
+    end: float
+    text: str
+
+
+@dataclass
+class Transcript:
+    text: str
+    segments: list[TimedSegment]
+
+    @classmethod
+    def plain(cls, text: str) -> "Transcript":
+        """Text without timestamps (a backend or cache entry that has none)."""
+        return cls(text, [])
+
+
+# --- Storage ---
+def segments_to_json(segments: Sequence[TimedSegment]) -> str:
+    return json.dumps([[round(s.start, 3), round(s.end, 3), s.text] for s in segments], ensure_ascii=False)
+
+
+def segments_from_json(raw: Optional[str]) -> list[TimedSegment]:
+    if not raw:
+        return []
+    return [TimedSegment(float(start), float(end), text) for start, end, text in json.loads(raw)]
+
+
+# --- Timeline ---
+def shift(segments: Iterable[TimedSegment], offset: float) -> list[TimedSegment]:
+    return [TimedSegment(s.start + offset, s.end + offset, s.text) for s in segments]
+
+
+def merge_chunks(chunks: Sequence[Segment], parts: Sequence[Sequence[TimedSegment]]) -> list[TimedSegment]:
+    """
+    Segments of consecutive chunks (each on its own chunk's timeline) on one timeline.
+    Where two chunks overlap, a segment of the later chunk is dropped when its middle falls
+    before the end of what the earlier chunk already covered (the same words, heard twice).
+    """
+    merged: list[TimedSegment] = []
+    for chunk, part in zip(chunks, parts):
+        absolute = shift(part, chunk.start)
+        if chunk.overlap > 0 and merged:
+            covered = merged[-1].end
+            absolute = [s for s in absolute if (s.start + s.end) / 2 >= covered]
+        merged.extend(absolute)
+    return merged
+
+
+def to_original_time(t: float, spans: Sequence[tuple[float, float]]) -> float:
+    """A time on the trimmed audio (``spans`` joined back to back) on the original timeline."""
+    elapsed = 0.0
+    for start, end in spans:
+        length = end - start
+        if t <= elapsed + length:
+            return start + (t - elapsed)
+        elapsed += length
+    return spans[-1][1] if spans else t
+
+
+def untrim(segments: Iterable[TimedSegment], spans: Sequence[tuple[float, float]]) -> list[TimedSegment]:
+    return [TimedSegment(to_original_time(s.start, spans), to_original_time(s.end, spans), s.text) for s in segments]
+
+
+# --- Rendering ---
+def _timestamp(seconds: float, decimal: str) -> str:
+    ms = int(round(max(0.0, seconds) * 1000))
+    hours, ms = divmod(ms, 3_600_000)
+    minutes, ms = divmod(ms, 60_000)
+    secs, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{decimal}{ms:03d}"
+
+
+def _cues(transcript: Transcript, duration: float) -> list[TimedSegment]:
+    cues = [s for s in transcript.segments if s.text.strip()]
+    if not cues and transcript.text.strip():
+        cues = [TimedSegment(0.0, duration, transcript.text.strip())]
+    return cues
+
+
+def render_srt(transcript: Transcript, duration: float = 0.0) -> str:
+    blocks = [
+        f"{i}\n{_timestamp(s.start, ',')} --> {_timestamp(s.end, ',')}\n{s.text.strip()}\n"
+        for i, s in enumerate(_cues(transcript, duration), start=1)
+    ]
+    return "\n".join(blocks)
+
+
+def render_vtt(transcript: Transcript, duration: float = 0.0) -> str:
+    blocks = [
+        f"{_timestamp(s.start, '.')} --> {_timestamp(s.end, '.')}\n{s.text.strip()}\n"
+        for s in _cues(transcript, duration)
+    ]
+    return "WEBVTT\n\n" + "\n".join(blocks)
+
+
+def render_json(transcript: Transcript, duration: float = 0.0) -> str:
+    return json.dumps({
+        "text": transcript.text,
+        "duration": round(duration, 3),
+        "segments": [
+            {"start": round(s.start, 3), "end": round(s.end, 3), "text": s.text.strip()}
+            for s in transcript.segments
+        ],
+    }, ensure_ascii=False, indent=2)
+
+
+def render(transcript: Transcript, fmt: str, duration: float = 0.0) -> bytes:
+    """``transcript`` as a UTF-8 file in one of FORMATS."""
+    if fmt == "txt":
+        body = transcript.text
+    elif fmt == "srt":
+        body = render_srt(transcript, duration)
+    elif fmt == "vtt":
+        body = render_vtt(transcript, duration)
+    elif fmt == "json":
+        body = render_json(transcript, duration)
+    else:
+        raise ValueError(f"Unknown transcript format {fmt!r}")
+    return body.encode("utf-8")
@@ -0,0 +1,230 @@
+"""Speech-to-text engines behind one interface: an upload in, a ``Transcript`` (text and timed segments) out.
+
+``openai``: Whisper API (``whisper-1``); ``openai_hedge`` is a second client (OPENAI_HEDGE_KEY)
+for hedged requests. ``local``: faster-whisper (CTranslate2, int8 on
+CPU) in a process pool; free, offline and deterministic, for outages and benchmarks.
+faster-whisper is optional: ``pip install faster-whisper`` where the local engine is used.
+"""
+
+from __future__ import annotations
+
+import abc
+import asyncio
+import importlib.util
+import io
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Optional
+
+import openai
+from openai import AsyncOpenAI
+
+from src.config import (
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS, LOCAL_WHISPER_COMPUTE_TYPE, LOCAL_WHISPER_MODEL,
+    LOCAL_WHISPER_PROCS, OPENAI_HEDGE_KEY, OPENAI_KEY, OPENAI_MAX_INFLIGHT, TRANSCRIPTION_BACKEND, TRANSCRIPTION_BACKEND_BY_USER,
+    TRANSCRIPTION_FALLBACK_BACKEND,
+    WHISPER_ATTEMPT_TIMEOUT_SECONDS, WHISPER_BACKOFF_BASE_SECONDS, WHISPER_BACKOFF_MAX_SECONDS, WHISPER_MAX_ATTEMPTS,
+)
+from src.services import metrics
+from src.services.http_transport import openai_http_client
+from src.services.resilience import CircuitBreaker, call_with_retries
+from src.services.transcript import TimedSegment, Transcript
+
+_inflight_gauge = metrics.gauge("openai_inflight_requests", "Whisper requests currently in flight")
+_requests = metrics.counter("transcription_backend_requests_total", "Transcription requests by backend and outcome")
+
+
+class BackendUnavailable(RuntimeError):
+    """The configured backend cannot run here (missing package or API key)."""
+
+
+class TranscriptionBackend(abc.ABC):
+    """One upload (a whole file or a chunk) in, text with segment timestamps (on the upload's timeline) out."""
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def transcribe(self, upload: BinaryIO, upload_name: str, prompt: Optional[str] = None) -> Transcript:
+        ...
+
+
+def is_transient_openai_error(e: BaseException) -> bool:
+    return isinstance(e, (
+        openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError, openai.APITimeoutError,
+    ))
+
+
+def _openai_retry_after(e: BaseException) -> Optional[float]:
+    response = getattr(e, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None  # HTTP-date form; the backoff delay is used instead
+
+
+class OpenAIBackend(TranscriptionBackend):
+    name = "openai"
+
+    def __init__(
+        self,
+        api_key: Optional[str] = OPENAI_KEY,
+        model: str = "whisper-1",
+        max_inflight: int = OPENAI_MAX_INFLIGHT,
+        name: str = "openai",
+    ):
+        self.name = name
+        if not api_key:
+            logging.error("OPENAI_KEY is not set or empty in config!")
+        else:
+            logging.info(f"OPENAI_KEY loaded (starts with: {api_key[:5]}...)")
+        # Retries are ours (call_with_retries), not the SDK's
+        self.client = AsyncOpenAI(api_key=api_key, max_retries=0, http_client=openai_http_client())
+        self.model = model
+        self.breaker = CircuitBreaker(name, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+        self.max_inflight = max(1, max_inflight)
+        # Global cap on concurrent Whisper requests from this process (all workers and chunks share it);
+        # created lazily, on Python 3.9 a Semaphore binds to the loop it was created in
+        self._inflight: Optional[asyncio.Semaphore] = None
+
+    async def _attempt(self, upload: BinaryIO, upload_name: str, prompt: Optional[str]) -> Transcript:
+        if self._inflight is None:
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+        upload.seek(0)
+        kwargs = {"prompt": prompt} if prompt else {}
+        async with self._inflight:
+            _inflight_gauge.inc()
+            try:
+                response = await self.client.audio.transcriptions.create(
+                    model=self.model,
+                    file=(upload_name, upload),
+                    response_format="verbose_json",
+                    timestamp_granularities=["segment"],
+                    **kwargs,
+                )
+            finally:
+                _inflight_gauge.dec()
+        segments = [TimedSegment(s.start, s.end, s.text) for s in (getattr(response, "segments", None) or [])]
+        return Transcript(response.text, segments)
+
+    async def transcribe(self, upload: BinaryIO, upload_name: str, prompt: Optional[str] = None) -> Transcript:
+        """Raises CircuitOpen without calling OpenAI while the API is considered down."""
+        return await call_with_retries(
+            lambda: self._attempt(upload, upload_name, prompt),
+            name=self.name,
+            attempts=WHISPER_MAX_ATTEMPTS,
+            timeout=WHISPER_ATTEMPT_TIMEOUT_SECONDS,
+            base_delay=WHISPER_BACKOFF_BASE_SECONDS,
+            max_delay=WHISPER_BACKOFF_MAX_SECONDS,
+            is_transient=is_transient_openai_error,
+            retry_after_of=_openai_retry_after,
+            breaker=self.breaker,
+        )
+
+
+# --- Local faster-whisper engine (runs in pool processes) ---
+_local_model = None
+
+
+def _load_local_model(model_size: str, compute_type: str) -> None:
+    global _local_model
+    from faster_whisper import WhisperModel
+    _local_model = WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=1)
+
+
+def _local_transcribe(data: bytes, prompt: Optional[str]) -> Transcript:
+    # Greedy decoding at temperature 0: the same audio always gives the same text
+    segments, _ = _local_model.transcribe(
+        io.BytesIO(data), beam_size=1, temperature=0.0, initial_prompt=prompt, vad_filter=False
+    )
+    timed = [TimedSegment(seg.start, seg.end, seg.text.strip()) for seg in segments]
+    return Transcript(" ".join(seg.text for seg in timed).strip(), timed)
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    name = "local"
+
+    def __init__(self, model_size: str = LOCAL_WHISPER_MODEL, compute_type: str = LOCAL_WHISPER_COMPUTE_TYPE, procs: int = LOCAL_WHISPER_PROCS):
+        if importlib.util.find_spec("faster_whisper") is None:
+            raise BackendUnavailable("faster-whisper is not installed (pip install faster-whisper)")
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.procs = max(1, procs)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: CTranslate2 threads do not survive a fork of the event loop process
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.procs,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_load_local_model,
+                initargs=(self.model_size, self.compute_type),
+            )
+        return self._pool
+
+    async def transcribe(self, upload: BinaryIO, upload_name: str, prompt: Optional[str] = None) -> Transcript:
+        upload.seek(0)
+        data = upload.read()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(), _local_transcribe, data, prompt)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_BACKENDS = {
+    "openai": OpenAIBackend,
+    "openai_hedge": lambda: OpenAIBackend(api_key=OPENAI_HEDGE_KEY or OPENAI_KEY, name="openai_hedge"),
+    "local": LocalWhisperBackend,
+}
+_instances: dict[str, TranscriptionBackend] = {}
+
+
+def get_backend(name: Optional[str] = None) -> TranscriptionBackend:
+    """Shared backend instance by name; ``None`` means the deployment default (TRANSCRIPTION_BACKEND)."""
+    name = (name or TRANSCRIPTION_BACKEND).lower()
+    backend = _instances.get(name)
+    if backend is None:
+        if name not in _BACKENDS:
+            raise BackendUnavailable(f"Unknown transcription backend {name!r} (expected one of {', '.join(_BACKENDS)})")
+        backend = _instances[name] = _BACKENDS[name]()
+    return backend
+
+
+def backend_for_user(user_id: int) -> Optional[str]:
+    """Backend for a new job of ``user_id`` (TRANSCRIPTION_BACKEND_BY_USER); None = deployment default."""
+    name = TRANSCRIPTION_BACKEND_BY_USER.get(user_id)
+    if name is not None and name not in _BACKENDS:
+        logging.warning(f"TRANSCRIPTION_BACKEND_BY_USER: unknown backend {name!r} for user {user_id}, using the default")
+        return None
+    return name
+
+
+async def _transcribe_once(backend: TranscriptionBackend, upload: BinaryIO, upload_name: str, prompt: Optional[str]) -> Transcript:
+    try:
+        text = await backend.transcribe(upload, upload_name, prompt)
+    except Exception as e:
+        _requests.inc(backend=backend.name, outcome="error")
+        logging.error(f"Transcription error ({backend.name}): {e}")
+        raise
+    _requests.inc(backend=backend.name, outcome="ok")
+    return text
+
+
+async def transcribe_with(
+    backend_name: Optional[str], upload: BinaryIO, upload_name: str, prompt: Optional[str] = None
+) -> Transcript:
+    """Transcribe on ``backend_name`` (default: TRANSCRIPTION_BACKEND); on failure try TRANSCRIPTION_FALLBACK_BACKEND once."""
+    backend = get_backend(backend_name)
+    try:
+        return await _transcribe_once(backend, upload, upload_name, prompt)
+    except Exception:
+        fallback_name = TRANSCRIPTION_FALLBACK_BACKEND.lower()
+        if not fallback_name or fallback_name == backend.name:
+            raise
+    logging.warning(f"Falling back from {backend.name} to {fallback_name}")
+    return await _transcribe_once(get_backend(fallback_name), upload, upload_name, prompt)
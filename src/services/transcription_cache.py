@@ -0,0 +1,191 @@
+"""Transcription cache: in-memory LRU hot tier in front of the Postgres ``transcription_cache`` table.
+
+Forwarded voice notes keep their Telegram ``file_unique_id``, so a hit on it skips
+``get_file``, the download and Whisper. The sha256 of the downloaded bytes is the
+fallback key for the same audio re-uploaded as a new file.
+
+A hit answered from memory does not touch Postgres on the spot. It is counted and
+written (``hits``, ``last_hit_at``) in one batch every TRANSCRIPTION_CACHE_HIT_FLUSH_SECONDS
+and before each eviction, so entries that stay hot in memory are not evicted by TTL.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import BinaryIO, Generic, Optional, TypeVar
+
+from src.config import (
+    TRANSCRIPTION_CACHE_ENABLED,
+    TRANSCRIPTION_CACHE_HIT_FLUSH_SECONDS,
+    TRANSCRIPTION_CACHE_HOT_ENTRIES,
+    TRANSCRIPTION_CACHE_MAX_MB,
+    TRANSCRIPTION_CACHE_TTL_DAYS,
+)
+from src.services import db_service, metrics
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+_lookups = metrics.counter("transcription_cache_lookups_total", "Cache lookups by key kind, tier and result")
+_hit_ratio = metrics.gauge("transcription_cache_hit_ratio", "Share of lookups answered from the cache")
+_evicted = metrics.counter("transcription_cache_evicted_total", "Rows removed from the Postgres tier by TTL/size")
+
+
+@dataclass(frozen=True)
+class CachedTranscription:
+    text: str
+    duration: float
+    segments: Optional[str] = None  # JSON, see transcript.segments_to_json
+
+
+class LruCache(Generic[K, V]):
+    """Bounded mapping that forgets the least recently used key first."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(0, max_entries)
+        self._data: OrderedDict[K, V] = OrderedDict()
+
+    def get(self, key: K) -> Optional[V]:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def put(self, key: K, value: V) -> None:
+        if self.max_entries == 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K) -> None:
+        self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def sha256_of(audio: BinaryIO) -> str:
+    digest = hashlib.sha256()
+    audio.seek(0)
+    for chunk in iter(lambda: audio.read(64 * 1024), b""):
+        digest.update(chunk)
+    audio.seek(0)
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    def __init__(self, hot_entries: int = TRANSCRIPTION_CACHE_HOT_ENTRIES, enabled: bool = TRANSCRIPTION_CACHE_ENABLED):
+        self.enabled = enabled
+        self._hot: LruCache[str, CachedTranscription] = LruCache(hot_entries)
+        self._hits = 0
+        self._misses = 0
+        # (kind, key) -> memory hits not written to Postgres yet; see flush_hits
+        self._pending_hits: dict[tuple[str, str], int] = {}
+
+    def _count(self, kind: str, tier: str) -> None:
+        _lookups.inc(kind=kind, tier=tier)
+        if tier == "miss":
+            self._misses += 1
+        else:
+            self._hits += 1
+        _hit_ratio.set(self._hits / (self._hits + self._misses))
+
+    async def _lookup(self, kind: str, key: str) -> Optional[CachedTranscription]:
+        if not self.enabled or not key:
+            return None
+        hot_key = f"{kind}:{key}"
+        cached = self._hot.get(hot_key)
+        if cached is not None:
+            self._count(kind, "memory")
+            self._pending_hits[kind, key] = self._pending_hits.get((kind, key), 0) + 1
+            return cached
+        try:
+            if kind == "file_unique_id":
+                row = await db_service.get_cached_transcription(file_unique_id=key)
+            else:
+                row = await db_service.get_cached_transcription(sha256=key)
+        except Exception as e:
+            # The cache must never break a transcription
+            logging.warning("transcription cache lookup failed: %s", e)
+            row = None
+        if row is None:
+            self._count(kind, "miss")
+            return None
+        cached = CachedTranscription(row.text, row.duration_seconds, row.segments)
+        self._hot.put(hot_key, cached)
+        self._count(kind, "db")
+        return cached
+
+    async def by_file_unique_id(self, file_unique_id: Optional[str]) -> Optional[CachedTranscription]:
+        return await self._lookup("file_unique_id", file_unique_id)
+
+    async def by_sha256(self, sha256: Optional[str]) -> Optional[CachedTranscription]:
+        return await self._lookup("sha256", sha256)
+
+    async def store(
+        self, file_unique_id: str, sha256: Optional[str], text: str, duration: float, segments: Optional[str] = None
+    ) -> None:
+        if not self.enabled or not file_unique_id or not text:
+            return
+        cached = CachedTranscription(text, duration, segments)
+        self._hot.put(f"file_unique_id:{file_unique_id}", cached)
+        if sha256:
+            self._hot.put(f"sha256:{sha256}", cached)
+        try:
+            await db_service.put_cached_transcription(file_unique_id, sha256, text, duration, segments)
+        except Exception as e:
+            logging.warning("transcription cache store failed: %s", e)
+
+    async def flush_hits(self) -> int:
+        """
+        Write pending memory hits; returns the number of rows written. Never raises: on
+        failure the batch stays pending for the next flush.
+        """
+        if not self._pending_hits:
+            return 0
+        batch, self._pending_hits = self._pending_hits, {}
+        by_kind: dict[str, dict[str, int]] = {"file_unique_id": {}, "sha256": {}}
+        for (kind, key), hits in batch.items():
+            by_kind[kind][key] = hits
+        try:
+            return await db_service.touch_cached_transcriptions(by_kind["file_unique_id"], by_kind["sha256"])
+        except Exception as e:
+            logging.warning("transcription cache: hit flush of %s keys failed, kept for the next one: %s", len(batch), e)
+            for hot_key, hits in batch.items():
+                self._pending_hits[hot_key] = self._pending_hits.get(hot_key, 0) + hits
+            return 0
+
+    async def run_hit_flush(self, interval_seconds: float = TRANSCRIPTION_CACHE_HIT_FLUSH_SECONDS) -> None:
+        """Background loop: bulk-write the hits answered from memory."""
+        while self.enabled:
+            await asyncio.sleep(interval_seconds)
+            await self.flush_hits()
+
+    async def evict(self) -> int:
+        # Hot entries must look recently hit before the TTL cut-off is applied
+        await self.flush_hits()
+        removed = await db_service.evict_transcription_cache(
+            TRANSCRIPTION_CACHE_TTL_DAYS, int(TRANSCRIPTION_CACHE_MAX_MB * 1024 * 1024)
+        )
+        if removed:
+            _evicted.inc(removed)
+            logging.info("transcription cache: evicted %s rows", removed)
+        return removed
+
+    async def run_eviction(self, interval_seconds: float = 3600) -> None:
+        """Background loop: TTL and size eviction of the Postgres tier."""
+        while self.enabled:
+            try:
+                await self.evict()
+            except Exception as e:
+                logging.warning("transcription cache eviction failed: %s", e)
+            await asyncio.sleep(interval_seconds)
+
+
+transcription_cache = TranscriptionCache()
@@ -0,0 +1,545 @@
+"""Transcription jobs: admitted in the bot's update handler, run by the worker process pool.
+
+A job is everything a worker needs to download, transcribe, record and deliver one
+audio file without the original ``Message`` object. Jobs are rows in
+``transcription_jobs``; the result, the charge and the delivery are each recorded once,
+so a job retried after a restart neither bills nor answers the user twice.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import time
+import traceback
+from dataclasses import dataclass, field, fields
+from datetime import datetime, timezone
+from typing import Optional
+
+from aiogram import Bot, types
+from aiogram.types import BufferedInputFile, InlineKeyboardButton, InlineKeyboardMarkup
+from openai import OpenAIError
+
+from src.config import (
+    ADMIN_ID, BREAKER_RESET_SECONDS, INLINE_MAX_PAGES, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, PROBE_EDGE_BYTES,
+    RENDERED_FILES_CACHE_ENTRIES, TRANSCRIPTION_WORKERS,
+)
+from src.services.audio_probe import (
+    codec_hint, duration_from_edges, estimate_duration, fetch_edges, ffprobe_duration, mutagen_duration,
+)
+from src.services.album_batch import render_album
+from src.services.db_service import (
+    add_voice_message, claim_transcription_batch, claim_transcription_delivery, finish_transcription_delivery,
+    get_user_stats, get_voice_message, record_transcription, record_transcription_job_error,
+    release_transcription_delivery, save_transcription_job_result,
+)
+from src.services import balance_holds, metrics
+from src.services.google_sheets_service import gs_service
+from src.services.job_queue import DurableQueue, RetryLater, WorkerPool
+from src.services.openai_service import transcribe_audio
+from src.services.payment_service import get_tariff_price
+from src.services.progressive_delivery import TOO_LONG_NOTE, ProgressiveMessage, paginate, preformatted
+from src.services.resilience import CircuitOpen
+from src.services.transcript import FORMATS, Transcript, render, segments_from_json, segments_to_json
+from src.services.transcription_backends import is_transient_openai_error
+from src.services.transcription_cache import LruCache, sha256_of, transcription_cache
+from src.services.workspace import JobSpace, workspace
+
+_rendered_requests = metrics.counter("transcript_format_requests_total", "Transcript files requested by format and source")
+
+# A failed send (Telegram unreachable) is retried by running the job again after this long
+DELIVERY_RETRY_SECONDS = 30.0
+
+# transcribe_audio status_detail -> VoiceMessage.status
+TRANSCRIBE_STATUS_LABELS = {
+    "original": "Без сжатия",
+    "lossless": "Без потерь",
+    "normalized": "Нормализация",
+    "compressed": "Сжатие",
+    "trimmed": "Без пауз",
+    "chunked": "Частями",
+    "cached": "Кэш",
+}
+
+
+@dataclass
+class TranscriptionJob:
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    chat_id: int
+    status_message_id: int
+    file_id: str
+    file_unique_id: Optional[str]
+    file_path: Optional[str]  # from get_file; None when the text comes from the cache
+    file_size: int
+    mime_type: Optional[str]
+    duration: float
+    duration_exact: bool  # False: admitted on a lower bound, measure after download
+    cached_text: Optional[str] = None
+    cached_segments: Optional[str] = None
+    backend: Optional[str] = None  # transcription_backends name, chosen at admission; None = TRANSCRIPTION_BACKEND
+    file_name: Optional[str] = None
+    hold_id: Optional[int] = None  # balance_holds row reserved at admission; None for jobs queued before holds
+    # Album members share batch_id and the status message; one combined result is sent
+    batch_id: Optional[str] = None
+    batch_index: int = 0
+    batch_size: int = 1
+    # Set once the job is persisted (None for cache hits answered inline)
+    id: Optional[int] = field(default=None, metadata={"persisted": False})
+    attempts: int = field(default=0, metadata={"persisted": False})
+    result_text: Optional[str] = field(default=None, metadata={"persisted": False})
+    result_status: Optional[str] = field(default=None, metadata={"persisted": False})
+    result_trimmed_duration: Optional[float] = field(default=None, metadata={"persisted": False})
+    result_segments: Optional[str] = field(default=None, metadata={"persisted": False})
+    voice_message_id: Optional[int] = field(default=None, metadata={"persisted": False})
+
+    def queue_fields(self) -> dict:
+        """Columns for ``transcription_jobs`` (user_id is passed separately)."""
+        return {
+            f.name: getattr(self, f.name) for f in fields(self)
+            if f.metadata.get("persisted", True) and f.name not in ("user_id", *_ADMISSION_ONLY)
+        }
+
+    @classmethod
+    def from_record(cls, record) -> "TranscriptionJob":
+        return cls(**{f.name: getattr(record, f.name) for f in fields(cls) if f.name not in _ADMISSION_ONLY})
+
+
+# Cache hits found at admission; answered inline, never stored with the job
+_ADMISSION_ONLY = ("cached_text", "cached_segments")
+
+
+job_queue: DurableQueue[TranscriptionJob] = DurableQueue(TranscriptionJob.from_record, lambda job: job.id)
+job_pool: WorkerPool[TranscriptionJob] = WorkerPool(job_queue, TRANSCRIPTION_WORKERS)
+
+
+def get_feedback_kb(voice_message_id: Optional[int] = None):
+    """Feedback buttons; with a stored transcript also buttons for the other file formats."""
+    rows = [[
+        InlineKeyboardButton(text="✅ Да", callback_data="feedback_yes"),
+        InlineKeyboardButton(text="❌ Нет", callback_data="feedback_no")
+    ]]
+    if voice_message_id is not None:
+        rows.append(get_format_row(voice_message_id))
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def get_format_row(voice_message_id: int) -> list[InlineKeyboardButton]:
+    return [
+        InlineKeyboardButton(text=fmt.upper(), callback_data=f"fmt_{voice_message_id}_{fmt}")
+        for fmt in FORMATS if fmt != "txt"
+    ]
+
+
+async def send_text_inline(bot: Bot, chat_id: int, text: str) -> None:
+    """
+    The transcript as preformatted messages of at most PAGE_CHARS each (HTML-escaped, so
+    backticks or asterisks in the text cannot break the markup). Longer than
+    INLINE_MAX_PAGES messages: only a note, the file follows.
+    """
+    pages = paginate(text)
+    if len(pages) > INLINE_MAX_PAGES:
+        await bot.send_message(chat_id, TOO_LONG_NOTE)
+        return
+    for page in pages:
+        if page:
+            await bot.send_message(chat_id, preformatted(page), parse_mode="HTML")
+
+
+async def send_limit_exceeded(bot: Bot, chat_id: int, duration: float, missing_seconds: float):
+    text = (
+        "⛔️ **Недостаточно минут!**\n\n"
+        f"Для расшифровки этого файла ({int(duration)} сек) вам не хватает **{int(missing_seconds)} секунд**."
+    )
+
+    needed_minutes = math.ceil(missing_seconds / 60)
+    price = get_tariff_price(needed_minutes)
+
+    upsell_kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"Купить {needed_minutes} мин за {price} ₽", callback_data=f"buy_{needed_minutes}")],
+        [InlineKeyboardButton(text="💎 Выбрать тариф", callback_data="payment_back_to_tariffs")]
+    ])
+
+    await bot.send_message(chat_id, text, reply_markup=upsell_kb, parse_mode="Markdown")
+
+
+# --- Download and duration helpers ---
+async def download_to_buffer(bot: Bot, file_path: str, space: JobSpace):
+    """Downloads a Telegram file into a spooled buffer (memory first, the job's directory only above AUDIO_SPOOL_MAX_BYTES)."""
+    buffer = space.spool()
+    try:
+        await bot.download_file(file_path, buffer)
+    except Exception:
+        buffer.close()
+        raise
+    buffer.seek(0)
+    return buffer
+
+
+def upload_name(file_id: str, file_path: str) -> str:
+    ext = os.path.splitext(file_path)[1]
+    if not ext: ext = ".ogg"
+    return f"{file_id}{ext}"
+
+
+async def probe_remote_duration(bot: Bot, file: types.File) -> float:
+    """Duration from the first/last PROBE_EDGE_BYTES of a Telegram file, then ffprobe over its download. 0 if unknown."""
+    # The file URL holds the bot token: it never goes on a command line or into a log
+    url = bot.session.api.file_url(bot.token, file.file_path)
+    try:
+        session = await bot.session.create_session()
+        head, tail = await fetch_edges(session, url, file.file_size or 0, PROBE_EDGE_BYTES)
+        duration = duration_from_edges(head, tail, file.file_size or len(head))
+        if duration:
+            return duration
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            return await ffprobe_duration(resp.content.iter_chunked(64 * 1024))
+    except Exception as e:
+        logging.warning(f"Remote probe failed for {file.file_unique_id}: {str(e).replace(bot.token, '***')}")
+        return 0.0
+
+
+async def get_audio_duration(audio, file_size: int, hint: str = None) -> float:
+    """Duration of a downloaded buffer: mutagen, ffprobe, then an estimate from size and codec bitrate."""
+    duration = mutagen_duration(audio)
+    if not duration:
+        duration = await ffprobe_duration(audio)
+    if not duration:
+        duration = estimate_duration(file_size, hint)
+        logging.info(f"Duration estimated from size: {duration:.0f}s ({hint or 'unknown codec'})")
+    return duration
+
+
+# --- Job runner ---
+async def run_transcription_job(bot: Bot, job: TranscriptionJob):
+    """Download, transcribe, charge, record and deliver one admitted job."""
+    chat_id = job.chat_id
+    duration = job.duration
+    audio = None
+    space = None
+    # Long files: partial text shows up in the status message as chunks finish (albums share
+    # one status message, so their files report nothing until the combined result)
+    progress = ProgressiveMessage(bot, chat_id, job.status_message_id)
+    on_progress = progress.update if job.batch_id is None else None
+    # The job comes back later (deferred or interrupted by shutdown): its hold stays
+    keep_hold = False
+
+    try:
+        if job.cached_text is None and job.result_text is None:
+            if job.attempts > 1:
+                # Retried after a restart: the download link from admission may have expired
+                job.file_path = (await bot.get_file(job.file_id)).file_path
+            # Waits here while the workspace quota is used up by other jobs
+            space = await workspace.acquire(f"job{job.id}" if job.id is not None else job.file_unique_id, job.file_size)
+            audio = await download_to_buffer(bot, job.file_path, space)
+
+        # Admitted on a lower bound: measure the downloaded file and re-check
+        if not job.duration_exact and job.result_text is None:
+            duration = await get_audio_duration(audio, job.file_size or 0, codec_hint(job.mime_type, job.file_path))
+            if duration == 0:
+                await report_failure(bot, job, "Не удалось определить длительность аудио.")
+                return
+            can_process, missing_seconds = await balance_holds.resize(job.hold_id, job.user_id, duration)
+            if not can_process:
+                if job.batch_id is not None:
+                    await report_failure(bot, job, f"Недостаточно минут: не хватает {int(missing_seconds)} сек.")
+                    return
+                await bot.delete_message(chat_id=chat_id, message_id=job.status_message_id)
+                await send_limit_exceeded(bot, chat_id, duration, missing_seconds)
+                return
+
+        # Let's update status message (a job retried only for delivery is past this point)
+        if job.batch_id is None and job.result_text is None:
+            await bot.edit_message_text("Отправляю в обработку... / Sending to processing...", chat_id=chat_id, message_id=job.status_message_id)
+
+        start_time = time.time()
+
+        try:
+            trimmed_duration = job.result_trimmed_duration
+            text_result = job.cached_text if job.cached_text is not None else job.result_text
+            segments = job.cached_segments if job.cached_text is not None else job.result_segments
+            if text_result is None:
+                # Same bytes uploaded again as a new file
+                audio_hash = sha256_of(audio)
+                cached = await transcription_cache.by_sha256(audio_hash)
+                if cached is not None:
+                    text_result, segments = cached.text, cached.segments
+
+            if job.result_text is not None:
+                final_status = job.result_status
+            elif text_result is not None:
+                final_status = TRANSCRIBE_STATUS_LABELS["cached"]
+            else:
+                result = await transcribe_audio(
+                    audio, upload_name(job.file_id, job.file_path), duration, job.backend, on_progress=on_progress
+                )
+                text_result = result.text
+                trimmed_duration = result.trimmed_duration
+                segments = segments_to_json(result.segments) if result.segments else None
+
+                # Map status_detail to human readable string for DB/Logs
+                final_status = TRANSCRIBE_STATUS_LABELS.get(result.status_detail, "Сжатие")
+                await transcription_cache.store(job.file_unique_id, audio_hash, text_result, duration, segments)
+
+            if job.id is not None and job.result_text is None:
+                await save_transcription_job_result(job.id, text_result, final_status, duration, trimmed_duration, segments)
+
+        except ValueError as ve:
+            # Handled errors from service
+            final_status = "Ошибка" # General Russian fail status
+            error_raw = str(ve)
+
+            if "COMPRESSION_FAILED" in error_raw:
+                await report_failure(bot, job, "⚠️ Ошибка при обработке файла.")
+                error = "Ошибка сжатия"
+            else:
+                await report_failure(bot, job, "⚠️ Ошибка при расшифровке.")
+                error = "Ошибка Whisper"
+
+            # Log failure
+            await add_voice_message(job.user_id, duration, 0, 0, final_status, error, text=None)
+            asyncio.create_task(gs_service.log_voice_message({
+                "user_id": job.user_id,
+                "process_speed": 0,
+                "length_sec": duration,
+                "length_chars": 0,
+                "status": final_status,
+                "error_reason": error
+            }))
+            return
+
+        processing_time = round(time.time() - start_time, 2)
+        text_len = len(text_result)
+
+        voice_message_id = job.voice_message_id
+        if voice_message_id is None:
+            # User, charge, FIFO deduction, VoiceMessage and the job's charged mark: one transaction.
+            # None = an earlier attempt of this job was already billed.
+            recorded = await record_transcription(
+                job.user_id, job.username, job.first_name, duration, text_len, processing_time, final_status,
+                text_result, trimmed_duration=trimmed_duration, segments=segments, job_id=job.id, hold_id=job.hold_id,
+            )
+            if recorded is not None:
+                voice_message_id, _ = recorded
+        job.hold_id = None  # settled by the charge (or by the earlier attempt that was billed)
+
+        # Stats logging (off the delivery path)
+        asyncio.create_task(gs_service.log_voice_message({
+            "user_id": job.user_id,
+            "process_speed": processing_time,
+            "length_sec": duration,
+            "length_chars": text_len,
+            "status": final_status,
+            "error_reason": ""
+        }))
+        asyncio.create_task(_sync_user_stats(job.user_id))
+
+        if job.batch_id is not None:
+            # The last file of the album to finish sends the combined result
+            try:
+                await deliver_album(bot, job)
+            except RetryLater:
+                raise
+            except Exception as e:
+                if job.attempts >= JOB_MAX_ATTEMPTS:
+                    raise
+                raise _delivery_retry(job, e) from e
+            return
+
+        # Result document is built in memory, nothing is written to disk
+        timestamp = datetime.now(timezone.utc).strftime("%d.%m.%Y_%H-%M")
+        input_file = BufferedInputFile(text_result.encode("utf-8"), filename=f"{timestamp}.txt")
+
+        if job.id is not None:
+            claim = await claim_transcription_delivery(job.id, JOB_LEASE_SECONDS)
+            if claim == "delivered":
+                logging.info(f"Job {job.id}: result already delivered, skipping")
+                return
+            if claim == "busy":
+                # Another worker is sending it; if that one dies, its claim runs out and this retry takes over
+                raise RetryLater(JOB_LEASE_SECONDS, "delivery in progress elsewhere")
+
+        try:
+            await progress.close()
+            if progress.started:
+                # The text is already in the chat: complete it there, then the file
+                await progress.finish(text_result)
+            else:
+                try:
+                    await bot.delete_message(chat_id=chat_id, message_id=job.status_message_id)
+                except Exception:
+                    pass  # an earlier, interrupted delivery attempt already removed it
+                await send_text_inline(bot, chat_id, text_result)
+            await bot.send_document(
+                chat_id, input_file, caption="Вам понравилась расшифровка?", reply_markup=get_feedback_kb(voice_message_id)
+            )
+        except Exception as e:
+            if job.id is None:
+                raise
+            await release_transcription_delivery([job.id])
+            if job.attempts >= JOB_MAX_ATTEMPTS:
+                raise
+            raise _delivery_retry(job, e) from e
+        if job.id is not None:
+            await finish_transcription_delivery([job.id])
+
+    except CircuitOpen as co:
+        # Upstream is down: keep the job and retry once the breaker lets calls through
+        logging.warning(f"Job {job.id}: {co}")
+        if job.id is None:
+            raise
+        try:
+            await bot.edit_message_text(
+                "⏳ Сервис расшифровки временно недоступен. Файл в очереди, расшифровка придёт автоматически.",
+                chat_id=chat_id, message_id=job.status_message_id,
+            )
+        except Exception:
+            pass  # same text already shown on an earlier deferral
+        keep_hold = True
+        raise RetryLater(max(co.retry_after, 1.0), str(co))
+
+    except OpenAIError as oe:
+        if job.id is not None and is_transient_openai_error(oe) and job.attempts < JOB_MAX_ATTEMPTS:
+            # Retries inside the call ran out; try the whole job again later instead of failing it
+            keep_hold = True
+            raise RetryLater(BREAKER_RESET_SECONDS, f"OpenAI: {oe}", consume_attempt=True)
+        logging.error(f"OpenAI API Error: {oe}")
+        await report_failure(bot, job, "⚠️ Сервис расшифровки временно недоступен (ошибка API). Попробуйте позже.")
+
+        if ADMIN_ID:
+            await bot.send_message(
+                ADMIN_ID,
+                f"🚨 **OpenAI Error**\nUser: {job.user_id} (@{job.username})\nError: `{oe}`"
+            )
+
+    except RetryLater:
+        raise  # delivery comes again; the result and the charge are kept
+
+    except Exception as e:
+        logging.error(f"Critical error processing voice: {e}")
+        logging.error(traceback.format_exc())
+        await report_critical_error(bot, job, e)
+
+    except asyncio.CancelledError:
+        keep_hold = True
+        raise
+
+    finally:
+        if not keep_hold:
+            await balance_holds.release([job.hold_id])
+        await progress.close()
+        if audio is not None:
+            audio.close()
+        if space is not None:
+            await space.release()
+
+
+# (user_id, voice_message_id, format) -> Telegram file_id of the document already sent once.
+# Only the owner's requests are stored, so a hit is an ownership check already passed.
+_rendered_files: LruCache[tuple[int, int, str], str] = LruCache(RENDERED_FILES_CACHE_ENTRIES)
+
+
+async def send_transcript_file(bot: Bot, chat_id: int, user_id: int, voice_message_id: int, fmt: str) -> bool:
+    """
+    The stored transcript as ``fmt`` (SRT, VTT, JSON, TXT). Rendered on the first request
+    only; after that Telegram's file_id is resent. False if it is not this user's transcript.
+    """
+    key = (user_id, voice_message_id, fmt)
+    file_id = _rendered_files.get(key)
+    if file_id is not None:
+        _rendered_requests.inc(format=fmt, source="cache")
+        await bot.send_document(chat_id, file_id)
+        return True
+    voice = await get_voice_message(voice_message_id)
+    if voice is None or voice.user_id != user_id or voice.transcription_text is None:
+        return False
+    transcript = Transcript(voice.transcription_text, segments_from_json(voice.transcription_segments))
+    data = render(transcript, fmt, voice.duration_seconds or 0.0)
+    sent = await bot.send_document(chat_id, BufferedInputFile(data, filename=f"transcript_{voice_message_id}.{fmt}"))
+    _rendered_requests.inc(format=fmt, source="rendered")
+    if sent.document is not None:
+        _rendered_files.put(key, sent.document.file_id)
+    return True
+
+
+def _delivery_retry(job: TranscriptionJob, error: Exception) -> RetryLater:
+    """A send failed and its claim was given up: the job runs again (result and charge are kept) and resends."""
+    logging.warning(f"Job {job.id}: delivery failed ({error}), retrying")
+    return RetryLater(DELIVERY_RETRY_SECONDS, f"delivery failed: {error}", consume_attempt=True)
+
+
+async def _sync_user_stats(user_id: int):
+    if not gs_service.sheet:
+        return  # Sheets not configured: skip the stats queries altogether
+    try:
+        await gs_service.update_user_stats(await get_user_stats(user_id))
+    except Exception as e:
+        logging.warning(f"User stats sync failed for {user_id}: {e}")
+
+
+async def report_failure(bot: Bot, job: TranscriptionJob, text: str):
+    """A single file: ``text`` replaces the status message. An album file: ``text`` becomes its entry in the combined result."""
+    if job.batch_id is not None and job.id is not None:
+        await record_transcription_job_error(job.id, text)
+        try:
+            await deliver_album(bot, job)
+        except RetryLater:
+            pass  # another worker is sending the album; if it died, its own job's retry sends it
+        return
+    await bot.delete_message(chat_id=job.chat_id, message_id=job.status_message_id)
+    await bot.send_message(job.chat_id, text)
+
+
+async def deliver_album(bot: Bot, job: TranscriptionJob):
+    """Send the album's combined result if every file is finished and nobody sent it yet."""
+    claim, records = await claim_transcription_batch(job.batch_id, JOB_LEASE_SECONDS)
+    if claim == "busy":
+        raise RetryLater(JOB_LEASE_SECONDS, "album delivery in progress elsewhere")
+    if claim != "claimed":
+        return
+    text = render_album([
+        (r.file_name or f"Файл {r.batch_index + 1}", r.result_text, r.error) for r in records
+    ])
+    job_ids = [r.id for r in records]
+    try:
+        try:
+            await bot.delete_message(chat_id=job.chat_id, message_id=job.status_message_id)
+        except Exception:
+            pass  # an earlier, interrupted delivery attempt already removed it
+        await send_text_inline(bot, job.chat_id, text)
+        timestamp = datetime.now(timezone.utc).strftime("%d.%m.%Y_%H-%M")
+        input_file = BufferedInputFile(text.encode("utf-8"), filename=f"{timestamp}_album.txt")
+        await bot.send_document(job.chat_id, input_file, caption="Вам понравилась расшифровка?", reply_markup=get_feedback_kb())
+    except Exception:
+        await release_transcription_delivery(job_ids)
+        raise
+    await finish_transcription_delivery(job_ids)
+
+
+async def report_critical_error(bot: Bot, job: TranscriptionJob, e: Exception):
+    await report_failure(bot, job, "Произошла внутренняя ошибка сервера. Мы уже разбираемся.")
+
+    if ADMIN_ID:
+        tb = traceback.format_exc()[-1000:] # Last 1000 chars
+        await bot.send_message(
+            ADMIN_ID,
+            f"🚨 **Critical Error**\nUser: {job.user_id} (@{job.username})\nError: `{e}`\nTrace:\n`{tb}`",
+            parse_mode="Markdown"
+        )
+
+
+async def report_abandoned_job(bot: Bot, job: TranscriptionJob):
+    """A job that kept dying with its worker (attempts exhausted) and is now failed."""
+    logging.error(f"Job {job.id} failed after {job.attempts} attempts")
+    if job.batch_id is not None:
+        await report_failure(bot, job, "Не удалось обработать файл. Пожалуйста, отправьте его ещё раз.")
+        return
+    try:
+        await bot.delete_message(chat_id=job.chat_id, message_id=job.status_message_id)
+    except Exception:
+        pass
+    await bot.send_message(job.chat_id, "⚠️ Не удалось обработать файл. Пожалуйста, отправьте его ещё раз.")
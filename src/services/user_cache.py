@@ -0,0 +1,185 @@
+"""In-process cache of user profile and balance, kept correct across processes.
+
+Balance reads (the balance menu, ``check_user_limit``, the /start touch) come from here.
+Every write in ``db_service`` that changes a user's balance or name puts the new row
+into the cache (write-through). Other processes (bot, workers) are heard through
+Postgres: a trigger on ``users`` sends the changed row on the ``user_changed`` channel
+(migration 011), and ``run_invalidation`` drops a cached user whose row differs from it.
+
+Write-throughs and reads that missed race with concurrent changes. Each one is stamped
+with ``begin()`` before it talks to the database, and ``put`` skips it if the user
+changed in between. Without a working LISTEN connection (not started yet, reconnecting)
+the cache answers nothing, so a missed notification can never leave a stale balance
+behind; entries also expire after ``USER_CACHE_TTL_SECONDS``. Only the bot listens:
+workers read balances rarely, so there the cache stays off.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from src.config import USER_CACHE_ENTRIES, USER_CACHE_TTL_SECONDS
+from src.services import metrics
+
+CHANNEL = "user_changed"
+PING_SECONDS = 30.0
+RECONNECT_SECONDS = 5.0
+
+_lookups = metrics.counter("user_cache_lookups_total", "User/balance cache lookups by result")
+_hit_ratio = metrics.gauge("user_cache_hit_ratio", "Share of user/balance lookups answered from memory")
+_invalidations = metrics.counter("user_cache_invalidations_total", "Cached users dropped after a change elsewhere")
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    balance_seconds: float
+    used_free_seconds: float
+    held_seconds: float
+
+    @classmethod
+    def of(cls, row) -> "CachedUser":
+        """From a ``User`` or any row with the same attribute names."""
+        return cls(
+            row.id, row.username, row.first_name,
+            float(row.balance_seconds), float(row.used_free_seconds), float(row.held_seconds or 0.0),
+        )
+
+    @classmethod
+    def from_notification(cls, row: dict) -> Optional["CachedUser"]:
+        """From a ``user_changed`` payload; None for a deleted user (the payload has only its id)."""
+        if "balance_seconds" not in row:
+            return None
+        return cls(
+            int(row["id"]), row.get("username"), row.get("first_name"),
+            float(row["balance_seconds"]), float(row["used_free_seconds"]), float(row["held_seconds"] or 0.0),
+        )
+
+
+class UserCache:
+    def __init__(
+        self, max_entries: int = USER_CACHE_ENTRIES, ttl_seconds: float = USER_CACHE_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max(0, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._data: OrderedDict[int, tuple[CachedUser, float]] = OrderedDict()
+        # Change sequence: user id -> seq of its last put/invalidation. Pruned by raising
+        # the floor: a stamp below the floor counts as "changed since".
+        self._seq = 0
+        self._changed: dict[int, int] = {}
+        self._floor = 0
+        self.listening = False
+        self._hits = 0
+        self._misses = 0
+
+    def _count(self, result: str) -> None:
+        _lookups.inc(result=result)
+        if result == "hit":
+            self._hits += 1
+        else:
+            self._misses += 1
+        _hit_ratio.set(self._hits / (self._hits + self._misses))
+
+    def _mark(self, user_id: int) -> None:
+        self._seq += 1
+        self._changed[user_id] = self._seq
+        if len(self._changed) > 4 * max(self.max_entries, 1024):
+            self._changed.clear()
+            self._floor = self._seq
+
+    def begin(self) -> int:
+        """Stamp taken before a database read or write whose result goes to ``put``."""
+        return self._seq
+
+    def get(self, user_id: int) -> Optional[CachedUser]:
+        if not self.listening or self.max_entries == 0:
+            return None
+        entry = self._data.get(user_id)
+        if entry is None or entry[1] <= self._clock():
+            if entry is not None:
+                del self._data[user_id]
+            self._count("miss")
+            return None
+        self._data.move_to_end(user_id)
+        self._count("hit")
+        return entry[0]
+
+    def put(self, user: CachedUser, since: int) -> None:
+        """Cache ``user`` as read or written after ``since``; dropped if it changed meanwhile."""
+        stale = since < self._floor or self._changed.get(user.id, -1) > since
+        self._mark(user.id)
+        if stale or not self.listening or self.max_entries == 0:
+            self._data.pop(user.id, None)
+            return
+        self._data[user.id] = (user, self._clock() + self.ttl_seconds)
+        self._data.move_to_end(user.id)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        self._mark(user_id)
+        self._data.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._changed.clear()
+        self._seq += 1
+        self._floor = self._seq
+
+    def on_change(self, payload: str) -> None:
+        """A ``user_changed`` notification: keep the entry if it already holds this row, else drop it."""
+        try:
+            row = json.loads(payload)
+            user_id = int(row["id"])
+        except (ValueError, KeyError, TypeError):
+            logging.warning("User cache: bad notification %r, clearing", payload)
+            self.clear()
+            return
+        entry = self._data.get(user_id)
+        if entry is not None and entry[0] == CachedUser.from_notification(row):
+            return  # our own write-through, already cached
+        if entry is not None:
+            _invalidations.inc()
+        self.invalidate(user_id)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    async def run_invalidation(self, engine) -> None:
+        """Background loop: LISTEN on ``user_changed`` over a dedicated pool connection."""
+        while True:
+            try:
+                async with engine.connect() as conn:
+                    raw = (await conn.get_raw_connection()).driver_connection
+                    listener = lambda _conn, _pid, _channel, payload: self.on_change(payload)
+                    await raw.add_listener(CHANNEL, listener)
+                    # Changes made while nobody listened are unknown: start empty
+                    self.clear()
+                    self.listening = True
+                    try:
+                        while True:
+                            await asyncio.sleep(PING_SECONDS)
+                            await raw.execute("SELECT 1")  # a dead connection surfaces here
+                    finally:
+                        self.listening = False
+                        self.clear()
+                        if not raw.is_closed():
+                            await raw.remove_listener(CHANNEL, listener)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning("User cache: LISTEN connection lost (%s), cache off until it is back", e)
+            await asyncio.sleep(RECONNECT_SECONDS)
+
+
+user_cache = UserCache()
@@ -0,0 +1,129 @@
+"""Energy-based voice activity detection on mono s16le PCM (vectorized with NumPy)."""
+
+from __future__ import annotations
+
+from typing import Sequence
+
+import numpy as np
+
+Span = tuple[float, float]  # (start, end) in seconds
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.03
+# -50 dBFS: anything quieter is never speech, whatever the noise floor looks like
+ABS_FLOOR = 10 ** (-50 / 20)
+
+
+class RmsAccumulator:
+    """Turns a stream of s16le PCM chunks into per-frame RMS without keeping the samples."""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, frame_seconds: float = FRAME_SECONDS):
+        self.frame_len = max(1, int(sample_rate * frame_seconds))
+        self.frame_seconds = self.frame_len / sample_rate
+        self._pending = b""
+        self._frames: list[np.ndarray] = []
+
+    def feed(self, chunk: bytes) -> None:
+        data = self._pending + chunk
+        frame_bytes = self.frame_len * 2
+        usable = len(data) - len(data) % frame_bytes
+        self._pending = data[usable:]
+        if usable:
+            samples = np.frombuffer(data[:usable], dtype="<i2")
+            self._frames.append(frame_rms(samples, self.frame_len))
+
+    def result(self) -> np.ndarray:
+        if not self._frames:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate(self._frames)
+
+
+def frame_rms(samples: np.ndarray, frame_len: int) -> np.ndarray:
+    """RMS of consecutive whole frames, normalized to full scale (0..1)."""
+    n = len(samples) // frame_len
+    frames = samples[: n * frame_len].astype(np.float32).reshape(n, frame_len) / 32768.0
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+def speech_mask(rms: np.ndarray, hangover_frames: int = 10, preroll_frames: int = 3) -> np.ndarray:
+    """
+    Frames above an adaptive threshold, dilated ``hangover_frames`` forward and
+    ``preroll_frames`` backward so word tails and onsets are not clipped.
+    """
+    if rms.size == 0:
+        return np.zeros(0, dtype=bool)
+    noise = np.percentile(rms, 10)
+    loud = np.percentile(rms, 90)
+    # 3x the noise floor, but never so high that steady speech itself becomes "silence"
+    threshold = max(ABS_FLOOR, min(noise * 3.0, loud * 0.3))
+    raw = rms > threshold
+    kernel = np.ones(hangover_frames + preroll_frames + 1, dtype=np.int32)
+    smoothed = np.convolve(raw.astype(np.int32), kernel, mode="full")
+    # full convolution: index i + preroll covers raw[i - hangover .. i + preroll]
+    return smoothed[preroll_frames: preroll_frames + raw.size] > 0
+
+
+def mask_to_spans(mask: np.ndarray, frame_seconds: float) -> list[Span]:
+    if mask.size == 0:
+        return []
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return [(float(s * frame_seconds), float(e * frame_seconds)) for s, e in zip(starts, ends)]
+
+
+def merge_spans(spans: Sequence[Span], min_gap: float, max_spans: int = 0) -> list[Span]:
+    """Close gaps shorter than ``min_gap``; with ``max_spans`` also close the smallest gaps until it fits."""
+    merged: list[Span] = []
+    for start, end in spans:
+        if merged and start - merged[-1][1] < min_gap:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    if max_spans and len(merged) > max_spans:
+        gaps = np.array([merged[i + 1][0] - merged[i][1] for i in range(len(merged) - 1)])
+        # keep the (max_spans - 1) widest gaps as cut points
+        keep = set(np.argsort(gaps)[len(gaps) - (max_spans - 1):].tolist()) if max_spans > 1 else set()
+        out: list[Span] = [merged[0]]
+        for i in range(1, len(merged)):
+            if (i - 1) in keep:
+                out.append(merged[i])
+            else:
+                out[-1] = (out[-1][0], merged[i][1])
+        merged = out
+    return merged
+
+
+def detect_speech(
+    rms: np.ndarray,
+    frame_seconds: float = FRAME_SECONDS,
+    min_silence: float = 1.0,
+    max_spans: int = 500,
+) -> list[Span]:
+    """Speech spans from frame RMS; only silences of at least ``min_silence`` separate spans."""
+    return merge_spans(mask_to_spans(speech_mask(rms), frame_seconds), min_silence, max_spans)
+
+
+def speech_seconds(spans: Sequence[Span]) -> float:
+    return float(sum(end - start for start, end in spans))
+
+
+def trimmed_boundaries(spans: Sequence[Span]) -> list[float]:
+    """Where the removed silences were, on the timeline of the trimmed audio."""
+    out: list[float] = []
+    elapsed = 0.0
+    for start, end in spans[:-1]:
+        elapsed += end - start
+        out.append(elapsed)
+    return out
+
+
+def silence_midpoints(spans: Sequence[Span]) -> list[float]:
+    """Middle of every silence between spans, on the original timeline."""
+    return [(spans[i][1] + spans[i + 1][0]) / 2 for i in range(len(spans) - 1)]
+
+
+def aselect_filter(spans: Sequence[Span]) -> str:
+    """ffmpeg ``-af`` filter that keeps only ``spans`` and closes the gaps."""
+    expr = "+".join(f"between(t,{start:.3f},{end:.3f})" for start, end in spans)
+    return f"aselect='{expr}',asetpts=N/SR/TB"
@@ -0,0 +1,215 @@
+"""Scratch space for jobs: one directory per job under WORKSPACE_DIR, a global byte quota.
+
+Downloads stay in memory up to AUDIO_SPOOL_MAX_BYTES and spill into the job's own
+directory beyond that. The directory is removed when the job ends; directories left
+by a process that died are swept at startup and then periodically.
+
+The quota counts the announced size of every file being worked on (memory and disk
+alike) by every process sharing WORKSPACE_DIR (bot and workers mount the same
+directory): each job directory records its reservation in a ``.reserved`` file, and
+reservations are checked and made under an exclusive ``flock`` on the root. A job that
+would exceed the quota waits until others finish, except when nothing else is
+reserved, so a single file larger than the quota still goes through. A directory left
+by a dead process keeps its reservation until it is swept.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import time
+import uuid
+from typing import Optional
+
+from src.config import (
+    AUDIO_SPOOL_MAX_BYTES,
+    WORKSPACE_DIR,
+    WORKSPACE_ORPHAN_SECONDS,
+    WORKSPACE_QUOTA_MB,
+)
+from src.services import metrics
+
+_reserved_gauge = metrics.gauge("workspace_reserved_bytes", "Bytes reserved by jobs in the workspace")
+_waits = metrics.counter("workspace_quota_waits_total", "Jobs that waited for workspace quota")
+_swept = metrics.counter("workspace_orphans_swept_total", "Leftover job directories removed")
+
+LOCK_FILE = ".quota.lock"
+RESERVED_FILE = ".reserved"
+# Releases in other processes are not announced: a waiting job re-checks the quota this often
+QUOTA_POLL_SECONDS = 1.0
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _last_modified(path: str) -> float:
+    """Newest mtime of a job directory and the files in it (a spilled download keeps growing)."""
+    newest = os.path.getmtime(path)
+    for entry in os.scandir(path):
+        try:
+            newest = max(newest, entry.stat().st_mtime)
+        except FileNotFoundError:
+            pass
+    return newest
+
+
+class JobSpace:
+    """A job's directory and its share of the quota; ``release`` gives both back."""
+
+    def __init__(self, workspace: "Workspace", path: str, reserved: int):
+        self.workspace = workspace
+        self.path = path
+        self.reserved = reserved
+        self._released = False
+
+    def spool(self, max_size: int = AUDIO_SPOOL_MAX_BYTES) -> tempfile.SpooledTemporaryFile:
+        return tempfile.SpooledTemporaryFile(max_size=max_size, dir=self.path)
+
+    async def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        await self.workspace._release(self)
+
+
+class Workspace:
+    def __init__(self, root: str, quota_bytes: int, orphan_seconds: float = WORKSPACE_ORPHAN_SECONDS):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.orphan_seconds = orphan_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.reserved = 0  # by this process
+        self._active: set[str] = set()
+        # Created lazily: on Python 3.9 a Condition binds to the loop it was created in
+        self._changed: Optional[asyncio.Condition] = None
+
+    def _condition(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    def reserved_total(self) -> int:
+        """Bytes reserved by all job directories under the root, whichever process made them."""
+        total = 0
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                with open(os.path.join(entry.path, RESERVED_FILE)) as f:
+                    total += int(f.read() or 0)
+            except (FileNotFoundError, NotADirectoryError, ValueError):
+                pass
+        return total
+
+    def _try_reserve(self, path: str, expected_bytes: int) -> Optional[int]:
+        """Create the job directory with its reservation if the quota allows; the new total, else None."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, LOCK_FILE), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)  # released when the file is closed
+            total = self.reserved_total()
+            if total and total + expected_bytes > self.quota_bytes:
+                return None
+            os.makedirs(path)
+            try:
+                with open(os.path.join(path, RESERVED_FILE), "w") as f:
+                    f.write(str(expected_bytes))
+            except Exception:
+                shutil.rmtree(path, ignore_errors=True)
+                raise
+            return total + expected_bytes
+
+    async def acquire(self, key: str, expected_bytes: int) -> JobSpace:
+        """Reserve ``expected_bytes`` (waiting for quota if needed) and create a fresh directory."""
+        expected_bytes = max(0, expected_bytes)
+        name = f"{key}-{uuid.uuid4().hex[:8]}@{self.owner}"
+        path = os.path.join(self.root, name)
+        changed = self._condition()
+        waited = False
+        while True:
+            total = await asyncio.to_thread(self._try_reserve, path, expected_bytes)
+            if total is not None:
+                break
+            if not waited:
+                waited = True
+                _waits.inc()
+                logging.info("Workspace: %s waits for quota (%s bytes wanted, quota %s)", key, expected_bytes, self.quota_bytes)
+            # A release in this process wakes us at once, one elsewhere within the poll interval
+            async with changed:
+                try:
+                    await asyncio.wait_for(changed.wait(), QUOTA_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        self.reserved += expected_bytes
+        _reserved_gauge.set(total)
+        self._active.add(name)
+        return JobSpace(self, path, expected_bytes)
+
+    async def _release(self, space: JobSpace) -> None:
+        self._active.discard(os.path.basename(space.path))
+        shutil.rmtree(space.path, ignore_errors=True)
+        await self._unreserve(space.reserved)
+
+    async def _unreserve(self, n: int) -> None:
+        changed = self._condition()
+        async with changed:
+            self.reserved -= n
+            changed.notify_all()
+        _reserved_gauge.set(self.reserved_total())
+
+    def sweep(self) -> int:
+        """Remove job directories nobody owns: their process is gone, or they are older than ``orphan_seconds``."""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return 0
+        host = socket.gethostname()
+        now = time.time()
+        removed = 0
+        for name in names:
+            if name in self._active or name.startswith("."):
+                continue
+            path = os.path.join(self.root, name)
+            owner = name.rpartition("@")[2]
+            owner_host, _, pid = owner.rpartition(":")
+            # Not among our live jobs but ours: left by an earlier process that had the same pid (containers)
+            dead_owner = owner == self.owner or (owner_host == host and pid.isdigit() and not _pid_alive(int(pid)))
+            try:
+                stale = now - _last_modified(path) > self.orphan_seconds
+            except FileNotFoundError:
+                continue
+            if dead_owner or stale:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        if removed:
+            _swept.inc(removed)
+            logging.warning("Workspace: removed %s orphaned job directories from %s", removed, self.root)
+        return removed
+
+    async def run_sweeper(self) -> None:
+        """Sweep now, then every ``orphan_seconds / 4``."""
+        os.makedirs(self.root, exist_ok=True)
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.warning("Workspace sweep failed: %s", e)
+            await asyncio.sleep(max(60.0, self.orphan_seconds / 4))
+
+
+workspace = Workspace(WORKSPACE_DIR, WORKSPACE_QUOTA_MB * 1024 * 1024)
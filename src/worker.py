@@ -0,0 +1,70 @@
+"""Transcription worker: ``python -m src.worker``.
+
+Claims jobs from ``transcription_jobs`` (enqueued by ``src/bot.py``), runs ffmpeg,
+downloads and Whisper uploads, and sends the results to the chat. Any number of
+worker processes can run side by side; scale with ``docker compose up -d --scale worker=N``.
+"""
+
+import asyncio
+import logging
+import signal
+
+from aiogram import Bot
+
+from src.config import BOT_TOKEN, METRICS_PORT
+from src.services import balance_holds, metrics
+from src.services.db_service import flush_user_activity, init_db, run_activity_flush
+from src.services.google_sheets_service import gs_service
+from src.services.http_transport import close_all as close_http_pools, telegram_session, warm_up
+from src.services.transcription_cache import transcription_cache
+from src.services.transcription_pipeline import job_pool, job_queue, report_abandoned_job, run_transcription_job
+from src.services.workspace import workspace
+
+logging.basicConfig(level=logging.INFO)
+
+
+async def main():
+    if not BOT_TOKEN or not str(BOT_TOKEN).strip():
+        raise SystemExit("BOT_TOKEN is not set or empty — check .env on the server.")
+
+    bot = Bot(token=BOT_TOKEN, session=telegram_session())
+    await init_db()
+    gs_service.connect()
+    if METRICS_PORT:
+        await metrics.start_metrics_server(METRICS_PORT)
+    await warm_up(bot, openai=True)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    # Jobs left running by a dead worker go back to the queue
+    recovery = asyncio.create_task(job_queue.run_recovery(lambda job: report_abandoned_job(bot, job)))
+    # Scratch directories of jobs that died with a previous worker process
+    sweeper = asyncio.create_task(workspace.run_sweeper())
+    # Balance holds left behind by jobs that were never stored or ended without billing
+    expiry = asyncio.create_task(balance_holds.run_expiry())
+    # users.last_activity_at noted by failed transcriptions, written in bulk
+    activity = asyncio.create_task(run_activity_flush())
+    # Transcription cache hits answered from memory, written in bulk
+    cache_hits = asyncio.create_task(transcription_cache.run_hit_flush())
+    job_pool.start(lambda job: run_transcription_job(bot, job))
+    logging.info("Worker %s started", job_queue.worker_id)
+
+    await stop.wait()
+    logging.info("Worker %s stopping…", job_queue.worker_id)
+    # Interrupted jobs are released to the queue for the other workers / the next start
+    await job_pool.stop()
+    recovery.cancel()
+    sweeper.cancel()
+    expiry.cancel()
+    activity.cancel()
+    cache_hits.cancel()
+    await flush_user_activity()  # what was noted since the last flush
+    await transcription_cache.flush_hits()
+    await close_http_pools()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+"""Shared fixtures. Tests that need PostgreSQL use ``pg_schema`` and are skipped without TEST_DATABASE_URL."""
+import asyncio
+import os
+import uuid
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+def schema_engine(schema: str):
+    """An engine whose connections work in ``schema`` (create it inside the test's own event loop)."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    return create_async_engine(TEST_DATABASE_URL, connect_args={"server_settings": {"search_path": schema}})
+
+
+async def _admin(sql: str) -> None:
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    engine = create_async_engine(TEST_DATABASE_URL)
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text(sql))
+    finally:
+        await engine.dispose()
+
+
+@pytest.fixture
+def pg_schema():
+    """A throwaway schema with the app's tables (migrations applied), dropped afterwards."""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL not set")
+    from src.services import db_service
+    from src.services.migrations import migrate
+
+    schema = f"test_{uuid.uuid4().hex[:8]}"
+
+    async def setup():
+        await _admin(f"CREATE SCHEMA {schema}")
+        engine = schema_engine(schema)
+        try:
+            await migrate(engine, db_service.Base.metadata)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(setup())
+    try:
+        yield schema
+    finally:
+        asyncio.run(_admin(f"DROP SCHEMA {schema} CASCADE"))
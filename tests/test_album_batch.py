@@ -0,0 +1,74 @@
+"""Collecting media-group messages and rendering the combined album result."""
+import asyncio
+
+from src.services.album_batch import AlbumCollector, album_batch_id, render_album
+
+
+def test_album_is_flushed_once_after_the_last_file():
+    flushed = []
+
+    async def flush(items):
+        flushed.append(items)
+
+    async def go():
+        collector = AlbumCollector(0.05, flush)
+        collector.add("a", 1)
+        await asyncio.sleep(0.03)
+        collector.add("a", 2)  # restarts the window
+        collector.add("b", 9)
+        await asyncio.sleep(0.03)
+        assert flushed == []
+        await asyncio.sleep(0.05)
+
+    asyncio.run(go())
+    assert sorted(flushed) == [[1, 2], [9]]
+
+
+def test_full_album_is_flushed_without_waiting():
+    flushed = []
+
+    async def flush(items):
+        flushed.append(items)
+
+    async def go():
+        collector = AlbumCollector(10, flush, max_items=3)
+        for i in range(3):
+            collector.add("a", i)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(go())
+    assert flushed == [[0, 1, 2]]
+
+
+def test_render_album_numbers_files_and_marks_failures():
+    text = render_album([
+        ("one.mp3", " hello ", None),
+        ("Файл 2", None, "⚠️ Ошибка при расшифровке."),
+        ("three.ogg", "", None),
+    ])
+    parts = text.split("\n\n———\n\n")
+    assert parts == [
+        "1. one.mp3\n\nhello",
+        "2. Файл 2\n\n⚠️ Ошибка при расшифровке.",
+        "3. three.ogg\n\n(тишина)",
+    ]
+
+
+def test_late_album_member_is_a_separate_batch():
+    flushed = []
+
+    async def flush(items):
+        flushed.append(items)
+
+    async def go():
+        collector = AlbumCollector(0.02, flush)
+        collector.add("chat:album", 101)
+        collector.add("chat:album", 102)
+        await asyncio.sleep(0.05)
+        collector.add("chat:album", 103)  # after the window: a second flush of the same media group
+        await asyncio.sleep(0.05)
+
+    asyncio.run(go())
+    assert flushed == [[101, 102], [103]]
+    ids = {album_batch_id(5, "album", items[0]) for items in flushed}
+    assert len(ids) == 2
@@ -0,0 +1,71 @@
+"""Header-only duration probing (no network; ffprobe replaced by a stub script)."""
+import asyncio
+import io
+import os
+import sys
+import wave
+
+from src.services.audio_probe import (
+    EdgeFile,
+    codec_hint,
+    duration_from_edges,
+    estimate_duration,
+    ffprobe_duration,
+    min_duration,
+)
+
+
+def _wav(seconds, rate=8000):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\x01\x00" * int(seconds * rate))
+    return buf.getvalue()
+
+
+def test_edge_file_reads_head_zeros_tail():
+    f = EdgeFile(b"HEAD", b"TAIL", 12)
+    assert f.read() == b"HEAD\x00\x00\x00\x00TAIL"
+    f.seek(-6, io.SEEK_END)
+    assert f.read(4) == b"\x00\x00TA"
+
+
+def test_wav_duration_from_first_kilobytes():
+    data = _wav(30)
+    assert abs(duration_from_edges(data[:4096], data[-4096:], len(data)) - 30.0) < 0.01
+
+
+def test_unknown_container_gives_zero():
+    assert duration_from_edges(b"\x00" * 100, b"\x00" * 100, 10_000) == 0.0
+
+
+def test_size_based_estimate_and_bound():
+    size = 1_000_000  # bytes
+    hint = codec_hint("audio/mpeg", "music/file_1")
+    assert hint == "mp3"
+    assert round(estimate_duration(size, hint)) == 62  # at 128 kbit/s
+    assert round(min_duration(size, hint)) == 25  # even at 320 kbit/s
+    assert codec_hint(None, "voice/file_2.oga") == "oga"
+
+
+def test_streamed_ffprobe_gets_no_url_and_may_stop_early(tmp_path, monkeypatch):
+    stub = tmp_path / "ffprobe"
+    stub.write_text(
+        f"#!{sys.executable}\n"
+        "import os, sys\n"
+        "open(os.environ['FFPROBE_ARGV'], 'w').write(' '.join(sys.argv[1:]))\n"
+        "sys.stdin.buffer.read(10)\n"
+        "print('12.5')\n"
+    )
+    stub.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FFPROBE_ARGV", str(tmp_path / "argv"))
+
+    async def body():
+        for _ in range(1000):  # far more than the stub reads
+            yield b"x" * 65536
+
+    assert asyncio.run(ffprobe_duration(body(), timeout=10)) == 12.5
+    assert (tmp_path / "argv").read_text().split()[-1] == "pipe:0"
@@ -0,0 +1,60 @@
+"""
+Balance holds against a real database: concurrent admissions of one user cannot reserve
+more than the balance, billing settles a hold, release and expiry give the rest back.
+Needs TEST_DATABASE_URL (skipped otherwise).
+"""
+import asyncio
+
+import pytest
+
+from conftest import schema_engine
+
+USER_ID = 1
+
+
+def test_concurrent_reserves_settle_and_release(pg_schema, monkeypatch):
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    from src.services import db_service
+
+    async def go():
+        engine = schema_engine(pg_schema)
+        monkeypatch.setattr(db_service, "async_session", async_sessionmaker(engine, expire_on_commit=False))
+        try:
+            # 300 free seconds: exactly five 60-second files fit, whatever the interleaving
+            results = await asyncio.gather(*(
+                db_service.reserve_balance(USER_ID, "u", "U", [60.0], ttl_seconds=900) for _ in range(8)
+            ))
+            granted = [ids[0] for ids, _ in results if ids is not None]
+            assert len(granted) == 5
+            assert all(missing == pytest.approx(60.0) for ids, missing in results if ids is None)
+
+            ok, missing = await db_service.resize_balance_hold(granted[0], 90.0)
+            assert (ok, missing) == (False, pytest.approx(30.0))
+            assert await db_service.resize_balance_hold(granted[0], 45.0) == (True, 0.0)
+
+            recorded = await db_service.record_transcription(
+                USER_ID, "u", "U", 45.0, 10, 1.0, "Сжатие", "x" * 10, hold_id=granted[0]
+            )
+            assert recorded is not None
+            await db_service.release_balance_holds(granted[1:3])
+            await db_service.release_balance_holds(granted[1:3])  # already released: no-op
+
+            async with engine.connect() as conn:
+                held, used = (await conn.execute(
+                    text(f"SELECT held_seconds, used_free_seconds FROM users WHERE id = {USER_ID}")
+                )).one()
+                left = (await conn.execute(text("SELECT count(*) FROM balance_holds"))).scalar_one()
+            assert (held, used, left) == (pytest.approx(120.0), pytest.approx(45.0), 2)
+
+            async with engine.begin() as conn:
+                await conn.execute(text("UPDATE balance_holds SET expires_at = expires_at - interval '1 day'"))
+            assert await db_service.expire_balance_holds() == 2
+            async with engine.connect() as conn:
+                held = (await conn.execute(text(f"SELECT held_seconds FROM users WHERE id = {USER_ID}"))).scalar_one()
+            assert held == pytest.approx(0.0)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(go())
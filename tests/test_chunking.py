@@ -0,0 +1,79 @@
+"""Segment planning and overlap stitching for chunked transcription."""
+import asyncio
+
+from src.services.chunking import plan_segments, prompt_tail, stitch_transcripts
+
+
+def test_short_audio_single_segment():
+    segs = plan_segments(120.0, 600, 3)
+    assert [(s.start, s.end) for s in segs] == [(0.0, 120.0)]
+
+
+def test_long_audio_overlaps_and_covers():
+    segs = plan_segments(1500.0, 600, 3)
+    assert [(s.start, s.end) for s in segs] == [(0.0, 600.0), (597.0, 1197.0), (1194.0, 1500.0)]
+    assert all(s.length <= 600 for s in segs)
+
+
+def test_stitch_drops_repeated_overlap():
+    parts = ["Привет, как дела у тебя сегодня", "у тебя сегодня? Всё хорошо."]
+    assert stitch_transcripts(parts) == "Привет, как дела у тебя сегодня Всё хорошо."
+
+
+def test_stitch_skips_cut_first_word():
+    parts = ["we will meet on monday morning", "ning monday morning at nine"]
+    assert stitch_transcripts(parts) == "we will meet on monday morning at nine"
+
+
+def test_stitch_without_overlap_keeps_everything():
+    assert stitch_transcripts(["one two", "three four", ""]) == "one two three four"
+
+
+def test_prompt_tail_starts_on_word():
+    assert prompt_tail("alpha beta gamma delta", max_chars=12) == "gamma delta"
+    assert prompt_tail(None) is None
+
+
+def test_cuts_on_silence_without_overlap():
+    segs = plan_segments(1500.0, 600, 3, boundaries=[100.0, 520.0, 1000.0, 1450.0])
+    assert [(s.start, s.end, s.overlap) for s in segs] == [
+        (0.0, 520.0, 0.0),
+        (520.0, 1000.0, 0.0),
+        (1000.0, 1500.0, 0.0),
+    ]
+
+
+def test_stitch_keeps_repeats_when_not_overlapped():
+    assert stitch_transcripts(["да да", "да да"], overlapped=[False, False]) == "да да да да"
+
+
+def test_stitch_keeps_line_breaks():
+    parts = ["первая строка\nвторая строка", "вторая строка\nтретья строка"]
+    assert stitch_transcripts(parts) == "первая строка\nвторая строка\nтретья строка"
+
+
+def test_chunks_are_prompted_with_the_previous_text(monkeypatch):
+    from src.services import openai_service
+    from src.services.transcript import Transcript
+
+    prompts = {}
+
+    async def cut(packed, args):
+        return args[1].encode()  # the segment start, to tell segments apart
+
+    async def whisper(upload, upload_name, prompt=None, backend=None, duration=0.0):
+        index = int(upload_name.rsplit("_", 1)[1].split(".")[0])
+        prompts[index] = prompt
+        await asyncio.sleep(0.01 * (5 - index))  # later segments answer sooner
+        return Transcript.plain(f"part{index}")
+
+    monkeypatch.setattr(openai_service.transcoder, "run", cut)
+    monkeypatch.setattr(openai_service, "_whisper", whisper)
+    monkeypatch.setattr(openai_service, "CHUNK_SECONDS", 100)
+    monkeypatch.setattr(openai_service, "TRANSCRIBE_CONCURRENCY", 2)
+    boundaries = [100.0, 200.0, 300.0, 400.0, 500.0]
+
+    result = asyncio.run(openai_service._transcribe_chunks(b"", "a.ogg", 600.0, boundaries))
+    assert result.text == "part0 part1 part2 part3 part4 part5"
+    # Two lanes of three: only the first segment of the second lane may go without a prompt
+    assert [prompts[i] for i in (1, 2, 4, 5)] == ["part0", "part1", "part3", "part4"]
@@ -0,0 +1,80 @@
+"""
+Result delivery against a real database: one claim at a time, delivered only once
+finished, a released or expired claim can be taken again; the same for an album.
+Needs TEST_DATABASE_URL.
+"""
+import asyncio
+
+from conftest import schema_engine
+
+INSERT_JOB = (
+    "INSERT INTO transcription_jobs (user_id, chat_id, status_message_id, file_id, file_size, duration, "
+    "duration_exact, batch_id, batch_index, batch_size, state, attempts, created_at, result_text) "
+    "VALUES (1, 1, 1, 'f', 0, 1, true, :batch, :index, :size, 'running', 1, now(), :result) RETURNING id"
+)
+
+
+def test_delivery_claim_finish_and_release(pg_schema, monkeypatch):
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    from src.services import db_service
+
+    async def go():
+        engine = schema_engine(pg_schema)
+        monkeypatch.setattr(db_service, "async_session", async_sessionmaker(engine, expire_on_commit=False))
+        try:
+            async with engine.begin() as conn:
+                job_id = (await conn.execute(
+                    text(INSERT_JOB), {"batch": None, "index": 0, "size": 1, "result": "x"}
+                )).scalar_one()
+            claim = db_service.claim_transcription_delivery
+            assert await claim(job_id, 60) == "claimed"
+            assert await claim(job_id, 60) == "busy"
+            await db_service.release_transcription_delivery([job_id])
+            assert await claim(job_id, 60) == "claimed"
+
+            # The sender died: once its claim runs out, another attempt takes over
+            async with engine.begin() as conn:
+                await conn.execute(text("UPDATE transcription_jobs SET delivering_until = '2000-01-01'"))
+            assert await claim(job_id, 60) == "claimed"
+            await db_service.finish_transcription_delivery([job_id])
+            assert await claim(job_id, 60) == "delivered"
+            await db_service.release_transcription_delivery([job_id])  # no effect once delivered
+            assert await claim(job_id, 60) == "delivered"
+            assert await claim(job_id + 1, 60) == "delivered"  # no such job
+        finally:
+            await engine.dispose()
+
+    asyncio.run(go())
+
+
+def test_album_claimed_once_complete(pg_schema, monkeypatch):
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    from src.services import db_service
+
+    async def go():
+        engine = schema_engine(pg_schema)
+        monkeypatch.setattr(db_service, "async_session", async_sessionmaker(engine, expire_on_commit=False))
+        try:
+            async with engine.begin() as conn:
+                for index, result in ((1, "b"), (0, None)):
+                    await conn.execute(text(INSERT_JOB), {"batch": "album", "index": index, "size": 2, "result": result})
+            claim = db_service.claim_transcription_batch
+            assert await claim("album", 60) == ("pending", [])
+            async with engine.begin() as conn:
+                await conn.execute(text("UPDATE transcription_jobs SET result_text = 'a' WHERE batch_index = 0"))
+            state, records = await claim("album", 60)
+            assert state == "claimed" and [r.result_text for r in records] == ["a", "b"]
+            assert await claim("album", 60) == ("busy", [])
+            await db_service.release_transcription_delivery([r.id for r in records])
+            state, records = await claim("album", 60)
+            assert state == "claimed"
+            await db_service.finish_transcription_delivery([r.id for r in records])
+            assert await claim("album", 60) == ("delivered", [])
+        finally:
+            await engine.dispose()
+
+    asyncio.run(go())
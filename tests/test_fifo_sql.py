@@ -0,0 +1,66 @@
+"""
+The set-based FIFO deduction (one UPDATE) against purchased_fifo.fifo_allocate on random
+bucket sets. Needs TEST_DATABASE_URL (skipped otherwise).
+"""
+import asyncio
+import random
+
+import pytest
+
+from conftest import schema_engine
+from src.services.purchased_fifo import fifo_allocate
+
+USER_ID = 1
+
+
+def _random_case(rng: random.Random):
+    buckets = []
+    for _ in range(rng.randint(0, 40)):
+        status = rng.choice(["success", "success", "success", "pending", "failed"])
+        remaining = rng.choice([0.0, round(rng.uniform(0.1, 3600), 3), float(rng.randint(1, 10) * 60)])
+        buckets.append((status, remaining))
+    total = sum(r for s, r in buckets if s == "success")
+    amount = rng.choice([0.5, rng.uniform(0, total + 1), total, total + 100, float(rng.randint(1, 600))])
+    return buckets, amount
+
+
+def test_fifo_deduct_matches_fifo_allocate(pg_schema):
+    from sqlalchemy import text
+
+    from src.services import db_service
+
+    async def go():
+        engine = schema_engine(pg_schema)
+        rng = random.Random(20240520)
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"INSERT INTO users (id, created_at, last_activity_at, balance_seconds, used_free_seconds) VALUES ({USER_ID}, now(), now(), 0, 0)"))
+            for _ in range(200):
+                buckets, amount = _random_case(rng)
+                async with engine.connect() as conn:
+                    tx = await conn.begin()
+                    ids = []
+                    for status, remaining in buckets:
+                        ids.append((await conn.execute(
+                            text(
+                                "INSERT INTO transactions (user_id, created_at, provider, amount_rub, seconds_added, stars_amount, status, seconds_remaining, stars_refund_status) "
+                                "VALUES (:uid, now(), 'manual', 0, :rem, 0, :status, :rem, 'none') RETURNING id"
+                            ),
+                            {"uid": USER_ID, "rem": remaining, "status": status},
+                        )).scalar_one())
+                    expected = fifo_allocate(
+                        [(tx_id, rem) for tx_id, (status, rem) in zip(ids, buckets) if status == "success"], amount
+                    )
+                    got = sorted((await conn.execute(db_service.fifo_deduct_statement(USER_ID, amount))).all())
+                    assert [tx_id for tx_id, _ in got] == [tx_id for tx_id, _ in expected]
+                    for (_, taken), (_, want) in zip(got, expected):
+                        assert taken == pytest.approx(want, abs=1e-6)
+                    left = dict((await conn.execute(text("SELECT id, seconds_remaining FROM transactions"))).all())
+                    for tx_id, (status, rem) in zip(ids, buckets):
+                        want_left = rem - dict(expected).get(tx_id, 0.0)
+                        assert left[tx_id] == pytest.approx(max(0.0, want_left), abs=1e-6)
+                    await tx.rollback()
+        finally:
+            await engine.dispose()
+
+    asyncio.run(go())
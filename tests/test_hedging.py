@@ -0,0 +1,100 @@
+"""Latency percentiles, hedge budget and the hedged race."""
+import asyncio
+
+import pytest
+
+from src.services import hedging
+from src.services.hedging import HedgeBudget, LatencyTracker, hedged, percentile
+
+
+def _call(result, delay=0.0, fail=False, log=None):
+    async def call():
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if log is not None:
+                log.append(f"{result} cancelled")
+            raise
+        if fail:
+            raise RuntimeError(result)
+        return result
+
+    return call
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 95) == 95
+    assert percentile(values, 50) == 50
+    assert percentile([3.0], 99) == 3.0
+
+
+def test_tracker_buckets_and_min_samples():
+    tracker = LatencyTracker(buckets=(30, 120), min_samples=3)
+    for latency in (1.0, 2.0):
+        tracker.observe(10, latency)
+    assert tracker.quantile(10, 95) is None
+    tracker.observe(20, 9.0)
+    assert tracker.quantile(10, 95) == 9.0
+    assert tracker.quantile(60, 95) is None  # another bucket
+    assert tracker.bucket_label(tracker.bucket_of(500)) == "120s+"
+    assert tracker.snapshot()["0-30s"] == 9.0
+
+
+def test_budget_limits_hedge_share():
+    budget = HedgeBudget(ratio=0.25, burst=1.0)
+    assert budget.try_spend()  # one hedge allowed up front
+    assert not budget.try_spend()
+    for _ in range(4):
+        budget.earn()
+    assert budget.try_spend()
+
+
+def test_fast_primary_is_not_hedged():
+    log = []
+    result = asyncio.run(hedged(_call("a", 0.0), _call("b", log=log), 0.2, HedgeBudget(1.0)))
+    assert result == "a" and log == []
+
+
+def test_slow_primary_loses_to_hedge_and_is_cancelled():
+    log, latencies = [], []
+    result = asyncio.run(hedged(
+        _call("slow", 1.0, log=log), _call("fast", 0.01), 0.05, HedgeBudget(1.0), latencies.append
+    ))
+    assert result == "fast"
+    assert log == ["slow cancelled"]
+    assert len(latencies) == 1
+
+
+def test_failed_hedge_falls_back_to_primary():
+    result = asyncio.run(hedged(_call("slow", 0.1), _call("bad", 0.0, fail=True), 0.02, HedgeBudget(1.0)))
+    assert result == "slow"
+
+
+def test_both_failing_raises():
+    with pytest.raises(RuntimeError):
+        asyncio.run(hedged(_call("x", 0.05, fail=True), _call("y", 0.0, fail=True), 0.01, HedgeBudget(1.0)))
+
+
+def test_no_budget_waits_for_primary():
+    budget = HedgeBudget(0.0, burst=0.0)
+    log = []
+    assert asyncio.run(hedged(_call("slow", 0.05), _call("b", log=log), 0.01, budget)) == "slow"
+    assert log == []
+
+
+@pytest.mark.parametrize("primary, secondary, budget, outcomes", [
+    (_call("a", 0.0), _call("b"), HedgeBudget(1.0), ["primary"]),
+    (_call("slow", 1.0), _call("fast", 0.01), HedgeBudget(1.0), ["fired", "hedge_won"]),
+    (_call("slow", 0.05), _call("slower", 1.0), HedgeBudget(1.0), ["fired", "hedge_lost"]),
+    (_call("slow", 0.05), _call("b"), HedgeBudget(0.0, burst=0.0), ["budget_exhausted"]),
+    (_call("x", 0.05, fail=True), _call("y", fail=True), HedgeBudget(1.0), ["fired", "both_failed"]),
+])
+def test_outcome_labels(primary, secondary, budget, outcomes, monkeypatch):
+    seen = []
+    monkeypatch.setattr(hedging._hedges, "inc", lambda amount=1.0, **labels: seen.append(labels["outcome"]))
+    try:
+        asyncio.run(hedged(primary, secondary, 0.02, budget))
+    except RuntimeError:
+        pass
+    assert seen == outcomes
@@ -0,0 +1,109 @@
+"""Shared HTTP pools: YooKassa and Telegram session settings, pool metrics on unexpected client internals."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from requests.adapters import HTTPAdapter
+
+from src.config import (
+    DNS_CACHE_SECONDS,
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_PER_HOST,
+    HTTP_READ_TIMEOUT_SECONDS,
+)
+from src.services import http_transport
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    """Fresh module-level pools for one test."""
+    monkeypatch.setattr(http_transport, "_openai_client", None)
+    monkeypatch.setattr(http_transport, "_telegram_sessions", [])
+    monkeypatch.setattr(http_transport, "_yookassa_session", None)
+    yield http_transport
+    if http_transport._yookassa_session is not None:
+        http_transport._yookassa_session.shutdown()
+
+
+def test_yookassa_session_is_pooled_with_timeouts(pools, monkeypatch):
+    session = pools.yookassa_session()
+    assert pools.yookassa_session() is session
+    adapter = session.get_adapter("https://api.yookassa.ru/v3/payments")
+    assert isinstance(adapter, pools._TimeoutAdapter)
+    assert adapter.max_retries.total == 3 and adapter.max_retries.status_forcelist == [202]
+    assert adapter._pool_maxsize == HTTP_MAX_PER_HOST
+
+    sent = []
+    monkeypatch.setattr(HTTPAdapter, "send", lambda self, request, **kwargs: sent.append(kwargs["timeout"]))
+    adapter.send(None, timeout=None)
+    adapter.send(None, timeout=5)
+    assert sent == [(HTTP_CONNECT_TIMEOUT_SECONDS, HTTP_READ_TIMEOUT_SECONDS), 5]
+
+    session.close()  # what the SDK does after every call
+    assert pools.yookassa_session() is session and session.adapters
+
+
+def test_yookassa_sdk_gets_the_pooled_session(pools):
+    from yookassa.client import ApiClient
+
+    original = ApiClient.get_session
+    try:
+        pools.install_yookassa_session()
+        pools.install_yookassa_session()  # a second install does not wrap the first
+        client = ApiClient.__new__(ApiClient)  # no shop configuration needed for get_session
+        assert client.get_session() is pools.yookassa_session()
+    finally:
+        pools.uninstall_yookassa_session()
+    assert ApiClient.get_session is original
+
+
+def test_telegram_session_connector_settings(pools):
+    async def go():
+        session = pools.telegram_session()
+        try:
+            client = await session.create_session()
+            assert session.client_session is client
+            return client.connector.limit, client.connector.limit_per_host, client.connector.use_dns_cache
+        finally:
+            await session.close()
+
+    assert asyncio.run(go()) == (HTTP_MAX_CONNECTIONS, HTTP_MAX_PER_HOST, DNS_CACHE_SECONDS > 0)
+    assert len(pools._telegram_sessions) == 1
+
+
+def test_telegram_session_without_connector_settings_still_works(pools, monkeypatch):
+    original_init = pools._TelegramSession.__init__
+
+    def init(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+        del self._connector_init  # as if aiogram renamed it
+
+    monkeypatch.setattr(pools._TelegramSession, "__init__", init)
+    assert isinstance(pools.telegram_session(), pools._TelegramSession)
+
+
+def test_pool_metrics_survive_missing_internals(pools, monkeypatch):
+    monkeypatch.setattr(pools, "_openai_client", SimpleNamespace())
+    broken_connector = SimpleNamespace()
+    monkeypatch.setattr(pools, "_telegram_sessions", [
+        SimpleNamespace(client_session=None),
+        SimpleNamespace(client_session=SimpleNamespace(closed=False, connector=broken_connector)),
+    ])
+    session = pools.yookassa_session()
+    session.mount("http://", SimpleNamespace(close=lambda: None))  # not an HTTPAdapter
+
+    samples = dict((tuple(sorted(labels.items())), value) for labels, value in pools._pool_samples())
+    assert samples[(("client", "telegram"), ("state", "active"))] == 0
+    assert samples[(("client", "yookassa"), ("state", "idle"))] == 0
+    assert not any(dict(labels)["client"] == "openai" for labels in samples)
+
+
+def test_pool_metrics_count_openai_connections(pools, monkeypatch):
+    connections = [SimpleNamespace(is_idle=lambda: True), SimpleNamespace(is_idle=lambda: False)]
+    client = SimpleNamespace(_transport=SimpleNamespace(_pool=SimpleNamespace(connections=connections)))
+    monkeypatch.setattr(pools, "_openai_client", client)
+    assert pools._openai_pool() == [
+        ({"client": "openai", "state": "active"}, 1),
+        ({"client": "openai", "state": "idle"}, 1),
+    ]
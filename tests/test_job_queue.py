@@ -0,0 +1,155 @@
+"""
+Round-robin claiming and queue positions of the durable job queue, and the worker pool
+running jobs from it. The database tests need TEST_DATABASE_URL (skipped otherwise).
+"""
+import asyncio
+
+from conftest import schema_engine
+from src.services.job_queue import DurableQueue, RetryLater, WorkerPool, fair_position
+
+
+class ListQueue:
+    """The queue interface of WorkerPool over a plain list, for pool tests without a database."""
+
+    def __init__(self):
+        self.items = []
+        self.outcomes = []
+
+    def __len__(self):
+        return len(self.items)
+
+    async def get(self):
+        while not self.items:
+            await asyncio.sleep(0.005)
+        return self.items.pop(0), 0.0
+
+    async def hold(self, item):
+        await asyncio.Event().wait()
+
+    async def done(self, item):
+        self.outcomes.append(("done", item))
+
+    async def failed(self, item, error):
+        self.outcomes.append(("failed", item))
+
+    async def release(self, item):
+        self.items.append(item)
+
+    async def defer(self, item, delay, consume_attempt=False):
+        asyncio.get_running_loop().call_later(delay, self.items.append, item)
+
+
+def _queue(pg_schema, monkeypatch, go):
+    """Run ``go(queue)`` against a DurableQueue whose jobs live in the test schema."""
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    from src.services import db_service
+
+    async def run():
+        engine = schema_engine(pg_schema)
+        monkeypatch.setattr(db_service, "async_session", async_sessionmaker(engine, expire_on_commit=False))
+        try:
+            return await go(DurableQueue(lambda record: record.file_id, lambda record: record.id))
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+def _fields(file_id):
+    return dict(chat_id=1, status_message_id=1, file_id=file_id, file_size=0, duration=1.0, duration_exact=True)
+
+
+async def _drain(queue, worker_id="w"):
+    from src.services import db_service
+
+    order = []
+    while (record := await db_service.claim_transcription_job(worker_id, 60)) is not None:
+        order.append(record.file_id)
+        await db_service.finish_transcription_job(record.id, worker_id, "done")
+    return order
+
+
+def test_round_robin_across_users(pg_schema, monkeypatch):
+    async def go(queue):
+        for i in range(3):
+            await queue.put(1, _fields(f"h{i}"))
+        await queue.put(2, _fields("l0"))
+        await queue.put(3, _fields("o0"))
+        return await _drain(queue)
+
+    assert _queue(pg_schema, monkeypatch, go) == ["h0", "l0", "o0", "h1", "h2"]
+
+
+def test_positions_follow_serving_order(pg_schema, monkeypatch):
+    async def go(queue):
+        positions = [(await queue.put(user_id, _fields(name)))[1] for user_id, name in (
+            (1, "a0"), (1, "a1"), (1, "a2"), (2, "b0"), (2, "b1"),
+        )]
+        return positions, await _drain(queue)
+
+    positions, order = _queue(pg_schema, monkeypatch, go)
+    # b's first job overtakes a's second and third
+    assert positions == [1, 2, 3, 2, 4]
+    assert order == ["a0", "b0", "a1", "b1", "a2"]
+
+
+def test_user_served_last_waits_for_the_others(pg_schema, monkeypatch):
+    async def go(queue):
+        await queue.put(1, _fields("a0"))
+        served = await _drain(queue)
+        await queue.put(1, _fields("a1"))
+        await queue.put(2, _fields("b0"))  # newer, but b was never served
+        return served + await _drain(queue), await queue.pending_for(1)
+
+    order, pending = _queue(pg_schema, monkeypatch, go)
+    assert order == ["a0", "b0", "a1"] and pending == 0
+
+
+def test_fair_position_bound():
+    assert fair_position(0, []) == 1
+    assert fair_position(0, [3, 1]) == 3
+    assert fair_position(1, [3, 1]) == 5
+
+
+def test_worker_pool_survives_failing_jobs():
+    seen = []
+
+    async def handler(item):
+        seen.append(item)
+        if item == "bad":
+            raise RuntimeError("boom")
+
+    async def go():
+        q = ListQueue()
+        pool = WorkerPool(q, 1)
+        pool.start(handler)
+        q.items += ["bad", "good"]
+        while len(q.outcomes) < 2:
+            await asyncio.sleep(0.01)
+        await pool.stop()
+        return q.outcomes
+
+    assert asyncio.run(go()) == [("failed", "bad"), ("done", "good")]
+    assert seen == ["bad", "good"]
+
+
+def test_deferred_job_runs_again_later():
+    seen = []
+
+    async def handler(item):
+        seen.append(item)
+        if len(seen) == 1:
+            raise RetryLater(0.05)
+
+    async def go():
+        q = ListQueue()
+        pool = WorkerPool(q, 1)
+        pool.start(handler)
+        q.items.append("job")
+        while len(seen) < 2:
+            await asyncio.sleep(0.01)
+        await pool.stop()
+
+    asyncio.run(go())
+    assert seen == ["job", "job"]
@@ -0,0 +1,33 @@
+"""Prometheus text rendering of the in-process metrics registry."""
+from src.services import metrics
+
+
+def test_counter_and_gauge_render():
+    c = metrics.counter("test_jobs_total", "Jobs")
+    c.inc(kind="voice")
+    c.inc(2, kind="voice")
+    metrics.gauge("test_depth", "Depth").set(4)
+    out = metrics.render()
+    assert "# TYPE test_jobs_total counter" in out
+    assert 'test_jobs_total{kind="voice"} 3' in out
+    assert "test_depth 4" in out
+
+
+def test_summary_exports_count_and_sum():
+    s = metrics.summary("test_wait_seconds", "Wait")
+    s.observe(1.5)
+    s.observe(0.5)
+    out = metrics.render()
+    assert "test_wait_seconds_count 2" in out
+    assert "test_wait_seconds_sum 2" in out
+
+
+def test_same_name_returns_same_metric():
+    assert metrics.counter("test_same_total", "x") is metrics.counter("test_same_total", "x")
+
+
+def test_labelled_gauge_callback():
+    metrics.gauge("test_pool", "Pool", fn=lambda: [({"state": "idle"}, 2), ({"state": "active"}, 1)])
+    out = metrics.render()
+    assert 'test_pool{state="idle"} 2' in out
+    assert 'test_pool{state="active"} 1' in out
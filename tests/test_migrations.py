@@ -0,0 +1,47 @@
+"""Migration files: discovery, ordering and statement splitting (no database needed)."""
+import pytest
+
+from src.services.migrations import Migration, discover, pending, split_statements
+
+
+def test_split_statements_drops_comments():
+    sql = """
+    -- header; with a semicolon
+    ALTER TABLE t ADD COLUMN a INT; -- trailing
+    CREATE INDEX ix ON t (a);
+    """
+    assert split_statements(sql) == ["ALTER TABLE t ADD COLUMN a INT", "CREATE INDEX ix ON t (a)"]
+
+
+def test_split_statements_keeps_quoted_semicolons():
+    sql = "COMMENT ON COLUMN t.a IS 'one; two -- not a comment, it''s text';\nSELECT 1"
+    assert split_statements(sql) == ["COMMENT ON COLUMN t.a IS 'one; two -- not a comment, it''s text'", "SELECT 1"]
+
+
+def test_discover_orders_by_version(tmp_path):
+    for name in ("010_b.sql", "002_a.sql", "README.txt", "notes.sql"):
+        (tmp_path / name).write_text("SELECT 1;")
+    assert [(m.version, m.name) for m in discover(str(tmp_path))] == [(2, "a"), (10, "b")]
+
+
+def test_discover_rejects_duplicate_versions(tmp_path):
+    (tmp_path / "003_a.sql").write_text("SELECT 1;")
+    (tmp_path / "003_b.sql").write_text("SELECT 1;")
+    with pytest.raises(ValueError):
+        discover(str(tmp_path))
+
+
+def test_pending_skips_applied():
+    migrations = [Migration(v, f"m{v}", "") for v in (1, 2, 3)]
+    assert [m.version for m in pending(migrations, [1, 3])] == [2]
+
+
+def test_repo_migrations():
+    migrations = discover()
+    versions = [m.version for m in migrations]
+    assert versions == list(range(1, len(versions) + 1))
+    for m in migrations:
+        assert m.statements(), m.path
+        if m.is_concurrent():
+            # Runs outside a transaction: every statement must be safe to re-run
+            assert all("IF NOT EXISTS" in s.upper() for s in m.statements()), m.path
@@ -0,0 +1,48 @@
+"""Upload-vs-transcode decisions of the pre-upload normalization stage."""
+from src.services.normalization import SpeedEstimate, plan_normalization
+
+MB = 1024 * 1024
+UPLINK = 20_000_000 / 8  # 20 Mbit/s
+LIMIT = 24 * MB
+
+
+def _plan(size, duration, codec, speed=100.0, uplink=UPLINK):
+    return plan_normalization(size, duration, codec, uplink, speed, 24_000, LIMIT)
+
+
+def test_small_voice_note_goes_as_is():
+    # 60 s of 32 kbit/s Opus: nothing to gain
+    assert _plan(240_000, 60, "ogg").path == "original"
+
+
+def test_high_bitrate_mp3_is_transcoded():
+    # 15 MB of 320 kbit/s MP3 is ~6 min: 6 s upload vs ~3.6 s encode + 0.4 s upload
+    plan = _plan(15 * MB, 375, "mp3")
+    assert plan.path == "transcode"
+    assert plan.expected_bytes < 15 * MB / 10
+    assert plan.expected_seconds < plan.original_seconds
+
+
+def test_wav_prefers_lossless_when_cpu_is_slow():
+    # 20 MB WAV (~2 min) on a slow CPU: FLAC is cheap to encode, Opus is not
+    plan = _plan(20 * MB, 119, "wav", speed=15.0)
+    assert plan.path == "lossless"
+
+
+def test_oversize_original_must_be_reduced():
+    # A fast uplink would send it as-is, but it does not fit the limit
+    plan = _plan(30 * MB, 178, "wav", uplink=1_000_000_000 / 8)
+    assert plan.path in ("transcode", "lossless")
+    assert plan.expected_bytes <= LIMIT
+
+
+def test_unknown_duration_keeps_original():
+    assert _plan(15 * MB, 0, None).path == "original"
+
+
+def test_speed_estimate_moves_towards_observations():
+    est = SpeedEstimate(100.0, weight=0.5)
+    est.observe(60, 1.0)
+    assert est.value == 80.0
+    est.observe(0, 1.0)
+    assert est.value == 80.0
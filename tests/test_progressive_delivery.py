@@ -0,0 +1,80 @@
+"""Pagination and throttled editing of partial transcripts."""
+import asyncio
+from types import SimpleNamespace
+
+from src.services.progressive_delivery import IN_PROGRESS_FOOTER, TOO_LONG_NOTE, ProgressiveMessage, paginate
+
+
+class FakeBot:
+    def __init__(self):
+        self.calls = []
+        self._next_id = 100
+
+    async def edit_message_text(self, text, chat_id, message_id, parse_mode=None):
+        self.calls.append(("edit", message_id, text))
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self._next_id += 1
+        self.calls.append(("send", self._next_id, text))
+        return SimpleNamespace(message_id=self._next_id)
+
+    async def delete_message(self, chat_id, message_id):
+        self.calls.append(("delete", message_id, None))
+
+
+def test_paginate_prefers_line_then_word_breaks():
+    assert paginate("short") == ["short"]
+    assert paginate("") == [""]
+    assert paginate("aaaa bbbb cccc", limit=10) == ["aaaa bbbb", "cccc"]
+    assert paginate("aaaa\nbbbb cccc", limit=10) == ["aaaa\nbbbb", "cccc"]
+    assert paginate("x" * 25, limit=10) == ["x" * 10, "x" * 10, "x" * 5]
+    assert all(len(p) <= 10 for p in paginate("word " * 50, limit=10))
+
+
+def test_updates_are_coalesced_and_roll_over():
+    bot = FakeBot()
+
+    async def go():
+        msg = ProgressiveMessage(bot, chat_id=1, status_message_id=7, min_interval=0.05)
+        await msg.update("one")
+        await asyncio.sleep(0)  # first edit goes out at once
+        await msg.update("one two")
+        await msg.update("one two three")  # replaces the pending text
+        await asyncio.sleep(0.1)
+        assert msg.started
+        await msg.finish("one two three " + "x" * 4000)
+
+    asyncio.run(go())
+    edits = [c for c in bot.calls if c[0] == "edit"]
+    assert edits[0] == ("edit", 7, "<pre>one</pre>" + IN_PROGRESS_FOOTER)
+    assert edits[1] == ("edit", 7, "<pre>one two three</pre>" + IN_PROGRESS_FOOTER)
+    assert not any(c[2] == "<pre>one two</pre>" + IN_PROGRESS_FOOTER for c in bot.calls)
+    # final text: first page in the status message, the rest in a new one, no footer
+    assert bot.calls[-2] == ("edit", 7, "<pre>one two three</pre>")
+    assert bot.calls[-1] == ("send", 101, "<pre>" + "x" * 4000 + "</pre>")
+
+
+def test_pages_are_escaped_and_capped():
+    bot = FakeBot()
+    long_text = " ".join(["<b>" + "y" * 990] * 20)  # ~20 000 characters: five pages
+
+    async def go():
+        msg = ProgressiveMessage(bot, chat_id=1, status_message_id=7, min_interval=0.01, max_pages=2)
+        await msg.update(long_text)
+        await asyncio.sleep(0.05)
+        assert msg.message_ids == [7, 101]  # no more than max_pages messages while in progress
+        await msg.finish(long_text + " end")
+
+    asyncio.run(go())
+    assert bot.calls[0][2].startswith("<pre>&lt;b&gt;")
+    # over the cap: the note replaces the partial text, the follow-up message goes away
+    assert bot.calls[-2:] == [("edit", 7, TOO_LONG_NOTE), ("delete", 101, None)]
+
+
+def test_untouched_message_is_not_started():
+    async def go():
+        msg = ProgressiveMessage(FakeBot(), 1, 7, min_interval=0.05)
+        await msg.close()
+        return msg.started
+
+    assert asyncio.run(go()) is False
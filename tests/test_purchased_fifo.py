@@ -1,7 +1,9 @@
 """FIFO allocation for purchased seconds."""
+import random
+
 import pytest
 
-from src.services.purchased_fifo import fifo_allocate
+from src.services.purchased_fifo import available_seconds, fifo_allocate, split_usage
 
 
 def test_empty_amount():
@@ -22,3 +24,59 @@ def test_skips_zero_remaining():
 
 def test_exhaust_first_only():
     assert fifo_allocate([(1, 40.0), (2, 60.0)], 40) == [(1, 40.0)]
+
+
+def test_split_usage_within_free():
+    assert split_usage(100.0, 50.0) == (50.0, 0.0)
+
+
+def test_split_usage_overflows_into_purchased():
+    assert split_usage(280.0, 50.0) == (20.0, 30.0)
+
+
+def test_split_usage_free_exhausted():
+    assert split_usage(300.0, 50.0) == (0.0, 50.0)
+    # Legacy rows may be above the limit
+    assert split_usage(310.0, 50.0) == (0.0, 50.0)
+
+
+def test_split_usage_nothing_to_charge():
+    assert split_usage(0.0, 0.0) == (0.0, 0.0)
+
+
+def _cumulative_allocate(buckets, amount):
+    """What the set-based SQL computes: take min(remaining, amount - sum of earlier buckets)."""
+    out, before = [], 0.0
+    for bid, rem in buckets:
+        if rem <= 0:
+            continue
+        if before < amount:
+            out.append((bid, min(rem, amount - before)))
+        before += rem
+    return out
+
+
+def test_fifo_allocate_properties_random():
+    rng = random.Random(7)
+    for _ in range(500):
+        buckets = [(i, rng.choice([0.0, float(rng.randint(1, 600)), round(rng.uniform(0, 900), 2)])) for i in range(rng.randint(0, 300))]
+        total = sum(r for _, r in buckets if r > 0)
+        amount = rng.choice([0.0, rng.uniform(0, total * 1.2 + 1), total, float(rng.randint(1, 3600))])
+        plan = fifo_allocate(buckets, amount)
+        remaining = dict(buckets)
+        # Never more than asked or available; every take fits its bucket
+        assert sum(t for _, t in plan) == pytest.approx(min(amount, total)) if amount > 0 else plan == []
+        assert all(0 < t <= remaining[b] for b, t in plan)
+        # Oldest first: every bucket but the last one touched is drained
+        assert all(t == remaining[b] for b, t in plan[:-1])
+        # Same plan as the running-sum formulation used in SQL
+        window = _cumulative_allocate(buckets, amount)
+        assert [b for b, _ in plan] == [b for b, _ in window]
+        assert all(t == pytest.approx(w) for (_, t), (_, w) in zip(plan, window))
+
+
+def test_available_seconds_counts_holds():
+    assert available_seconds(100.0, 60.0) == 260.0
+    assert available_seconds(300.0, 60.0, held_seconds=45.0) == 15.0
+    # Holds can exceed what is left (admitted on an estimate): negative means nothing to start
+    assert available_seconds(300.0, 0.0, held_seconds=30.0) == -30.0
@@ -0,0 +1,134 @@
+"""Backoff, circuit breaker and retry loop of the upstream resilience layer."""
+import asyncio
+
+import pytest
+
+from src.services.resilience import CircuitBreaker, CircuitOpen, backoff_delay, call_with_retries
+
+
+class Transient(Exception):
+    pass
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _run(call, breaker=None, attempts=3, timeout=1.0):
+    return asyncio.run(call_with_retries(
+        call, name="test", attempts=attempts, timeout=timeout, base_delay=0.0, max_delay=0.0,
+        is_transient=lambda e: isinstance(e, Transient), breaker=breaker,
+    ))
+
+
+def _flaky(failures, result="ok"):
+    calls = []
+
+    async def call():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise Transient()
+        return result
+
+    return call, calls
+
+
+def test_backoff_is_jittered_capped_and_honours_retry_after():
+    assert backoff_delay(1, 1.0, 30.0, rand=lambda: 1.0) == 1.0
+    assert backoff_delay(4, 1.0, 30.0, rand=lambda: 1.0) == 8.0
+    assert backoff_delay(10, 1.0, 30.0, rand=lambda: 1.0) == 30.0
+    assert backoff_delay(3, 1.0, 30.0, rand=lambda: 0.5) == 2.0
+    assert backoff_delay(1, 1.0, 30.0, retry_after=12.0, rand=lambda: 1.0) == 12.0
+
+
+def test_transient_errors_are_retried():
+    call, calls = _flaky(2)
+    assert _run(call) == "ok"
+    assert len(calls) == 3
+
+
+def test_non_transient_error_is_not_retried():
+    calls = []
+
+    async def call():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        _run(call)
+    assert len(calls) == 1
+
+
+def test_attempt_timeout_counts_as_transient():
+    calls = []
+
+    async def call():
+        calls.append(1)
+        if len(calls) == 1:
+            await asyncio.sleep(1)
+        return "late ok"
+
+    assert _run(call, timeout=0.05) == "late ok"
+    assert len(calls) == 2
+
+
+def test_breaker_opens_fails_fast_and_recovers():
+    clock = Clock()
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=60, clock=clock)
+    for _ in range(2):
+        call, _ = _flaky(10)
+        with pytest.raises(Transient):
+            _run(call, breaker)
+    assert breaker.state == "open"
+
+    call, calls = _flaky(0)
+    with pytest.raises(CircuitOpen) as info:
+        _run(call, breaker)
+    assert calls == [] and info.value.retry_after == 60
+
+    clock.now = 61
+    assert _run(call, breaker) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_failed_half_open_trial_reopens():
+    clock = Clock()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 11
+    breaker.check()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpen):
+        breaker.check()  # a second caller while the trial runs
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.retry_after() == 10
+
+
+def test_cancelled_half_open_trial_frees_the_breaker():
+    clock = Clock()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 11
+
+    async def hang():
+        await asyncio.sleep(3600)
+
+    async def go():
+        trial = asyncio.ensure_future(call_with_retries(
+            hang, name="test", attempts=3, timeout=3600, base_delay=0.0, max_delay=0.0,
+            is_transient=lambda e: isinstance(e, Transient), breaker=breaker,
+        ))
+        await asyncio.sleep(0)
+        assert breaker.state == "half_open"
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+    asyncio.run(go())
+    call, _ = _flaky(0)
+    assert _run(call, breaker) == "ok"
+    assert breaker.state == "closed"
@@ -0,0 +1,62 @@
+"""Day-bucketed message counters of the user_stats rollup."""
+from datetime import date, timedelta
+
+from src.services.stats_rollup import WINDOW_DAYS, add, dumps, from_history, last_days, loads, roll
+
+TODAY = date(2024, 5, 20)
+
+
+def test_add_to_empty():
+    counts, anchor = add([], None, TODAY)
+    assert anchor == TODAY
+    assert counts[0] == 1 and sum(counts) == 1
+
+
+def test_add_same_day_accumulates():
+    counts, anchor = add([1], TODAY, TODAY)
+    assert (counts[0], anchor) == (2, TODAY)
+
+
+def test_add_next_day_rolls_forward():
+    counts, anchor = add([3, 2], TODAY - timedelta(days=2), TODAY)
+    assert anchor == TODAY
+    assert counts[:5] == [1, 0, 3, 2, 0]
+
+
+def test_old_days_fall_out_of_the_window():
+    counts = [1] * WINDOW_DAYS
+    rolled = roll(counts, TODAY - timedelta(days=WINDOW_DAYS + 5), TODAY)
+    assert rolled == [0] * WINDOW_DAYS
+
+
+def test_last_days_without_writes():
+    # Anchored 3 days ago: today and the two days before are empty
+    counts = [5, 4, 3, 2, 1, 1, 1, 1]
+    anchor = TODAY - timedelta(days=3)
+    assert last_days(counts, anchor, TODAY, 1) == 0
+    assert last_days(counts, anchor, TODAY, 7) == 5 + 4 + 3 + 2
+    assert last_days(counts, anchor, TODAY, 30) == sum(counts)
+
+
+def test_add_before_anchor_counts_on_its_day():
+    counts, anchor = add([1], TODAY, TODAY - timedelta(days=1))
+    assert anchor == TODAY
+    assert counts[:2] == [1, 1]
+
+
+def test_from_history_matches_incremental():
+    history = {TODAY: 2, TODAY - timedelta(days=6): 1, TODAY - timedelta(days=29): 4, TODAY - timedelta(days=30): 9}
+    counts, anchor = [], None
+    for day in sorted(history):
+        for _ in range(history[day]):
+            counts, anchor = add(counts, anchor, day)
+    assert from_history(history, TODAY) == roll(counts, anchor, TODAY)
+    assert last_days(counts, anchor, TODAY, 7) == 3
+    assert last_days(counts, anchor, TODAY, 30) == 7
+
+
+def test_dumps_trims_trailing_zeros():
+    counts = [1, 0, 2] + [0] * (WINDOW_DAYS - 3)
+    assert dumps(counts) == "[1,0,2]"
+    assert roll(loads(dumps(counts)), TODAY, TODAY) == counts
+    assert loads(None) == []
@@ -0,0 +1,55 @@
+"""Async transcoder plumbing, exercised with stand-in ffmpeg scripts (no real ffmpeg needed)."""
+import asyncio
+import io
+import os
+import stat
+import time
+
+import pytest
+
+from src.services.transcoder import TranscodeError, TranscodeTimeout, Transcoder
+
+
+def _script(tmp_path, name, body):
+    path = tmp_path / name
+    path.write_text("#!/bin/sh\n" + body + "\n")
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def test_pipes_stdin_to_stdout(tmp_path):
+    t = Transcoder(max_procs=1, ffmpeg_bin=_script(tmp_path, "cat.sh", "cat"))
+    payload = os.urandom(300 * 1024)
+    assert asyncio.run(t.run(io.BytesIO(payload), [])) == payload
+
+
+def test_nonzero_exit_raises(tmp_path):
+    t = Transcoder(max_procs=1, ffmpeg_bin=_script(tmp_path, "fail.sh", "echo boom >&2; exit 1"))
+    with pytest.raises(TranscodeError, match="boom"):
+        asyncio.run(t.run(b"x", []))
+
+
+def test_timeout_kills_process(tmp_path):
+    t = Transcoder(max_procs=1, ffmpeg_bin=_script(tmp_path, "slow.sh", "exec sleep 30"))
+    with pytest.raises(TranscodeTimeout):
+        asyncio.run(t.run(b"x", [], timeout=0.2))
+
+
+def test_concurrency_is_bounded(tmp_path):
+    t = Transcoder(max_procs=2, ffmpeg_bin=_script(tmp_path, "nap.sh", "sleep 0.3"))
+
+    async def go():
+        start = time.monotonic()
+        await asyncio.gather(*(t.run(b"", []) for _ in range(6)))
+        return time.monotonic() - start
+
+    # 6 jobs through 2 slots -> at least 3 sequential rounds
+    assert asyncio.run(go()) >= 0.85
+
+
+def test_sink_receives_stream(tmp_path):
+    t = Transcoder(max_procs=1, ffmpeg_bin=_script(tmp_path, "cat.sh", "cat"))
+    payload = os.urandom(200 * 1024)
+    received = bytearray()
+    assert asyncio.run(t.run(payload, [], sink=received.extend)) == b""
+    assert bytes(received) == payload
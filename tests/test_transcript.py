@@ -0,0 +1,51 @@
+"""Timestamps across chunks and VAD cuts, and the SRT / VTT / JSON renderings."""
+import json
+
+from src.services.chunking import Segment
+from src.services.transcript import (
+    TimedSegment, Transcript, merge_chunks, render, segments_from_json, segments_to_json, to_original_time, untrim,
+)
+
+
+def test_segments_round_trip_through_json():
+    segments = [TimedSegment(0.0, 1.2345, "Привет"), TimedSegment(1.5, 3.0, "мир")]
+    restored = segments_from_json(segments_to_json(segments))
+    assert restored == [TimedSegment(0.0, 1.234, "Привет"), TimedSegment(1.5, 3.0, "мир")]
+    assert segments_from_json(None) == []
+
+
+def test_merge_chunks_offsets_and_drops_repeated_overlap():
+    chunks = [Segment(0, 0.0, 60.0), Segment(1, 50.0, 100.0, overlap=10.0)]
+    parts = [
+        [TimedSegment(0, 30, "a"), TimedSegment(30, 52, "b"), TimedSegment(52, 60, "c-cut")],
+        [TimedSegment(0, 4, "c"), TimedSegment(4, 20, "d")],
+    ]
+    merged = merge_chunks(chunks, parts)
+    # the first chunk covers up to 60: "c" (50..54) was heard already, "d" (54..70) is mostly new
+    assert [s.text for s in merged] == ["a", "b", "c-cut", "d"]
+    assert merged[-1] == TimedSegment(54, 70, "d")
+
+
+def test_trimmed_times_map_back_to_the_original_timeline():
+    spans = [(10.0, 20.0), (50.0, 60.0)]
+    assert to_original_time(0.0, spans) == 10.0
+    assert to_original_time(5.0, spans) == 15.0
+    assert to_original_time(12.0, spans) == 52.0
+    assert to_original_time(99.0, spans) == 60.0
+    assert untrim([TimedSegment(8.0, 12.0, "x")], spans) == [TimedSegment(18.0, 52.0, "x")]
+
+
+def test_srt_and_vtt_cues():
+    t = Transcript("Hello world", [TimedSegment(0.0, 1.5, " Hello"), TimedSegment(61.25, 3725.007, " world")])
+    srt = render(t, "srt").decode()
+    assert srt == "1\n00:00:00,000 --> 00:00:01,500\nHello\n\n2\n00:01:01,250 --> 01:02:05,007\nworld\n"
+    vtt = render(t, "vtt").decode()
+    assert vtt.startswith("WEBVTT\n\n00:00:00.000 --> 00:00:01.500\nHello\n")
+
+
+def test_text_without_segments_becomes_one_cue():
+    t = Transcript.plain("Только текст")
+    assert render(t, "srt", duration=4.0).decode() == "1\n00:00:00,000 --> 00:00:04,000\nТолько текст\n"
+    assert render(t, "txt").decode() == "Только текст"
+    data = json.loads(render(t, "json", duration=4.0))
+    assert data == {"text": "Только текст", "duration": 4.0, "segments": []}
@@ -0,0 +1,81 @@
+"""Backend registry and fallback of the pluggable transcription engines."""
+import asyncio
+import io
+
+import pytest
+
+from src.services import transcription_backends as tb
+from src.services.transcript import Transcript
+
+
+class _Fake(tb.TranscriptionBackend):
+    def __init__(self, name, fail=False):
+        self.name = name
+        self.fail = fail
+        self.calls = []
+
+    async def transcribe(self, upload, upload_name, prompt=None):
+        upload.seek(0)
+        self.calls.append((upload.read(), upload_name, prompt))
+        if self.fail:
+            raise RuntimeError("down")
+        return Transcript.plain(f"{self.name} text")
+
+
+@pytest.fixture
+def fakes(monkeypatch):
+    primary, spare = _Fake("openai", fail=True), _Fake("local")
+    monkeypatch.setattr(tb, "_instances", {"openai": primary, "local": spare})
+    return primary, spare
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(tb.BackendUnavailable):
+        tb.get_backend("nope")
+
+
+def test_failure_without_fallback_propagates(fakes, monkeypatch):
+    monkeypatch.setattr(tb, "TRANSCRIPTION_FALLBACK_BACKEND", "")
+    with pytest.raises(RuntimeError):
+        asyncio.run(tb.transcribe_with("openai", io.BytesIO(b"x"), "a.ogg"))
+
+
+def test_fallback_gets_the_same_upload(fakes, monkeypatch):
+    primary, spare = fakes
+    monkeypatch.setattr(tb, "TRANSCRIPTION_FALLBACK_BACKEND", "local")
+    result = asyncio.run(tb.transcribe_with("openai", io.BytesIO(b"audio"), "a.ogg", "prev"))
+    assert result.text == "local text"
+    assert primary.calls == [(b"audio", "a.ogg", "prev")]
+    assert spare.calls == [(b"audio", "a.ogg", "prev")]
+
+
+def test_backend_must_implement_transcribe():
+    class Incomplete(tb.TranscriptionBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_backend_is_chosen_per_user(monkeypatch):
+    monkeypatch.setattr(tb, "TRANSCRIPTION_BACKEND_BY_USER", {1: "local", 2: "nonsense"})
+    assert tb.backend_for_user(1) == "local"
+    assert tb.backend_for_user(2) is None  # unknown name: deployment default
+    assert tb.backend_for_user(3) is None
+
+
+def test_job_backend_is_stored_with_the_job():
+    from types import SimpleNamespace
+
+    from src.services.db_service import TranscriptionJobRecord
+    from src.services.transcription_pipeline import TranscriptionJob
+
+    job = TranscriptionJob(
+        user_id=1, username="u", first_name="U", chat_id=10, status_message_id=7, file_id="f", file_unique_id="fu",
+        file_path=None, file_size=0, mime_type=None, duration=5.0, duration_exact=True, backend="local",
+    )
+    columns = job.queue_fields()
+    assert columns["backend"] == "local" and "backend" in TranscriptionJobRecord.__table__.columns
+    record = SimpleNamespace(user_id=1, id=3, attempts=0, result_text=None, result_status=None,
+                             result_trimmed_duration=None, result_segments=None, voice_message_id=None, **columns)
+    assert TranscriptionJob.from_record(record).backend == "local"
@@ -0,0 +1,101 @@
+"""
+Hot tier of the transcription cache, and its hits reaching Postgres so that TTL eviction
+keeps popular entries. The SQL test needs TEST_DATABASE_URL (skipped otherwise).
+"""
+import asyncio
+import hashlib
+import io
+
+from conftest import schema_engine
+from src.services import db_service
+from src.services.transcription_cache import CachedTranscription, LruCache, TranscriptionCache, sha256_of
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LruCache(2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1  # "b" is now the oldest
+    lru.put("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1 and lru.get("c") == 3
+    assert len(lru) == 2
+
+
+def test_zero_size_stores_nothing():
+    lru = LruCache(0)
+    lru.put("a", 1)
+    assert lru.get("a") is None
+
+
+def test_sha256_streams_and_rewinds():
+    data = b"voice" * 50000
+    buf = io.BytesIO(data)
+    buf.seek(123)
+    assert sha256_of(buf) == hashlib.sha256(data).hexdigest()
+    assert buf.tell() == 0
+
+
+def test_memory_hits_are_flushed_in_one_batch(monkeypatch):
+    written = []
+
+    async def touch(by_file_unique_id, by_sha256):
+        written.append((by_file_unique_id, by_sha256))
+        return len(by_file_unique_id) + len(by_sha256)
+
+    monkeypatch.setattr(db_service, "touch_cached_transcriptions", touch)
+    cache = TranscriptionCache(hot_entries=8, enabled=True)
+    cache._hot.put("file_unique_id:f", CachedTranscription("hi", 1.0))
+    cache._hot.put("sha256:s", CachedTranscription("hi", 1.0))
+
+    async def go():
+        for _ in range(3):
+            assert await cache.by_file_unique_id("f") is not None
+        assert await cache.by_sha256("s") is not None
+        assert await cache.flush_hits() == 2
+        assert await cache.flush_hits() == 0
+
+    asyncio.run(go())
+    assert written == [({"f": 3}, {"s": 1})]
+
+
+def test_failed_hit_flush_keeps_the_batch(monkeypatch):
+    async def touch(by_file_unique_id, by_sha256):
+        raise ConnectionError("db down")
+
+    monkeypatch.setattr(db_service, "touch_cached_transcriptions", touch)
+    cache = TranscriptionCache(hot_entries=8, enabled=True)
+    cache._hot.put("file_unique_id:f", CachedTranscription("hi", 1.0))
+
+    async def go():
+        await cache.by_file_unique_id("f")
+        assert await cache.flush_hits() == 0
+        await cache.by_file_unique_id("f")
+
+    asyncio.run(go())
+    assert cache._pending_hits == {("file_unique_id", "f"): 2}
+
+
+def test_eviction_keeps_entries_hot_in_memory(pg_schema, monkeypatch):
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    async def go():
+        engine = schema_engine(pg_schema)
+        monkeypatch.setattr(db_service, "async_session", async_sessionmaker(engine, expire_on_commit=False))
+        try:
+            await db_service.put_cached_transcription("hot", "h", "hot text", 1.0)
+            await db_service.put_cached_transcription("cold", "c", "cold text", 1.0)
+            cache = TranscriptionCache(hot_entries=8, enabled=True)
+            assert await cache.by_file_unique_id("hot") is not None  # from Postgres, now in memory
+            async with engine.begin() as conn:
+                await conn.execute(text("UPDATE transcription_cache SET last_hit_at = last_hit_at - interval '40 days'"))
+            assert await cache.by_file_unique_id("hot") is not None  # from memory only
+            assert await cache.evict() == 1
+            async with engine.connect() as conn:
+                rows = (await conn.execute(text("SELECT file_unique_id, hits FROM transcription_cache"))).all()
+            assert [tuple(r) for r in rows] == [("hot", 2)]
+        finally:
+            await engine.dispose()
+
+    asyncio.run(go())
@@ -0,0 +1,127 @@
+"""Delivery paths of the transcription pipeline, with the bot and the database replaced by fakes."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.services import transcription_pipeline as pipeline
+from src.services.job_queue import RetryLater
+
+
+class FakeBot:
+    def __init__(self, fail_documents: int = 0):
+        self.calls = []
+        self.fail_documents = fail_documents
+
+    async def send_document(self, chat_id, document, **kwargs):
+        if self.fail_documents:
+            self.fail_documents -= 1
+            raise ConnectionError("telegram unreachable")
+        self.calls.append(("document", chat_id, document))
+        return SimpleNamespace(document=SimpleNamespace(file_id=f"file-{len(self.calls)}"))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(("message", chat_id, text))
+
+    async def delete_message(self, chat_id, message_id):
+        self.calls.append(("delete", chat_id, message_id))
+
+
+class FakeDeliveries:
+    """claim/finish/release_transcription_delivery over an in-memory job table."""
+
+    def __init__(self, monkeypatch):
+        self.delivered = set()
+        self.delivering = set()
+        monkeypatch.setattr(pipeline, "claim_transcription_delivery", self.claim)
+        monkeypatch.setattr(pipeline, "finish_transcription_delivery", self.finish)
+        monkeypatch.setattr(pipeline, "release_transcription_delivery", self.release)
+
+    async def claim(self, job_id, lease_seconds):
+        if job_id in self.delivered:
+            return "delivered"
+        if job_id in self.delivering:
+            return "busy"
+        self.delivering.add(job_id)
+        return "claimed"
+
+    async def finish(self, job_ids):
+        self.delivering.difference_update(job_ids)
+        self.delivered.update(job_ids)
+
+    async def release(self, job_ids):
+        self.delivering.difference_update(job_ids)
+
+
+def _transcribed_job(**kwargs) -> "pipeline.TranscriptionJob":
+    """A job whose earlier attempt already transcribed and billed it: only delivery is left."""
+    fields = dict(
+        user_id=1, username="u", first_name="U", chat_id=10, status_message_id=7, file_id="f",
+        file_unique_id="fu", file_path=None, file_size=0, mime_type=None, duration=5.0, duration_exact=True,
+        id=3, attempts=1, result_text="hello", result_status="Сжатие", voice_message_id=9,
+    )
+    fields.update(kwargs)
+    return pipeline.TranscriptionJob(**fields)
+
+
+def test_failed_send_keeps_the_result_for_a_retry(monkeypatch):
+    deliveries = FakeDeliveries(monkeypatch)
+    bot = FakeBot(fail_documents=1)
+
+    async def go():
+        with pytest.raises(RetryLater) as retry:
+            await pipeline.run_transcription_job(bot, _transcribed_job(attempts=1))
+        assert retry.value.consume_attempt
+        assert not deliveries.delivered and not deliveries.delivering
+        await pipeline.run_transcription_job(bot, _transcribed_job(attempts=2))
+        # A third run (duplicate, e.g. after a lease expiry) sends nothing
+        await pipeline.run_transcription_job(bot, _transcribed_job(attempts=3))
+
+    asyncio.run(go())
+    assert deliveries.delivered == {3}
+    assert [c[0] for c in bot.calls].count("document") == 1
+
+
+def test_failed_album_send_releases_the_claim(monkeypatch):
+    deliveries = FakeDeliveries(monkeypatch)
+    records = [SimpleNamespace(id=i, batch_index=i, file_name=f"{i}.ogg", result_text=f"text {i}", error=None) for i in (1, 2)]
+
+    async def claim_transcription_batch(batch_id, lease_seconds):
+        if deliveries.delivered:
+            return "delivered", []
+        deliveries.delivering.update(r.id for r in records)
+        return "claimed", records
+
+    monkeypatch.setattr(pipeline, "claim_transcription_batch", claim_transcription_batch)
+    bot = FakeBot(fail_documents=1)
+    job = _transcribed_job(id=2, batch_id="b", batch_index=1, batch_size=2)
+
+    async def go():
+        with pytest.raises(RetryLater):
+            await pipeline.run_transcription_job(bot, job)
+        assert not deliveries.delivered and not deliveries.delivering
+        await pipeline.run_transcription_job(bot, job)
+
+    asyncio.run(go())
+    assert deliveries.delivered == {1, 2}
+    assert [c[0] for c in bot.calls].count("document") == 1
+
+
+def test_cached_transcript_file_is_not_sent_to_another_user(monkeypatch):
+    voice = SimpleNamespace(user_id=1, transcription_text="hello", transcription_segments=None, duration_seconds=1.0)
+
+    async def get_voice_message(voice_message_id):
+        return voice
+
+    monkeypatch.setattr(pipeline, "get_voice_message", get_voice_message)
+    monkeypatch.setattr(pipeline, "_rendered_files", pipeline.LruCache(8))
+    bot = FakeBot()
+
+    async def go():
+        assert await pipeline.send_transcript_file(bot, 10, 1, 5, "txt")
+        assert await pipeline.send_transcript_file(bot, 10, 1, 5, "txt")  # resent by file_id
+        assert not await pipeline.send_transcript_file(bot, 20, 2, 5, "txt")
+
+    asyncio.run(go())
+    assert [c[1] for c in bot.calls] == [10, 10]
+    assert bot.calls[1][2] == "file-1"
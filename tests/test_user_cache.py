@@ -0,0 +1,110 @@
+"""In-process user/balance cache: TTL, LRU, write-through races and change notifications."""
+import json
+
+from src.services.user_cache import CachedUser, UserCache
+
+
+def _user(user_id=1, balance=100.0, used_free=0.0, held=0.0, username="u"):
+    return CachedUser(user_id, username, "U", balance, used_free, held)
+
+
+def _cache(max_entries=10, ttl=60.0):
+    now = [0.0]
+    cache = UserCache(max_entries, ttl, clock=lambda: now[0])
+    cache.listening = True
+    return cache, now
+
+
+def _payload(user: CachedUser) -> str:
+    return json.dumps({
+        "id": user.id, "username": user.username, "first_name": user.first_name,
+        "balance_seconds": user.balance_seconds, "used_free_seconds": user.used_free_seconds,
+        "held_seconds": user.held_seconds,
+    })
+
+
+def test_put_then_get():
+    cache, _ = _cache()
+    cache.put(_user(), cache.begin())
+    assert cache.get(1) == _user()
+    assert cache.get(2) is None
+
+
+def test_entries_expire():
+    cache, now = _cache(ttl=60)
+    cache.put(_user(), cache.begin())
+    now[0] = 61
+    assert cache.get(1) is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_goes_first():
+    cache, _ = _cache(max_entries=2)
+    cache.put(_user(1), cache.begin())
+    cache.put(_user(2), cache.begin())
+    cache.get(1)
+    cache.put(_user(3), cache.begin())
+    assert cache.get(2) is None
+    assert cache.get(1) is not None and cache.get(3) is not None
+
+
+def test_off_without_listener():
+    cache, _ = _cache()
+    cache.listening = False
+    cache.put(_user(), cache.begin())
+    assert cache.get(1) is None
+
+
+def test_older_write_does_not_overwrite_newer():
+    cache, _ = _cache()
+    first = cache.begin()  # transaction A starts
+    second = cache.begin()  # transaction B starts, commits and writes through first
+    cache.put(_user(balance=50.0), second)
+    cache.put(_user(balance=80.0), first)  # A's row may be older than B's: dropped
+    assert cache.get(1) is None
+
+
+def test_read_racing_a_remote_change_is_dropped():
+    cache, _ = _cache()
+    since = cache.begin()  # a miss reads the row...
+    cache.on_change(_payload(_user(balance=10.0)))  # ...while another process changes it
+    cache.put(_user(balance=100.0), since)
+    assert cache.get(1) is None
+
+
+def test_own_notification_keeps_the_entry():
+    cache, _ = _cache()
+    cache.put(_user(balance=40.0), cache.begin())
+    cache.on_change(_payload(_user(balance=40.0)))
+    assert cache.get(1) == _user(balance=40.0)
+
+
+def test_remote_change_drops_the_entry():
+    cache, _ = _cache()
+    cache.put(_user(balance=40.0), cache.begin())
+    cache.on_change(_payload(_user(balance=10.0)))
+    assert cache.get(1) is None
+    cache.put(_user(), cache.begin())
+    cache.on_change(json.dumps({"id": 1}))  # deleted
+    assert cache.get(1) is None
+
+
+def test_bad_notification_clears_everything():
+    cache, _ = _cache()
+    since = cache.begin()
+    cache.put(_user(1), cache.begin())
+    cache.on_change("not json")
+    assert cache.get(1) is None
+    cache.put(_user(2), since)  # began before the clear
+    assert cache.get(2) is None
+
+
+def test_change_log_pruning_keeps_races_safe():
+    cache, _ = _cache(max_entries=1)
+    since = cache.begin()
+    for user_id in range(2, 5000):
+        cache.invalidate(user_id)
+    cache.put(_user(1), since)  # its change record may have been pruned: treated as changed
+    assert cache.get(1) is None
+    cache.put(_user(1), cache.begin())
+    assert cache.get(1) == _user(1)
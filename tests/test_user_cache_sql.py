@@ -0,0 +1,46 @@
+"""
+The users trigger behind the user cache: balance and name changes are announced on
+user_changed with the new row, activity touches are not. Needs TEST_DATABASE_URL (skipped otherwise).
+"""
+import asyncio
+import json
+
+from conftest import schema_engine
+
+USER_ID = 1
+
+
+def test_users_trigger_announces_cached_columns_only(pg_schema):
+    from sqlalchemy import text
+
+    from src.services.user_cache import CHANNEL, CachedUser
+
+    async def go():
+        engine = schema_engine(pg_schema)
+        received = []
+        try:
+            async with engine.connect() as listen_conn:
+                raw = (await listen_conn.get_raw_connection()).driver_connection
+                await raw.add_listener(CHANNEL, lambda _c, _pid, _ch, payload: received.append(json.loads(payload)))
+                async with engine.begin() as conn:
+                    await conn.execute(text(
+                        "INSERT INTO users (id, username, created_at, last_activity_at, balance_seconds, used_free_seconds, held_seconds) "
+                        f"VALUES ({USER_ID}, 'u', now(), now(), 0, 0, 0)"
+                    ))
+                async with engine.begin() as conn:
+                    await conn.execute(text(f"UPDATE users SET last_activity_at = now() WHERE id = {USER_ID}"))
+                async with engine.begin() as conn:
+                    await conn.execute(text(f"UPDATE users SET balance_seconds = 90.5 WHERE id = {USER_ID}"))
+                async with engine.begin() as conn:
+                    await conn.execute(text(f"DELETE FROM users WHERE id = {USER_ID}"))
+                for _ in range(50):
+                    if len(received) >= 2:
+                        break
+                    await asyncio.sleep(0.05)
+        finally:
+            await engine.dispose()
+        assert len(received) == 2
+        assert CachedUser.from_notification(received[0]) == CachedUser(USER_ID, "u", None, 90.5, 0.0, 0.0)
+        assert received[1] == {"id": USER_ID}
+
+    asyncio.run(go())
@@ -0,0 +1,129 @@
+"""
+The users touch: one upsert that writes only on a change, and bulk activity flushes.
+The database test needs TEST_DATABASE_URL (skipped otherwise).
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects import postgresql
+
+from conftest import schema_engine
+from src.services import db_service
+
+NOW = datetime(2024, 5, 20, 12, 0, 0)
+
+
+def _sql(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+def test_touch_writes_only_on_change():
+    sql = _sql(db_service.touch_user_statement(1, "u", "U", NOW))
+    assert "ON CONFLICT (id) DO UPDATE" in sql
+    where = sql.split("WHERE", 1)[1]
+    assert "users.username IS DISTINCT FROM excluded.username" in where
+    assert "users.first_name IS DISTINCT FROM excluded.first_name" in where
+    assert "users.last_activity_at < excluded.last_activity_at -" in where
+
+
+def test_missing_names_are_stored_empty():
+    params = db_service.touch_user_statement(1, None, None, NOW).compile(dialect=postgresql.dialect()).params
+    assert (params["username"], params["first_name"]) == ("", "")
+
+
+def test_cached_user_without_names_is_not_rewritten(monkeypatch):
+    from src.services.user_cache import CachedUser, UserCache
+
+    cache = UserCache()
+    cache.listening = True
+    cache.put(CachedUser(1, "", "", 0.0, 0.0, 0.0), cache.begin())
+    monkeypatch.setattr(db_service, "user_cache", cache)
+    monkeypatch.setattr(db_service, "_pending_activity", {})
+    monkeypatch.setattr(db_service, "async_session", None)  # a database call would fail
+    asyncio.run(db_service.get_or_create_user(1, None, None))
+    assert 1 in db_service._pending_activity
+
+
+def test_note_activity_keeps_the_latest(monkeypatch):
+    monkeypatch.setattr(db_service, "_pending_activity", {})
+    db_service.note_activity(1, NOW)
+    db_service.note_activity(1, NOW - timedelta(minutes=1))
+    db_service.note_activity(2, NOW)
+    db_service.note_activity(1, NOW + timedelta(minutes=1))
+    assert db_service._pending_activity == {1: NOW + timedelta(minutes=1), 2: NOW}
+
+
+def test_flush_is_one_statement():
+    sql = _sql(db_service.activity_flush_statement({2: NOW, 1: NOW}))
+    assert sql.startswith("UPDATE users SET last_activity_at=activity.at FROM (VALUES")
+    assert "users.last_activity_at < activity.at -" in sql
+
+
+def test_failed_flush_keeps_the_batch(monkeypatch):
+    class Broken:
+        async def __aenter__(self):
+            raise OSError("connection refused")
+
+        async def __aexit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(db_service, "_pending_activity", {1: NOW})
+    monkeypatch.setattr(db_service, "async_session", Broken)
+    assert asyncio.run(db_service.flush_user_activity()) == 0
+    assert db_service._pending_activity == {1: NOW}
+
+
+def test_touch_and_flush_skip_unchanged_rows(pg_schema, monkeypatch):
+    from sqlalchemy import text
+
+    async def go():
+        engine = schema_engine(pg_schema)
+
+        async def version():
+            async with engine.connect() as conn:
+                return (await conn.execute(text("SELECT xmin::text, last_activity_at FROM users WHERE id = 1"))).one()
+
+        try:
+            async with engine.begin() as conn:
+                assert (await conn.execute(db_service.touch_user_statement(1, "u", "U", NOW))).first() is not None
+            created = await version()
+            async with engine.begin() as conn:
+                # Same name, activity within the granularity: no new row version
+                assert (await conn.execute(db_service.touch_user_statement(1, "u", "U", NOW + timedelta(seconds=10)))).first() is None
+                await conn.execute(db_service.activity_flush_statement({1: NOW + timedelta(seconds=20)}))
+            assert await version() == created
+            async with engine.begin() as conn:
+                assert (await conn.execute(db_service.touch_user_statement(1, "new", "U", NOW + timedelta(seconds=30)))).first() is not None
+                await conn.execute(db_service.activity_flush_statement({1: NOW + timedelta(hours=1)}))
+            assert (await version())[1] == NOW + timedelta(hours=1)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(go())
+
+
+def test_missing_names_stay_stable_after_billing(pg_schema, monkeypatch):
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    async def go():
+        engine = schema_engine(pg_schema)
+        monkeypatch.setattr(db_service, "async_session", async_sessionmaker(engine, expire_on_commit=False))
+
+        async def row():
+            async with engine.connect() as conn:
+                return (await conn.execute(text("SELECT xmin::text, username, first_name FROM users WHERE id = 1"))).one()
+
+        try:
+            assert await db_service.record_transcription(1, None, None, 10.0, 5, 1.0, "ok", "hello") is not None
+            billed = await row()
+            assert billed[1:] == ("", "")
+            async with engine.begin() as conn:
+                # Same (missing) names, activity within the granularity: the touch writes nothing
+                touched = await conn.execute(db_service.touch_user_statement(1, None, None, db_service.utc_now()))
+                assert touched.first() is None
+            assert await row() == billed
+        finally:
+            await engine.dispose()
+
+    asyncio.run(go())
@@ -0,0 +1,63 @@
+"""Energy VAD on synthetic PCM."""
+import numpy as np
+
+from src.services.vad import (
+    RmsAccumulator,
+    aselect_filter,
+    detect_speech,
+    merge_spans,
+    speech_seconds,
+    trimmed_boundaries,
+)
+
+SR = 16000
+
+
+def _pcm(*parts):
+    """parts: (seconds, amplitude) -> s16le bytes; tone for amplitude > 0, faint noise otherwise."""
+    rng = np.random.default_rng(0)
+    chunks = []
+    for seconds, amp in parts:
+        n = int(seconds * SR)
+        if amp:
+            chunk = amp * np.sin(2 * np.pi * 220 * np.arange(n) / SR)
+        else:
+            chunk = rng.normal(0, 30, n)
+        chunks.append(chunk)
+    return np.concatenate(chunks).astype("<i2").tobytes()
+
+
+def _spans(pcm, chunk=7777):
+    acc = RmsAccumulator()
+    for i in range(0, len(pcm), chunk):
+        acc.feed(pcm[i:i + chunk])
+    return detect_speech(acc.result(), acc.frame_seconds)
+
+
+def test_finds_speech_between_long_silences():
+    spans = _spans(_pcm((3, 0), (2, 8000), (5, 0), (1, 8000), (3, 0)))
+    assert len(spans) == 2
+    (s1, e1), (s2, e2) = spans
+    assert abs(s1 - 3) < 0.15 and abs(e1 - 5) < 0.4
+    assert abs(s2 - 10) < 0.15 and abs(e2 - 11) < 0.4
+
+
+def test_short_pause_is_not_cut():
+    spans = _spans(_pcm((1, 0), (2, 8000), (0.5, 0), (2, 8000), (1, 0)))
+    assert len(spans) == 1
+
+
+def test_continuous_speech_is_kept_whole():
+    spans = _spans(_pcm((10, 8000)))
+    assert len(spans) == 1 and speech_seconds(spans) > 9.9
+
+
+def test_merge_to_max_spans_keeps_widest_gaps():
+    spans = [(0, 1), (2, 3), (10, 11), (11.5, 12)]
+    assert merge_spans(spans, 0.1, max_spans=2) == [(0, 3), (10, 12)]
+
+
+def test_trimmed_boundaries_and_filter():
+    spans = [(1.0, 3.0), (5.0, 6.5), (8.0, 9.0)]
+    assert trimmed_boundaries(spans) == [2.0, 3.5]
+    assert aselect_filter(spans[:1]) == "aselect='between(t,1.000,3.000)',asetpts=N/SR/TB"
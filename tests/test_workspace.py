@@ -0,0 +1,78 @@
+"""Per-job scratch directories, the byte quota and orphan sweeping."""
+import asyncio
+import os
+import time
+
+from src.services.workspace import Workspace
+
+
+def test_job_directories_are_unique_and_removed_on_release(tmp_path):
+    async def go():
+        ws = Workspace(str(tmp_path), quota_bytes=100)
+        a = await ws.acquire("job1", 10)
+        b = await ws.acquire("job1", 10)
+        assert a.path != b.path and os.path.isdir(a.path)
+        with a.spool(max_size=4) as f:
+            f.write(b"spilled to disk")
+            assert f._rolled  # now a file in the job's directory (unnamed where O_TMPFILE exists)
+        await a.release()
+        await a.release()  # idempotent
+        assert not os.path.exists(a.path)
+        assert ws.reserved == 10
+        await b.release()
+        assert ws.reserved == 0
+
+    asyncio.run(go())
+
+
+def test_quota_makes_jobs_wait_but_never_blocks_a_lone_big_file(tmp_path):
+    async def go():
+        ws = Workspace(str(tmp_path), quota_bytes=100)
+        big = await ws.acquire("big", 500)  # alone: admitted despite the quota
+        waiter = asyncio.ensure_future(ws.acquire("next", 50))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        await big.release()
+        space = await asyncio.wait_for(waiter, 1)
+        assert ws.reserved == 50
+        await space.release()
+
+    asyncio.run(go())
+
+
+def test_sweep_removes_dead_and_stale_directories_only(tmp_path):
+    async def go():
+        ws = Workspace(str(tmp_path), quota_bytes=100, orphan_seconds=60)
+        live = await ws.acquire("live", 1)
+        earlier_run = tmp_path / f"old-1234abcd@{ws.owner}"
+        earlier_run.mkdir()
+        other_host = tmp_path / "x-1234abcd@elsewhere:1"
+        other_host.mkdir()
+        stale = tmp_path / "y-1234abcd@elsewhere:2"
+        stale.mkdir()
+        old = time.time() - 3600
+        os.utime(stale, (old, old))
+
+        assert ws.sweep() == 2
+        left = sorted(name for name in os.listdir(tmp_path) if not name.startswith("."))  # not the quota lock
+        assert left == sorted([os.path.basename(live.path), other_host.name])
+        await live.release()
+
+    asyncio.run(go())
+
+
+def test_quota_is_shared_by_processes_on_one_directory(tmp_path):
+    async def go():
+        bot, worker = Workspace(str(tmp_path), quota_bytes=100), Workspace(str(tmp_path), quota_bytes=100)
+        worker.owner = "worker-host:1"  # another container on the same directory
+        held = await worker.acquire("job", 80)
+        waiter = asyncio.ensure_future(bot.acquire("feedback", 50))
+        await asyncio.sleep(0.05)
+        assert not waiter.done() and bot.reserved_total() == 80
+        await held.release()  # the bot learns of it by polling
+        space = await asyncio.wait_for(waiter, 3)
+        assert bot.reserved_total() == 50 and worker.reserved == 0
+        await space.release()
+        assert bot.reserved_total() == 0
+
+    asyncio.run(go())